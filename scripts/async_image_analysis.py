@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from context_manager import ContextManager, resolve_repeats
+from metrics import inc, observe, span
+from response_cache import ResponseCache
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+DEFAULT_MODEL = "google/gemini-2.0-flash-thinking-exp:free"
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors.
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error):
+    import openai
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, asyncio.TimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def record_usage(usage):
+    """Add a completion's token usage to the metrics."""
+    if usage is None:
+        return
+    inc("llm_prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    inc("llm_completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+
+def retry_after(error):
+    """Seconds requested by a Retry-After header, if the error carries one."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+async def wait_event(event, interval=0.05):
+    """Return once a threading.Event is set; polls, so no thread is tied up waiting."""
+    while not event.is_set():
+        await asyncio.sleep(interval)
+
+
+class TokenBucket:
+    """Allows ``rate`` requests per second on average, with bursts of up to ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class EventLoopThread:
+    """A private asyncio loop on a daemon thread, used to drive async code from sync callers."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="llm-event-loop", daemon=True)
+        self.thread.start()
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block until it finishes."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+
+class AsyncImageAnalysisService:
+    """
+    Async client for the chat completions API.
+
+    All requests share one client and its HTTP connection pool. At most
+    ``max_concurrency`` requests are in flight, and a token bucket limits the
+    request rate.
+    Retryable failures (connection errors, timeouts, 429 and 5xx) are retried
+    with exponential backoff and full jitter, honouring Retry-After.
+
+    Args:
+        api_key (str): API key for the endpoint.
+        base_url (str): OpenAI-compatible endpoint.
+        max_concurrency (int): Maximum simultaneous requests.
+        requests_per_second (float): Average request rate allowed by the token bucket.
+        burst (int): Token bucket capacity.
+        max_retries (int): Retries after the first attempt for retryable errors.
+        backoff_base (float): First backoff delay in seconds; doubles on each retry.
+        backoff_max (float): Upper bound for a single backoff delay.
+        timeout (float): Per-request timeout in seconds.
+        blob_store (BlobStore): Resolves "blob:" image references into data URIs
+            just before each request is sent.
+    """
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, model=DEFAULT_MODEL,
+                 max_concurrency=4, requests_per_second=2.0, burst=4, max_retries=4,
+                 backoff_base=1.0, backoff_max=30.0, timeout=120.0,
+                 context_manager=None, response_cache=None, blob_store=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.context_manager = context_manager or ContextManager()
+        self.response_cache = response_cache or ResponseCache(mode="off")
+        self.blob_store = blob_store
+        self._requests_per_second = requests_per_second
+        self._burst = burst
+        self._client = None
+        self._semaphore = None
+        self._bucket = None
+
+    def _get_client(self):
+        # Created on first use so the pool and primitives belong to the running loop.
+        # One AsyncOpenAI instance owns one pooled HTTP client, so connections are
+        # reused across requests; the semaphore bounds how many requests (including
+        # streams, until they are closed) are in flight at once.
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key,
+                                       timeout=self.timeout, max_retries=0)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._bucket = TokenBucket(self._requests_per_second, self._burst)
+        return self._client
+
+    async def _backoff(self, attempt, error):
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        inc("api_retries")
+        logging.warning("Retryable API error (%s); retry %d/%d in %.1fs", error, attempt + 1, self.max_retries, delay)
+        await asyncio.sleep(delay)
+
+    async def create_completion(self, **kwargs):
+        """chat.completions.create with concurrency limiting, rate limiting, timeout and retries."""
+        self._get_client()
+        async with self._semaphore:
+            return await self._create(**kwargs)
+
+    async def _create(self, **kwargs):
+        """create_completion for a caller already holding the semaphore."""
+        client = self._get_client()
+        if "messages" in kwargs:
+            # Repeated images become notes only if their original is in this very request
+            kwargs["messages"] = resolve_repeats(kwargs["messages"])
+        if self.blob_store is not None and "messages" in kwargs:
+            # Base64 copies exist only while this request is in flight
+            kwargs["messages"] = await asyncio.to_thread(self.blob_store.resolve, kwargs["messages"])
+        attempt = 0
+        while True:
+            await self._bucket.acquire()
+            try:
+                # For streams this covers the time until the response starts
+                with span("api_request", stream=bool(kwargs.get("stream"))):
+                    return await asyncio.wait_for(client.chat.completions.create(**kwargs), self.timeout)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                await self._backoff(attempt, e)
+                attempt += 1
+
+    async def complete(self, messages):
+        """
+        Send messages and return the response text, or an "Error: ..." string.
+
+        Args:
+            messages (list): Messages exactly as they should be sent.
+
+        Returns:
+            str: Assistant's response.
+        """
+        try:
+            cached = self.response_cache.get(self.model, messages)
+            if cached is not None:
+                inc("response_cache_hits")
+                return cached
+            completion = await self.create_completion(model=self.model, messages=messages)
+            # Lazy formatting: the completion is only rendered when DEBUG is on
+            logging.debug("Completion response: %s", completion)
+            record_usage(getattr(completion, "usage", None))
+            if not completion.choices:
+                return "Error: Empty response from API"
+            first_choice = completion.choices[0]
+            if not first_choice.message or not first_choice.message.content:
+                return "Error: Malformed API response"
+            self.response_cache.put(self.model, messages, first_choice.message.content)
+            return first_choice.message.content
+        except Exception as e:
+            logging.error(f"Error during request: {str(e)}")
+            return f"Error: {str(e)}"
+
+    async def analyze_images(self, base64_images, prompt_text=None):
+        """
+        Analyze one or multiple images in a single API request.
+
+        Args:
+            base64_images (list): List of Base64-encoded image strings.
+            prompt_text (str): Prompt to send; defaults to asking what is in the image(s).
+
+        Returns:
+            str: Combined response for all images.
+        """
+        if prompt_text is None:
+            prompt_text = "What's in this image?" if len(base64_images) == 1 else "What's in these images?"
+        parts = [{"type": "image_url", "image_url": {"url": image}} for image in base64_images]
+        logging.debug("Sending batch message with %d images", len(base64_images))
+        return await self.analyze_content(parts, prompt_text)
+
+    async def analyze_content(self, parts, prompt_text):
+        """
+        Send a prompt followed by arbitrary content parts (page text and/or images) in one request.
+
+        Args:
+            parts (list): Chat content parts, e.g. from page_content.content_parts.
+            prompt_text (str): Prompt placed before the parts.
+
+        Returns:
+            str: Assistant's response.
+        """
+        content = [{"type": "text", "text": prompt_text}] + list(parts)
+        return await self.complete([{"role": "user", "content": content}])
+
+    async def chat_message(self, conversation_history):
+        """
+        Send a conversation chain to the API and return the assistant's response.
+
+        Args:
+            conversation_history (list): List of messages (dict) in the conversation.
+
+        Returns:
+            str: Assistant's response.
+        """
+        return await self.complete(self.context_manager.prepare(conversation_history))
+
+    async def stream_chat_message(self, conversation_history, cancel_event=None):
+        """
+        Send a conversation chain in streaming mode.
+
+        Retries only happen before the first token; once text has been
+        delivered, an error is raised to the caller. The stream holds one of
+        the ``max_concurrency`` slots until it is closed.
+
+        Args:
+            conversation_history (list): List of messages (dict) in the conversation.
+            cancel_event (threading.Event): When set, the stream is closed and iteration
+                stops, even while waiting for the next chunk.
+
+        Yields:
+            str: Pieces of the assistant's response as they arrive.
+        """
+        messages = self.context_manager.prepare(conversation_history)
+        cached = self.response_cache.get(self.model, messages)
+        if cached is not None:
+            inc("response_cache_hits")
+            yield cached
+            return
+
+        logging.debug("Streaming conversation history to API.")
+        self._get_client()
+        async with self._semaphore:
+            stream = await self._create(model=self.model, messages=messages, stream=True,
+                                        stream_options={"include_usage": True})
+            chunks = stream.__aiter__()
+            cancelled = asyncio.ensure_future(wait_event(cancel_event)) if cancel_event is not None else None
+            parts = []
+            read = None
+            started = time.perf_counter()
+            try:
+                while True:
+                    # Each read races the cancel event, so a stalled stream can still be stopped
+                    read = asyncio.ensure_future(chunks.__anext__())
+                    if cancelled is not None:
+                        await asyncio.wait((read, cancelled), return_when=asyncio.FIRST_COMPLETED)
+                        if cancelled.done():
+                            read.cancel()
+                            await asyncio.gather(read, return_exceptions=True)
+                            logging.info("Chat generation cancelled")
+                            break
+                    try:
+                        chunk = await read
+                    except StopAsyncIteration:
+                        # Only complete generations are worth replaying.
+                        if parts:
+                            self.response_cache.put(self.model, messages, "".join(parts))
+                        break
+                    # With include_usage the last chunk carries the usage and no choices
+                    record_usage(getattr(chunk, "usage", None))
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta and delta.content:
+                        parts.append(delta.content)
+                        yield delta.content
+            finally:
+                for future in (read, cancelled):
+                    if future is not None and not future.done():
+                        future.cancel()
+                observe("api_stream_seconds", time.perf_counter() - started)
+                # Closing the response aborts the generation on the server side.
+                await stream.close()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
@@ -0,0 +1,228 @@
+"""
+Headless batch pre-processing of whole textbooks.
+
+Splits each book into chapters with the same logic as the viewer, renders and
+encodes every chapter in parallel (warming the disk cache), and optionally
+sends each chapter to the model. Chapters longer than --max-chapter-pages are
+summarised window by window and merged (see chunked_analysis.py). One JSON
+line is written per chapter:
+
+    python scripts/batch_cli.py book.pdf other.pdf -o chapters.jsonl --analyze
+
+A book that cannot be opened or indexed is logged and recorded with an
+"error" line, and the remaining books are still processed; the exit status
+is then 1.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import load_config
+from disk_cache import DiskCache, document_digest
+from document import open_document, get_chapter_info
+from encoding import EncodingSettings
+from extraction import ExtractionEngine
+from page_content import TextLayerSettings, PageDeduplicator, content_parts
+from page_hash import DedupSettings
+from metrics import registry, SessionProfiler
+from prompts import chapter_summary_prompt
+
+
+class BatchProcessor:
+    """
+    Processes every chapter of a list of books and appends results to a JSONL file.
+
+    Args:
+        engine (ExtractionEngine): Shared render/encode pool (with its disk cache).
+        output (file): Open text file receiving one JSON object per chapter.
+        service (AsyncImageAnalysisService): If given, each chapter is analysed.
+        prompt (str): Prompt sent with each chapter's pages.
+        max_chapter_pages (int): Chapters longer than this are recorded as skipped,
+            unless they are analysed in windows.
+        parallel_chapters (int): Chapters extracted at the same time.
+        analyzer (ChunkedAnalyzer): Map-reduce analysis for chapters longer than max_chapter_pages.
+        dedup (DedupSettings): Blank and repeated page filtering, applied per chapter.
+    """
+
+    def __init__(self, engine, output, service=None, prompt=chapter_summary_prompt,
+                 max_chapter_pages=100, parallel_chapters=2, analyzer=None, dedup=None):
+        self.engine = engine
+        self.output = output
+        self.service = service
+        self.analyzer = analyzer
+        self.prompt = prompt
+        self.max_chapter_pages = max_chapter_pages
+        self.dedup = dedup or DedupSettings()
+        self.threads = ThreadPoolExecutor(max_workers=parallel_chapters, thread_name_prefix="batch-extract")
+
+    def write(self, record):
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+
+    async def process_book(self, path):
+        started = time.perf_counter()
+        digest = document_digest(path, self.engine.cache)
+        doc = open_document(path)
+        try:
+            chapters = get_chapter_info(doc, digest)
+            page_count = len(doc)
+        finally:
+            doc.close()
+        toc_seconds = time.perf_counter() - started
+        logging.info(f"{os.path.basename(path)}: {page_count} pages, {len(chapters)} chapters")
+
+        await asyncio.gather(*(
+            self.process_chapter(path, digest, index, chapter, toc_seconds)
+            for index, chapter in enumerate(chapters)
+        ))
+        logging.info(f"{os.path.basename(path)} done in {time.perf_counter() - started:.1f}s")
+
+    async def process_chapter(self, path, digest, index, chapter, toc_seconds):
+        record = {
+            'book': os.path.abspath(path),
+            'digest': digest,
+            'chapter': index,
+            'title': chapter['title'],
+            'start': chapter['start'] + 1,
+            'end': chapter['end'] + 1,
+            'toc_seconds': round(toc_seconds, 4),
+        }
+        page_count = chapter['end'] - chapter['start'] + 1
+        chunked = self.service is not None and self.analyzer is not None and self.analyzer.needs_chunking(page_count)
+        max_pages = self.analyzer.max_chapter_pages if chunked else self.max_chapter_pages
+        if page_count > max_pages:
+            record['skipped'] = f"Chapter too large ({page_count} pages). Max allowed: {max_pages}"
+            self.write(record)
+            return
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            images = await loop.run_in_executor(
+                self.threads, self.engine.extract_sync,
+                path, range(chapter['start'], chapter['end'] + 1), digest,
+                self.analyzer.window_images if chunked else None
+            )
+        except Exception as e:
+            logging.error(f"Extraction error in {chapter['title']}: {str(e)}")
+            record['error'] = str(e)
+            self.write(record)
+            return
+        record['extract_seconds'] = round(time.perf_counter() - started, 4)
+        record['pages'] = len(images)
+        images, skipped = PageDeduplicator(self.dedup).filter(images)
+        record['skipped_pages'] = skipped['blank']
+        record['skipped_bytes'] = skipped['bytes_skipped']
+        record['repeated_images'] = skipped['repeated']
+        record['repeated_bytes'] = skipped['repeated_bytes']
+        record['bytes'] = sum(img.size for img in images)
+        kinds = [getattr(img, 'kind', 'image') for img in images]
+        record['text_pages'] = kinds.count('text') + kinds.count('mixed')
+
+        if self.service is not None and not images:
+            record['skipped'] = "Every page is blank"
+        elif self.service is not None:
+            started = time.perf_counter()
+            if chunked:
+                record['response'] = await self.analyzer.analyze(
+                    [content_parts(img) for img in images], [img.size for img in images],
+                    chapter['title'], chapter['start'] + 1)
+                record['chunked'] = True
+            else:
+                parts = [part for img in images for part in content_parts(img)]
+                record['response'] = await self.service.analyze_content(parts, self.prompt)
+            record['analyze_seconds'] = round(time.perf_counter() - started, 4)
+
+        logging.info(f"Chapter {index}: {chapter['title']} ({record['pages']} pages, "
+                     f"{record['bytes'] / 1024:.0f} KB, {record['extract_seconds']:.2f}s)")
+        self.write(record)
+
+
+async def run(args):
+    config = load_config(args.config)
+    cache = DiskCache(config.get("CACHE_DIR"), config.get("DISK_CACHE_BYTES", 2 * 1024 * 1024 * 1024))
+    settings = EncodingSettings.from_dict(config.get("ENCODING"))
+    text_layer = None if args.images_only else TextLayerSettings.from_dict(config.get("TEXT_LAYER"))
+    engine = ExtractionEngine(args.workers, args.zoom, settings, cache, text_layer)
+
+    service = None
+    analyzer = None
+    if args.analyze:
+        # Only needed when talking to the model
+        from async_image_analysis import AsyncImageAnalysisService, DEFAULT_BASE_URL
+        from chunked_analysis import ChunkedAnalyzer
+        from response_cache import ResponseCache
+        response_cache = ResponseCache.from_dict(config.get("RESPONSE_CACHE"))
+        client_options = dict(config.get("CLIENT", {}))
+        client_options.setdefault("max_concurrency", args.concurrency)
+        service = AsyncImageAnalysisService(
+            config.get("OPENROUTER_API_KEY") or "replay",
+            config.get("OPENROUTER_BASE_URL", DEFAULT_BASE_URL),
+            response_cache=response_cache,
+            **client_options
+        )
+        analyzer = ChunkedAnalyzer.from_dict(service, config.get("CHUNKED_ANALYSIS"))
+        analyzer.single_request_pages = args.max_chapter_pages
+
+    with open(args.output, "a", encoding="utf-8") as output:
+        processor = BatchProcessor(engine, output, service, max_chapter_pages=args.max_chapter_pages,
+                                   analyzer=analyzer, dedup=DedupSettings.from_dict(config.get("DEDUP")))
+        failed = []
+        try:
+            for path in args.books:
+                try:
+                    await processor.process_book(path)
+                except Exception as e:
+                    logging.error(f"Could not process {path}: {str(e)}")
+                    processor.write({'book': os.path.abspath(path), 'error': str(e)})
+                    failed.append(path)
+        finally:
+            engine.shutdown()
+            if service is not None:
+                await service.aclose()
+
+    stats = cache.stats()
+    logging.info(f"Disk cache: {stats['hits']} hits, {stats['misses']} misses, "
+                 f"{stats['bytes_saved'] / 2**20:.1f} MB served from cache")
+    if failed:
+        logging.error(f"{len(failed)} of {len(args.books)} books failed: {', '.join(failed)}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-process textbooks chapter by chapter without the GUI")
+    parser.add_argument("books", nargs="+", help="PDF files to process")
+    parser.add_argument("-o", "--output", default="chapters.jsonl", help="JSONL file to append results to")
+    parser.add_argument("--config", default="scripts/config.json")
+    parser.add_argument("--workers", type=int, default=None, help="Render/encode processes (default: CPUs - 1)")
+    parser.add_argument("--zoom", type=float, default=2.0)
+    parser.add_argument("--analyze", action="store_true", help="Send each chapter to the model")
+    parser.add_argument("--concurrency", type=int, default=4, help="Simultaneous model requests")
+    parser.add_argument("--max-chapter-pages", type=int, default=100)
+    parser.add_argument("--images-only", action="store_true", help="Send every page as an image, never as text")
+    parser.add_argument("--metrics", help="Write metrics here when done (.prom for Prometheus text, else JSON)")
+    parser.add_argument("--profile", metavar="DIR", help="Record cProfile and tracemalloc output into DIR")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    profiler = SessionProfiler(args.profile) if args.profile else None
+    if profiler:
+        profiler.start()
+    try:
+        failed = asyncio.run(run(args))
+    finally:
+        if profiler:
+            profiler.stop()
+        if args.metrics:
+            registry().export(args.metrics)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Benchmarks on synthetic textbooks, written to JSON for comparison between commits.
+
+Books are generated with synthetic_pdf.py for every combination of page
+count, TOC depth and figure density. For each book the suite measures:
+
+- chapter detection (get_chapter_info)
+- page render latency at several zooms, full page and viewport tiles
+- chapter extraction throughput, images only and with the text layer
+- encoding time and payload size per format
+- end-to-end context building plus chat_message / streaming latency
+  against the local stub server
+
+    python scripts/bench_suite.py --json bench.json
+    python scripts/bench_suite.py --pages 50 400 --toc-depth 1 3 --compare bench.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+from document import Document, open_document, get_chapter_info
+from encoding import EncodingSettings, encode_image
+from extraction import ExtractionEngine
+from page_content import TextLayerSettings, content_parts
+from rendering import render_pixmap, pixmap_to_image
+from synthetic_pdf import make_textbook
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def summarize(samples):
+    """Seconds -> milliseconds summary of repeated timings."""
+    ordered = sorted(samples)
+    return {
+        'n': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+    }
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples), result
+
+
+def bench_toc(path, repeat):
+    doc = open_document(path)
+    try:
+        # No digest, so the TOC index cache is bypassed and every run parses the TOC
+        stats, chapters = timed(lambda: get_chapter_info(doc), repeat)
+    finally:
+        doc.close()
+    stats['chapters'] = len(chapters)
+    return stats
+
+
+def bench_render(path, zooms, pages, viewport):
+    document = Document(path)
+    results = {}
+    try:
+        for zoom in zooms:
+            full = summarize([_time(lambda: document.render_image(p, zoom)) for p in pages])
+            tile_size = 512
+            columns = -(-min(viewport[0], int(document.page_size(0)[0] * zoom)) // tile_size)
+            rows = -(-min(viewport[1], int(document.page_size(0)[1] * zoom)) // tile_size)
+            tiles = summarize([
+                _time(lambda: [document.render_tile(p, zoom, c, r, tile_size)
+                               for c in range(columns) for r in range(rows)])
+                for p in pages
+            ])
+            results[str(zoom)] = {'full_page': full, 'viewport_tiles': tiles}
+    finally:
+        document.close()
+    return results
+
+
+def _time(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def bench_extraction(path, pages, workers, zoom):
+    results = {}
+    for name, text_layer in (('images_only', None), ('text_layer', TextLayerSettings())):
+        engine = ExtractionEngine(workers, zoom, EncodingSettings(), text_layer=text_layer)
+        try:
+            engine.extract_sync(path, pages[:1])  # Start the worker processes
+            started = time.perf_counter()
+            items = engine.extract_sync(path, pages)
+            seconds = time.perf_counter() - started
+        finally:
+            engine.shutdown()
+        results[name] = {
+            'pages': len(items),
+            'seconds': round(seconds, 4),
+            'pages_per_second': round(len(items) / seconds, 2) if seconds else None,
+            'bytes': sum(item.size for item in items),
+        }
+    return results
+
+
+def bench_encoding(path, pages, zoom):
+    doc = open_document(path)
+    try:
+        images = [pixmap_to_image(render_pixmap(doc, p, zoom)) for p in pages]
+    finally:
+        doc.close()
+    results = {}
+    for fmt in ("webp", "jpeg", "png"):
+        settings = EncodingSettings(formats=(fmt,))
+        samples, sizes = [], []
+        for image in images:
+            started = time.perf_counter()
+            encoded = encode_image(image, settings)
+            samples.append(time.perf_counter() - started)
+            sizes.append(encoded.size)
+        stats = summarize(samples)
+        stats['mean_bytes'] = int(statistics.fmean(sizes))
+        results[fmt] = stats
+    return results
+
+
+def bench_end_to_end(path, pages, workers, zoom, delay, reply_words, repeat):
+    """Extraction -> context message -> chat_message and streamed reply, against the stub server."""
+    from image_analysis import ImageAnalysisService
+    from response_cache import ResponseCache
+    from stub_server import StubServer
+
+    reply = " ".join(["word"] * reply_words)
+    engine = ExtractionEngine(workers, zoom, EncodingSettings(), text_layer=TextLayerSettings())
+    with StubServer(reply, delay) as server:
+        service = ImageAnalysisService("bench", server.base_url, response_cache=ResponseCache(mode="off"),
+                                       requests_per_second=1000, burst=1000)
+        try:
+            started = time.perf_counter()
+            items = engine.extract_sync(path, pages)
+            extract_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            context = {"role": "user", "content": [{"type": "text", "text": "Context"}]}
+            for item in items:
+                context["content"].extend(content_parts(item))
+            build_seconds = time.perf_counter() - started
+
+            conversation = [context, {"role": "user", "content": "Explain the first section."}]
+            chat, _ = timed(lambda: service.chat_message(conversation), repeat)
+
+            first_token, total = [], []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                for i, _piece in enumerate(service.stream_chat_message(conversation)):
+                    if i == 0:
+                        first_token.append(time.perf_counter() - started)
+                total.append(time.perf_counter() - started)
+        finally:
+            engine.shutdown()
+            service.loop_thread.run(service.async_service.aclose())
+    return {
+        'extract_seconds': round(extract_seconds, 4),
+        'build_request_ms': round(build_seconds * 1000, 3),
+        'request_bytes': len(json.dumps(conversation)),
+        'chat_message': chat,
+        'stream_first_token': summarize(first_token),
+        'stream_total': summarize(total),
+        'stub_delay': delay,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(value, prefix=""):
+    """{'a': {'b': 1}} -> {'a.b': 1} for numeric leaves."""
+    if isinstance(value, dict):
+        items = {}
+        for key, child in value.items():
+            items.update(flatten(child, f"{prefix}.{key}" if prefix else str(key)))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def compare(previous, current, threshold):
+    """Print metrics that moved by more than threshold (a fraction) between two runs."""
+    old = {r['book']: flatten(r) for r in previous['results']}
+    for result in current['results']:
+        before = old.get(result['book'])
+        if before is None:
+            continue
+        for key, value in flatten(result).items():
+            base = before.get(key)
+            if not base or key.endswith(('.n', 'pages', 'chapters')):
+                continue
+            change = value / base - 1
+            if abs(change) >= threshold:
+                print(f"{result['book']:<24} {key:<60} {base:>12} -> {value:<12} {change:+.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chapter detection, rendering, extraction and requests")
+    parser.add_argument("--pages", type=int, nargs="+", default=[60, 400], help="Page counts of the books")
+    parser.add_argument("--toc-depth", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--figure-every", type=int, nargs="+", default=[0, 3], help="0 for no figures")
+    parser.add_argument("--zooms", type=float, nargs="+", default=[1.0, 2.0, 4.0])
+    parser.add_argument("--sample-pages", type=int, default=5, help="Pages used for render/encoding timings")
+    parser.add_argument("--extract-pages", type=int, default=20, help="Pages per extraction run")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--stub-delay", type=float, default=0.005, help="Stub server delay per word, seconds")
+    parser.add_argument("--reply-words", type=int, default=50)
+    parser.add_argument("--skip-e2e", action="store_true", help="Skip the stub server round trips")
+    parser.add_argument("--workdir", help="Keep the generated books here instead of a temporary directory")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change reported by --compare")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    temp = None if args.workdir else tempfile.TemporaryDirectory(prefix="edu-bench-")
+    workdir = args.workdir or temp.name
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    try:
+        for page_count, depth, figure_every in itertools.product(args.pages, args.toc_depth, args.figure_every):
+            name = f"p{page_count}-d{depth}-f{figure_every}"
+            path = os.path.join(workdir, name + ".pdf")
+            if not os.path.exists(path):
+                make_textbook(path, page_count, depth, figure_every)
+            step = max(1, page_count // args.sample_pages)
+            sample = list(range(0, page_count, step))[:args.sample_pages]
+            extract = list(range(min(args.extract_pages, page_count)))
+            print(f"{name}: chapters, render, extraction, encoding" + ("" if args.skip_e2e else ", end-to-end"))
+
+            result = {
+                'book': name,
+                'pages': page_count,
+                'toc_depth': depth,
+                'figure_every': figure_every,
+                'file_bytes': os.path.getsize(path),
+                'get_chapter_info': bench_toc(path, args.repeat),
+                'render': bench_render(path, args.zooms, sample, (1200, 900)),
+                'extraction': bench_extraction(path, extract, args.workers, 2.0),
+                'encoding': bench_encoding(path, sample, 2.0),
+            }
+            if not args.skip_e2e:
+                result['end_to_end'] = bench_end_to_end(path, extract, args.workers, 2.0, args.stub_delay,
+                                                        args.reply_words, args.repeat)
+            results.append(result)
+    finally:
+        if temp is not None:
+            temp.cleanup()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        'results': results,
+    }
+    for r in results:
+        e = r['extraction']
+        print(f"{r['book']:<16} toc {r['get_chapter_info']['median_ms']:8.2f} ms  "
+              f"render@2x {r['render'].get('2.0', {}).get('full_page', {}).get('median_ms', 0):8.1f} ms  "
+              f"extract {e['images_only']['pages_per_second']:6.1f} / {e['text_layer']['pages_per_second']:6.1f} pages/s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare request payloads with and without the text layer.
+
+Every page of the chosen range is extracted twice, once as images only and
+once with page classification (text, image, or text plus cropped figures).
+The script reports bytes, estimated tokens and extraction time for both:
+
+    python scripts/bench_text_layer.py book.pdf
+    python scripts/bench_text_layer.py book.pdf --pages 20-60 --json text_layer.json
+"""
+import argparse
+import json
+import time
+from collections import Counter
+
+from context_manager import ContextManager
+from document import open_document
+from encoding import EncodingSettings
+from extraction import ExtractionEngine
+from page_content import TextLayerSettings, content_parts
+
+
+def parse_pages(spec, page_count):
+    if not spec:
+        return range(page_count)
+    first, _, last = spec.partition("-")
+    return range(int(first) - 1, min(page_count, int(last or first)))
+
+
+def measure(engine, path, pages, context_manager):
+    started = time.perf_counter()
+    items = engine.extract_sync(path, pages)
+    seconds = time.perf_counter() - started
+    message = {"role": "user", "content": [part for item in items for part in content_parts(item)]}
+    tokens, size = context_manager.estimate(message)
+    return items, {'seconds': round(seconds, 3), 'bytes': size, 'tokens': tokens}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure payload savings of sending text instead of page images")
+    parser.add_argument("pdf")
+    parser.add_argument("--pages", help="1-based range such as 10-40 (default: all pages)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--zoom", type=float, default=2.0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    doc = open_document(args.pdf)
+    pages = parse_pages(args.pages, len(doc))
+    doc.close()
+
+    settings = EncodingSettings()
+    context_manager = ContextManager()
+    images_engine = ExtractionEngine(args.workers, args.zoom, settings)
+    hybrid_engine = ExtractionEngine(args.workers, args.zoom, settings, text_layer=TextLayerSettings())
+    try:
+        _, images = measure(images_engine, args.pdf, pages, context_manager)
+        items, hybrid = measure(hybrid_engine, args.pdf, pages, context_manager)
+    finally:
+        images_engine.shutdown()
+        hybrid_engine.shutdown()
+
+    hybrid['kinds'] = dict(Counter(item.kind for item in items))
+    results = {
+        'pdf': args.pdf,
+        'pages': len(pages),
+        'images_only': images,
+        'text_layer': hybrid,
+        'bytes_saved': 1 - hybrid['bytes'] / images['bytes'] if images['bytes'] else 0.0,
+        'tokens_saved': 1 - hybrid['tokens'] / images['tokens'] if images['tokens'] else 0.0,
+    }
+
+    for name in ('images_only', 'text_layer'):
+        r = results[name]
+        print(f"{name:<12} {r['bytes'] / 1024:10.0f} KB  {r['tokens']:8d} tokens  {r['seconds']:6.2f}s")
+    print(f"Pages: {', '.join(f'{n} {kind}' for kind, n in sorted(hybrid['kinds'].items()))}")
+    print(f"Saved: {results['bytes_saved']:.0%} of bytes, {results['tokens_saved']:.0%} of tokens")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
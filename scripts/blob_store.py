@@ -0,0 +1,106 @@
+import base64
+import copy
+import hashlib
+import logging
+import mmap
+import os
+import threading
+
+# Image URLs of the form "blob:<sha256>" refer to a BlobStore entry.
+BLOB_SCHEME = "blob:"
+
+
+def default_data_dir():
+    """EDU_DATA_DIR, or ~/.local/share/edu. Unlike the cache directory, nothing here is evicted."""
+    return os.environ.get("EDU_DATA_DIR") or os.path.join(os.path.expanduser("~"), ".local", "share", "edu")
+
+
+def is_blob_url(url):
+    return url.startswith(BLOB_SCHEME)
+
+
+class BlobStore:
+    """
+    Content-addressed store for image bytes, kept on disk and read through mmap.
+
+    Conversation messages hold only a reference part:
+
+        {"type": "image_url", "image_url": {"url": "blob:<sha256>", "mime_type": "image/webp", "bytes": 51234}}
+
+    ``resolve`` turns references into data URIs just before a request is
+    serialised, so base64 copies exist only for the duration of one request.
+    Identical images are stored once. Blobs are never evicted, since saved
+    sessions may still refer to them.
+
+    Args:
+        directory (str): Where blobs are written; defaults to <data dir>/blobs.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(default_data_dir(), "blobs")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, data, mime_type):
+        """Store data (if not already present) and return a reference content part."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return {"type": "image_url",
+                "image_url": {"url": BLOB_SCHEME + digest, "mime_type": mime_type, "bytes": len(data)}}
+
+    def put_image(self, image):
+        """Store an EncodedImage."""
+        return self.put(image.getvalue(), image.mime_type)
+
+    def contains(self, digest):
+        return os.path.exists(self._path(digest))
+
+    def data_uri(self, url, mime_type):
+        """Data URI for a blob URL, encoded straight from the memory-mapped file."""
+        digest = url[len(BLOB_SCHEME):]
+        with open(self._path(digest), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return f"data:{mime_type};base64,"
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return f"data:{mime_type};base64,{base64.b64encode(mapped).decode('ascii')}"
+
+    def resolve(self, messages):
+        """
+        Copy of messages with every blob reference replaced by an inline data URI.
+
+        Messages without references are passed through unchanged (not copied).
+        """
+        resolved = []
+        for message in messages:
+            content = message.get("content")
+            if not isinstance(content, list) or not any(
+                item.get("type") == "image_url" and is_blob_url(item["image_url"]["url"]) for item in content
+            ):
+                resolved.append(message)
+                continue
+            message = copy.copy(message)
+            parts = []
+            for item in content:
+                if item.get("type") == "image_url" and is_blob_url(item["image_url"]["url"]):
+                    ref = item["image_url"]
+                    try:
+                        url = self.data_uri(ref["url"], ref.get("mime_type", "image/png"))
+                    except OSError as e:
+                        logging.warning("Missing image blob %s: %s", ref["url"], e)
+                        parts.append({"type": "text", "text": "[Image no longer available]"})
+                        continue
+                    parts.append({"type": "image_url", "image_url": {"url": url}})
+                else:
+                    parts.append(item)
+            message["content"] = parts
+            resolved.append(message)
+        return resolved
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+
+from prompts import window_notes_prompt, chapter_digest_prompt, chapter_digest_context_prompt
+
+
+def split_windows(sizes, max_bytes, max_images):
+    """
+    Group consecutive pages into windows of at most max_images pages and
+    max_bytes encoded bytes. A single page larger than max_bytes gets a
+    window of its own.
+
+    Args:
+        sizes (list): Encoded size in bytes of each page, in page order.
+
+    Returns:
+        list: (start, end) index pairs, end exclusive.
+    """
+    windows = []
+    start = 0
+    total = 0
+    for i, size in enumerate(sizes):
+        if i > start and (i - start >= max_images or total + size > max_bytes):
+            windows.append((start, i))
+            start, total = i, 0
+        total += size
+    if start < len(sizes):
+        windows.append((start, len(sizes)))
+    return windows
+
+
+class ChunkedAnalyzer:
+    """
+    Map-reduce analysis for chapters too long for a single request.
+
+    The pages are split into windows bounded by page count, encoded bytes and
+    estimated image tokens. Each window is summarised concurrently (the
+    service's own concurrency and rate limits apply), and the window notes are
+    merged into one compact text digest that can stand in for the images in
+    the conversation.
+
+    Args:
+        service (AsyncImageAnalysisService): Client used for every request.
+        window_pages (int): Most pages per window request.
+        window_bytes (int): Most encoded image bytes per window request.
+        window_tokens (int): Most estimated image tokens per window request.
+        digest_words (int): Target length of the merged digest.
+        max_chapter_pages (int): Longest chapter accepted for chunked analysis.
+        single_request_pages (int): Chapters up to this long are sent whole, as page
+            images, in one request; only longer ones are chunked into a digest.
+    """
+
+    def __init__(self, service, window_pages=12, window_bytes=8_000_000, window_tokens=16_000,
+                 digest_words=800, max_chapter_pages=1000, single_request_pages=100):
+        self.service = service
+        self.window_pages = window_pages
+        self.window_bytes = window_bytes
+        self.window_tokens = window_tokens
+        self.digest_words = digest_words
+        self.max_chapter_pages = max_chapter_pages
+        self.single_request_pages = single_request_pages
+
+    @classmethod
+    def from_dict(cls, service, values):
+        """Build from the optional "CHUNKED_ANALYSIS" config section."""
+        return cls(service, **(values or {}))
+
+    @property
+    def window_images(self):
+        """Most pages a window can hold under the page and token limits."""
+        tokens_per_image = self.service.context_manager.tokens_per_image
+        return max(1, min(self.window_pages, self.window_tokens // max(1, tokens_per_image)))
+
+    def needs_chunking(self, page_count):
+        """True for chapters too long to send whole; the window size only matters once they are chunked."""
+        return page_count > self.single_request_pages
+
+    async def analyze_window(self, pages, title, first_page, last_page):
+        prompt = window_notes_prompt.format(title=title, first=first_page, last=last_page)
+        notes = await self.service.analyze_content([part for parts in pages for part in parts], prompt)
+        logging.info(f"Window notes for pages {first_page}-{last_page}: {len(notes)} chars")
+        return notes
+
+    async def analyze(self, pages, sizes, title, first_page):
+        """
+        Summarise a chapter window by window and merge the notes into a digest.
+
+        Args:
+            pages (list): Content parts of each page (see page_content.content_parts), in page order.
+            sizes (list): Encoded size in bytes of each page.
+            title (str): Chapter title, used in the prompts.
+            first_page (int): 1-based number of the first page.
+
+        Returns:
+            str: The chapter digest, or an "Error: ..." string.
+        """
+        if not pages:
+            # e.g. every page was blank and filtered out
+            return "Error: No pages to analyze"
+        windows = split_windows(sizes, self.window_bytes, self.window_images)
+        logging.info(f"Analysing {title} in {len(windows)} windows of up to {self.window_images} pages")
+        notes = await asyncio.gather(*(
+            self.analyze_window(pages[start:end], title, first_page + start, first_page + end - 1)
+            for start, end in windows
+        ))
+
+        if all(text.startswith("Error:") for text in notes):
+            return notes[0]
+        sections = []
+        for (start, end), text in zip(windows, notes):
+            if text.startswith("Error:"):
+                logging.warning(f"Pages {first_page + start}-{first_page + end - 1} failed: {text}")
+                text = f"[Pages not analysed: {text}]"
+            sections.append(f"Pages {first_page + start}-{first_page + end - 1}:\n{text}")
+        combined = "\n\n".join(sections)
+        if len(windows) == 1:
+            return combined
+
+        prompt = chapter_digest_prompt.format(title=title, words=self.digest_words)
+        digest = await self.service.complete([{
+            "role": "user",
+            "content": [{"type": "text", "text": f"{prompt}\n\n{combined}"}],
+        }])
+        if digest.startswith("Error:"):
+            # The window notes are still far smaller than the images
+            logging.warning(f"Digest merge failed, keeping window notes: {digest}")
+            return combined
+        return digest
+
+
+def digest_message(title, first_page, last_page, digest):
+    """Conversation message that carries a chapter digest instead of page images."""
+    text = chapter_digest_context_prompt.format(title=title, first=first_page, last=last_page)
+    return {"role": "user", "content": [{"type": "text", "text": f"{text}\n\n{digest}"}]}
+
+
+def has_digest(conversation, title, first_page, last_page):
+    """True if the conversation already holds the digest of this chapter."""
+    text = chapter_digest_context_prompt.format(title=title, first=first_page, last=last_page)
+    return any(
+        isinstance(m.get("content"), list) and m["content"]
+        and m["content"][0].get("text", "").startswith(text)
+        for m in conversation
+    )
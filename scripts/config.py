@@ -0,0 +1,15 @@
+import json
+import logging
+
+
+def load_config(config_path="scripts/config.json"):
+    try:
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        return config
+    except FileNotFoundError:
+        logging.error(f"Config file not found at {config_path}")
+        return {}
+    except json.JSONDecodeError:
+        logging.error(f"Error decoding JSON from {config_path}")
+        return {}
@@ -0,0 +1,235 @@
+import base64
+import hashlib
+import logging
+
+from blob_store import BLOB_SCHEME, is_blob_url
+from metrics import inc, span
+
+
+def image_urls(message):
+    """Image URLs (data URIs or blob references) in a message, in order."""
+    return [image["url"] for image in _images(message)]
+
+
+def _images(message):
+    content = message.get("content")
+    if not isinstance(content, list):
+        return []
+    return [item["image_url"] for item in content if item.get("type") == "image_url"]
+
+
+def _payload_size(image):
+    """Bytes an image adds to the request; blob references are sent as base64 (4/3 of their size)."""
+    if "bytes" in image:
+        return (image["bytes"] + 2) // 3 * 4 + len(image.get("mime_type", "")) + 13
+    return len(image["url"])
+
+
+def text_parts(message):
+    content = message.get("content")
+    if isinstance(content, str):
+        return [content]
+    if isinstance(content, list):
+        return [item.get("text", "") for item in content if item.get("type") == "text"]
+    return []
+
+
+def image_digest(image):
+    """sha256 of an image part's bytes: named by blob references, decoded from data URIs."""
+    url = image["url"]
+    if is_blob_url(url):
+        return url[len(BLOB_SCHEME):]
+    return hashlib.sha256(base64.b64decode(url.partition(",")[2])).hexdigest()
+
+
+def resolve_repeats(messages):
+    """
+    Copy of messages with each image marked as a repeat (see
+    page_content.PageDeduplicator) replaced by its note when the original
+    image is sent in the same request, and unmarked otherwise, so the
+    image itself goes out again.
+
+    Messages without marked images are passed through unchanged (not copied).
+    """
+    if not any("repeat_of" in item for message in messages for item in _parts(message)):
+        return messages
+    sent = {image_digest(item["image_url"]) for message in messages for item in _parts(message)
+            if item.get("type") == "image_url" and "repeat_of" not in item}
+    resolved = []
+    replaced = saved = 0
+    for message in messages:
+        content = _parts(message)
+        if not any("repeat_of" in item for item in content):
+            resolved.append(message)
+            continue
+        parts = []
+        for item in content:
+            if "repeat_of" not in item:
+                parts.append(item)
+                continue
+            repeat_of = item["repeat_of"]
+            item = {key: value for key, value in item.items() if key != "repeat_of"}
+            if repeat_of["sha256"] in sent:
+                replaced += 1
+                saved += _payload_size(item["image_url"])
+                parts.append({"type": "text", "text": repeat_of["text"]})
+            else:
+                parts.append(item)
+        resolved.append(dict(message, content=parts))
+    if replaced:
+        inc("pages_skipped", replaced, reason="repeated")
+        inc("bytes_skipped", saved)
+        logging.info(f"Request: {replaced} repeated images sent as a note ({saved / 1024:.0f} KB not sent)")
+    return resolved
+
+
+def _parts(message):
+    content = message.get("content")
+    return content if isinstance(content, list) else []
+
+
+class ContextManager:
+    """
+    Decides what part of the conversation is actually sent on each request.
+
+    - Image context messages with identical images are sent only once (the latest copy).
+    - Each message's token and byte cost is estimated.
+    - If the total exceeds the budget, images are removed from the oldest image
+      contexts first, then the oldest text turns are dropped. The last
+      ``keep_recent`` messages are never touched.
+
+    With a ``retriever`` (see retrieval.ContextRetriever) long conversations
+    are first narrowed to the recent turns plus the most relevant earlier ones.
+
+    The conversation itself is never modified; ``prepare`` returns a new list.
+
+    Args:
+        max_tokens (int): Estimated token budget per request.
+        max_bytes (int): Payload budget per request, dominated by base64 images.
+        keep_recent (int): Number of most recent messages always sent unchanged.
+        tokens_per_image (int): Token estimate for one page image.
+        chars_per_token (int): Rough characters-per-token ratio for text.
+        retriever (ContextRetriever): Optional relevance filter applied before the budget.
+    """
+
+    def __init__(self, max_tokens=200_000, max_bytes=40_000_000, keep_recent=6,
+                 tokens_per_image=1000, chars_per_token=4, retriever=None):
+        self.max_tokens = max_tokens
+        self.max_bytes = max_bytes
+        self.keep_recent = keep_recent
+        self.tokens_per_image = tokens_per_image
+        self.chars_per_token = chars_per_token
+        self.retriever = retriever
+        # id(message) -> (message, signature); the message is held so its id is not reused.
+        self._signatures = {}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**(values or {}))
+
+    def image_signature(self, message):
+        """Hash identifying a message's images, or None if it has none."""
+        cached = self._signatures.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        urls = image_urls(message)
+        signature = None
+        if urls:
+            digest = hashlib.sha1()
+            for url in urls:
+                digest.update(url.encode("ascii", "ignore"))
+                digest.update(b"\0")
+            signature = digest.hexdigest()
+        self._signatures[id(message)] = (message, signature)
+        return signature
+
+    def has_context(self, conversation, message):
+        """True if the conversation already holds a message with the same images (or, without images, the same content)."""
+        signature = self.image_signature(message)
+        if signature is None:
+            return any(m.get("content") == message.get("content") for m in conversation)
+        return any(self.image_signature(m) == signature for m in conversation)
+
+    def estimate(self, message):
+        """Return (tokens, bytes) for one message."""
+        text_chars = sum(len(t) for t in text_parts(message))
+        images = _images(message)
+        tokens = text_chars // self.chars_per_token + len(images) * self.tokens_per_image
+        size = text_chars + sum(_payload_size(image) for image in images)
+        return tokens, size
+
+    def strip_images(self, message):
+        """Copy of message with its images replaced by a short note."""
+        count = len(image_urls(message))
+        content = [{"type": "text", "text": t} for t in text_parts(message)]
+        content.append({
+            "type": "text",
+            "text": f"[{count} page image{'s' if count != 1 else ''} from this earlier context omitted to save space]"
+        })
+        return {"role": message["role"], "content": content}
+
+    def prepare(self, conversation):
+        """
+        Build the list of messages to send for the next request.
+
+        Args:
+            conversation (list): The full conversation chain.
+
+        Returns:
+            list: Messages within budget; the input list is left unchanged.
+        """
+        with span("request_build"):
+            return self._prepare(conversation)
+
+    def _prepare(self, conversation):
+        if self.retriever is not None:
+            conversation = self.retriever.select(conversation)
+        if len(self._signatures) > 2 * len(conversation):
+            live = {id(m) for m in conversation}
+            self._signatures = {k: v for k, v in self._signatures.items() if k in live}
+
+        # Keep only the latest copy of each distinct image context.
+        seen = set()
+        duplicates = 0
+        kept = []
+        for message in reversed(conversation):
+            signature = self.image_signature(message)
+            if signature is not None:
+                if signature in seen:
+                    duplicates += 1
+                    continue
+                seen.add(signature)
+            kept.append(message)
+        kept.reverse()
+
+        costs = [self.estimate(m) for m in kept]
+        total_tokens = sum(c[0] for c in costs)
+        total_bytes = sum(c[1] for c in costs)
+        protected = max(0, len(kept) - self.keep_recent)
+
+        # Oldest image contexts lose their images first...
+        stripped = 0
+        for i in range(protected):
+            if total_tokens <= self.max_tokens and total_bytes <= self.max_bytes:
+                break
+            if image_urls(kept[i]):
+                kept[i] = self.strip_images(kept[i])
+                new_cost = self.estimate(kept[i])
+                total_tokens += new_cost[0] - costs[i][0]
+                total_bytes += new_cost[1] - costs[i][1]
+                costs[i] = new_cost
+                stripped += 1
+
+        # ...then the oldest turns are dropped altogether.
+        dropped = 0
+        while dropped < protected and (total_tokens > self.max_tokens or total_bytes > self.max_bytes):
+            total_tokens -= costs[dropped][0]
+            total_bytes -= costs[dropped][1]
+            dropped += 1
+        kept = kept[dropped:]
+
+        logging.info(
+            f"Request cost: ~{total_tokens} tokens, {total_bytes / 1024:.0f} KB in {len(kept)} messages "
+            f"({duplicates} duplicate contexts removed, {stripped} image contexts stripped, {dropped} old turns dropped)"
+        )
+        return kept
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import zlib
+
+
+def default_cache_dir():
+    return os.environ.get("EDU_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "edu")
+
+
+def make_key(*parts):
+    """Stable hex digest for a tuple of JSON-serialisable key parts."""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def document_digest(path, cache=None):
+    """
+    Content hash of a document, memoised in the cache by path, size and mtime.
+
+    Hashing a large textbook takes a moment, so it is only done the first time
+    a given version of the file is seen.
+    """
+    stat = os.stat(path)
+    memo_key = ("file-digest", os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if cache is not None:
+        cached = cache.get(memo_key, count=False)
+        if cached is not None:
+            return cached.decode("ascii")
+    digest = file_digest(path)
+    if cache is not None:
+        cache.put(memo_key, digest.encode("ascii"))
+    return digest
+
+
+def pack_image(image):
+    """Serialise a PIL image as mode, size and zlib-compressed raw samples."""
+    header = struct.pack("!4sII", image.mode.encode("ascii").ljust(4), image.width, image.height)
+    return header + zlib.compress(image.tobytes(), 1)
+
+
+def unpack_image(data):
+    from PIL import Image
+    mode, width, height = struct.unpack_from("!4sII", data)
+    samples = zlib.decompress(data[struct.calcsize("!4sII"):])
+    return Image.frombytes(mode.decode("ascii").strip(), (width, height), samples)
+
+
+def _is_shard(name):
+    return len(name) == 2 and all(c in "0123456789abcdef" for c in name)
+
+
+class DiskCache:
+    """
+    Persistent content-addressed cache of byte blobs with size-based LRU eviction.
+
+    Keys are tuples of JSON-serialisable parts, hashed to file names under
+    ``directory``. Reads refresh a file's mtime, and when the total size exceeds
+    ``max_bytes`` the least recently used files are deleted. Writes are atomic,
+    so several threads or processes can share a directory.
+    """
+
+    def __init__(self, directory=None, max_bytes=2 * 1024 * 1024 * 1024):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._current_bytes = None
+        self._lock = threading.Lock()
+        self._writes = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        name = make_key(*key)
+        return os.path.join(self.directory, name[:2], name)
+
+    def get(self, key, count=True):
+        """Return the cached bytes for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            if count:
+                with self._lock:
+                    self.misses += 1
+            return None
+        if count:
+            with self._lock:
+                self.hits += 1
+                self.bytes_saved += len(data)
+        return data
+
+    def contains(self, key):
+        """Check for key without reading it or touching the counters."""
+        return os.path.exists(self._path(key))
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            # Under the lock, so a concurrent write of the same key cannot be counted twice
+            with self._lock:
+                try:
+                    old_size = os.stat(path).st_size
+                except FileNotFoundError:
+                    old_size = 0
+                os.replace(tmp_path, path)
+                if self._current_bytes is not None:
+                    self._current_bytes += len(data) - old_size
+        except OSError as e:
+            logging.warning(f"Disk cache write failed: {str(e)}")
+            return
+        self._evict_if_needed()
+
+    def put_later(self, key, make_data):
+        """
+        Queue a write for the background writer thread.
+
+        ``make_data()`` is called on that thread, so serialisation and
+        compression cost nothing on the caller's thread.
+        """
+        with self._lock:
+            if self._writes is None:
+                self._writes = queue.Queue()
+                threading.Thread(target=self._write_loop, name="disk-cache-writer", daemon=True).start()
+        self._writes.put((key, make_data))
+
+    def _write_loop(self):
+        while True:
+            key, make_data = self._writes.get()
+            try:
+                self.put(key, make_data())
+            except Exception as e:
+                logging.warning(f"Disk cache write failed: {str(e)}")
+
+    def _entries(self):
+        # Only the two-hex-digit shards written by put(); other files and
+        # directories under the cache dir (thumbnail packs, search indexes,
+        # the response database) are not this cache's to evict.
+        for subdir in os.scandir(self.directory):
+            if not (subdir.is_dir() and _is_shard(subdir.name)):
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _evict_if_needed(self):
+        with self._lock:
+            if self._current_bytes is None:
+                self._current_bytes = sum(size for _, size, _ in self._entries())
+            if self._current_bytes <= self.max_bytes:
+                return
+            # Evict down to 90% so every write near the limit doesn't trigger a scan.
+            target = self.max_bytes * 0.9
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._current_bytes = total
+            logging.info(f"Disk cache evicted down to {total / 2**20:.0f} MB")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'bytes_saved': self.bytes_saved,
+                'max_bytes': self.max_bytes,
+                'directory': self.directory,
+            }
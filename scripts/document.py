@@ -0,0 +1,136 @@
+import logging
+import threading
+
+from disk_cache import document_digest, pack_image, unpack_image
+from metrics import span
+from rendering import render_pixmap, pixmap_to_image, image_nbytes
+from toc_index import TocIndex, index_for_document
+
+
+def open_document(path):
+    """Open a document with PyMuPDF (imported lazily so callers stay light)."""
+    import fitz
+    return fitz.open(path)
+
+
+class Document:
+    """
+    An open textbook, independent of any GUI.
+
+    Holds the fitz handle, the content hash that keys every cache, the chapter
+    list and access to rendered pages. fitz documents are not thread-safe, so
+    every use of ``doc`` goes through ``lock``. ``current_page`` and ``zoom``
+    remember where a viewer left the book while another one is shown.
+
+    Args:
+        path (str): File to open (PDF, EPUB or anything else PyMuPDF reads).
+        disk_cache (DiskCache): Persistent cache for the content hash and rendered pages.
+        render_cache (RenderCache): In-memory cache of rendered pages, possibly shared.
+        toc (list): Table of contents already read (e.g. from the library catalogue).
+        digest (str): Content hash already known, so the file is not hashed again.
+    """
+
+    def __init__(self, path, disk_cache=None, render_cache=None, toc=None, digest=None):
+        self.path = path
+        self.disk_cache = disk_cache
+        self.render_cache = render_cache
+        with span("document_open"):
+            self.digest = digest or document_digest(path, disk_cache)
+            self.lock = threading.Lock()
+            self.doc = open_document(path)
+            self.page_count = len(self.doc)
+        try:
+            self.toc_index = index_for_document(self.doc, self.digest, toc)
+        except Exception as e:
+            logging.warning(f"Chapter detection failed: {str(e)}")
+            self.toc_index = TocIndex([], self.page_count)
+        self.chapters = self.toc_index.chapters
+        self._page_sizes = {}
+        self.current_page = 0
+        self.zoom = None
+
+    def render_image(self, page_num, zoom, clip=None):
+        """Rasterise a page at the given zoom and return it as a PIL image."""
+        with self.lock:
+            if self.doc is None:
+                raise ValueError("Document is closed")
+            return pixmap_to_image(render_pixmap(self.doc, page_num, zoom, clip))
+
+    def page_size(self, page_num):
+        """Page width and height in points (zoom 1)."""
+        size = self._page_sizes.get(page_num)
+        if size is None:
+            with self.lock:
+                if self.doc is None:
+                    raise ValueError("Document is closed")
+                rect = self.doc.load_page(page_num).rect
+            size = self._page_sizes[page_num] = (rect.width, rect.height)
+        return size
+
+    def tile_key(self, page_num, zoom, column, row):
+        return (self.digest, page_num, zoom, column, row)
+
+    def render_tile(self, page_num, zoom, column, row, tile_size):
+        """
+        Rasterise one tile_size x tile_size pixel tile of a page.
+
+        Only the clip rectangle is rendered, so the cost depends on the tile
+        size rather than on the zoom. Tiles on the right and bottom edges are
+        cut to the page.
+        """
+        width, height = self.page_size(page_num)
+        step = tile_size / zoom
+        x0, y0 = column * step, row * step
+        clip = (x0, y0, min(width, x0 + step), min(height, y0 + step))
+        return self.render_image(page_num, zoom, clip)
+
+    def load_page_image(self, page_num, zoom):
+        """Rendered page from the disk cache if an earlier session produced it, else render it."""
+        disk_key = ("render", self.digest, page_num, round(zoom, 4))
+        if self.disk_cache is not None:
+            data = self.disk_cache.get(disk_key)
+            if data is not None:
+                return unpack_image(data)
+        image = self.render_image(page_num, zoom)
+        if self.disk_cache is not None:
+            self.disk_cache.put_later(disk_key, lambda: pack_image(image))
+        return image
+
+    def cache_key(self, page_num, zoom):
+        return (self.digest, page_num, zoom)
+
+    def page_image(self, page_num, zoom):
+        """Rendered page, served from the memory cache when possible."""
+        key = self.cache_key(page_num, zoom)
+        image = self.render_cache.get(key) if self.render_cache is not None else None
+        if image is None:
+            image = self.load_page_image(page_num, zoom)
+            if self.render_cache is not None:
+                self.render_cache.put(key, image, image_nbytes(image))
+        return image
+
+    def chapter_for_page(self, page_num):
+        return self.toc_index.chapter_for_page(page_num)
+
+    def section_path(self, page_num):
+        """Titles of the sections containing page_num, outermost first."""
+        return [node.title for node in self.toc_index.path_for_page(page_num)]
+
+    def close(self):
+        with self.lock:
+            if self.doc is not None:
+                self.doc.close()
+                self.doc = None
+
+
+def get_chapter_info(doc, digest=None):
+    """Extract hierarchical chapter information with deepest subdivisions"""
+    try:
+        return index_for_document(doc, digest).chapters
+    except Exception as e:
+        logging.warning(f"Chapter detection failed: {str(e)}")
+        return [{
+            'title': 'Full Document',
+            'start': 0,
+            'end': len(doc) - 1
+        }]
@@ -0,0 +1,200 @@
+import io
+import logging
+import math
+import struct
+
+from metrics import span
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+
+class EncodingSettings:
+    """
+    How extracted pages are encoded before they are sent to the model.
+
+    Args:
+        formats (tuple): Candidate formats; the smallest result that fits the budget wins.
+        quality (int): Quality for the lossy formats (JPEG/WebP), 1-95.
+        grayscale (bool or str): True, False, or "auto" to convert pages without colour.
+        max_pixels (int): Pages larger than this are downscaled before encoding.
+        max_image_bytes (int): Byte budget for a single image, or None.
+        max_request_bytes (int): Byte budget for all images of one request, or None.
+        min_scale (float): Never downscale below this fraction of the rendered size.
+    """
+
+    def __init__(self, formats=("webp", "jpeg", "png"), quality=80, grayscale="auto",
+                 max_pixels=2_500_000, max_image_bytes=400_000, max_request_bytes=20_000_000,
+                 min_scale=0.25):
+        if not formats:
+            raise ValueError("At least one image format is required")
+        unknown = [f for f in formats if f not in MIME_TYPES]
+        if unknown:
+            raise ValueError(f"Unsupported image formats: {', '.join(unknown)}")
+        self.formats = tuple(formats)
+        self.quality = quality
+        self.grayscale = grayscale
+        self.max_pixels = max_pixels
+        self.max_image_bytes = max_image_bytes
+        self.max_request_bytes = max_request_bytes
+        self.min_scale = min_scale
+
+    @classmethod
+    def from_dict(cls, values):
+        values = dict(values or {})
+        if "formats" in values:
+            values["formats"] = tuple(values["formats"])
+        return cls(**values)
+
+    def to_dict(self):
+        return {
+            'formats': list(self.formats),
+            'quality': self.quality,
+            'grayscale': self.grayscale,
+            'max_pixels': self.max_pixels,
+            'max_image_bytes': self.max_image_bytes,
+            'max_request_bytes': self.max_request_bytes,
+            'min_scale': self.min_scale,
+        }
+
+    def image_budget(self, page_count):
+        """
+        Byte budget for each image when a request carries page_count images,
+        or None when neither limit is set. Never 0, which would mean no limit.
+        """
+        budgets = [b for b in (self.max_image_bytes,) if b]
+        if self.max_request_bytes and page_count:
+            budgets.append(max(1, self.max_request_bytes // page_count))
+        return min(budgets) if budgets else None
+
+
+class EncodedImage:
+    """
+    An encoded page plus its MIME type.
+
+    Exposes ``getvalue()`` so it can be used wherever a BytesIO of image data was expected.
+    ``page_num`` and ``phash`` (page_hash.PageHash) are set by the extraction
+    workers and used to skip blank and repeated pages.
+    """
+
+    def __init__(self, data, mime_type, width, height, page_num=None, phash=None):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.page_num = page_num
+        self.phash = phash
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def getvalue(self):
+        return self.data
+
+    def to_bytes(self):
+        """Serialise for the disk cache."""
+        mime = self.mime_type.encode("ascii")
+        phash = self.phash.to_bytes() if self.phash is not None else b""
+        page_num = -1 if self.page_num is None else self.page_num
+        return struct.pack("!HIIiB", len(mime), self.width, self.height, page_num, len(phash)) + mime + phash + self.data
+
+    @classmethod
+    def from_bytes(cls, blob):
+        from page_hash import PageHash
+        mime_length, width, height, page_num, hash_length = struct.unpack_from("!HIIiB", blob)
+        offset = struct.calcsize("!HIIiB")
+        mime = blob[offset:offset + mime_length].decode("ascii")
+        offset += mime_length
+        phash = PageHash.from_bytes(blob[offset:offset + hash_length]) if hash_length else None
+        offset += hash_length
+        return cls(blob[offset:], mime, width, height, None if page_num < 0 else page_num, phash)
+
+    def __repr__(self):
+        return f"EncodedImage({self.mime_type}, {self.width}x{self.height}, {self.size} bytes)"
+
+
+def available_formats(formats):
+    """Filter out formats the installed Pillow cannot write (WebP is optional); PNG if none are left."""
+    from PIL import features
+    usable = [f for f in formats if f != "webp" or features.check("webp")]
+    if not usable:
+        logging.warning(f"None of the image formats {', '.join(formats)} can be written; using PNG")
+        usable = ["png"]
+    return usable
+
+
+def is_grayscale(image, tolerance=12):
+    """True if no pixel's colour channels differ by more than tolerance."""
+    from PIL import ImageChops
+    if image.mode == "L":
+        return True
+    r, g, b = image.convert("RGB").split()
+    for a, c in ((r, g), (g, b), (r, b)):
+        if ImageChops.difference(a, c).getextrema()[1] > tolerance:
+            return False
+    return True
+
+
+def _encode_as(image, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == "png":
+        image.save(buffer, format="PNG", optimize=False, compress_level=6)
+    elif fmt == "jpeg":
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def encode_image(image, settings, byte_budget=None):
+    """
+    Encode a PIL image with the cheapest format that fits the byte budget.
+
+    Args:
+        image (PIL.Image.Image): The rendered page.
+        settings (EncodingSettings): Formats, quality and size limits.
+        byte_budget (int): Maximum encoded size; falls back to settings.max_image_bytes.
+
+    Returns:
+        EncodedImage: The smallest encoding found. If nothing fits even at
+        min_scale, the smallest attempt is returned and a warning is logged.
+    """
+    with span("encode"):
+        from PIL import Image
+
+        if byte_budget is None:
+            byte_budget = settings.max_image_bytes
+
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        if settings.grayscale is True or (settings.grayscale == "auto" and is_grayscale(image)):
+            image = image.convert("L")
+
+        scale = 1.0
+        if settings.max_pixels and image.width * image.height > settings.max_pixels:
+            scale = math.sqrt(settings.max_pixels / (image.width * image.height))
+
+        formats = available_formats(settings.formats)
+        best = None
+        while True:
+            candidate = image
+            if scale < 1.0:
+                size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+                candidate = image.resize(size, Image.LANCZOS)
+
+            for fmt in formats:
+                data = _encode_as(candidate, fmt, settings.quality)
+                if best is None or len(data) < best.size:
+                    best = EncodedImage(data, MIME_TYPES[fmt], candidate.width, candidate.height)
+
+            if not byte_budget or best.size <= byte_budget:
+                return best
+            if scale <= settings.min_scale:
+                logging.warning(f"Page still {best.size} bytes at minimum scale (budget {byte_budget})")
+                return best
+            # Encoded size scales roughly with pixel count; undershoot a little to avoid extra passes.
+            scale = max(settings.min_scale, scale * math.sqrt(byte_budget / best.size) * 0.9)
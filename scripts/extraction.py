@@ -0,0 +1,266 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from encoding import EncodingSettings, EncodedImage, encode_image
+from rendering import render_pixmap, pixmap_to_image
+from document import open_document
+from page_content import PageContent, extract_page_content
+from metrics import collecting, inc, registry, span
+from page_hash import pixmap_hash
+
+# Bumped whenever the serialised form of extracted pages changes.
+CACHE_FORMAT = 2
+
+# Documents opened by the current worker process, keyed by path.
+_worker_docs = {}
+
+
+def _lower_priority():
+    """Worker initializer for background pools: yield the CPU to the GUI and foreground extraction."""
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass  # Not available on this platform
+
+
+def _open_document(path):
+    """Open (or reuse) the worker's own handle on the PDF at path."""
+    doc = _worker_docs.get(path)
+    if doc is None:
+        for old in _worker_docs.values():
+            old.close()
+        _worker_docs.clear()
+        doc = open_document(path)
+        _worker_docs[path] = doc
+    return doc
+
+
+def render_page_encoded(path, page_num, zoom, settings, byte_budget):
+    """Worker entry point: rasterise one page; returns (EncodedImage, metrics state)."""
+    with collecting() as metrics:
+        doc = _open_document(path)
+        pix = render_pixmap(doc, page_num, zoom)
+        encoded = encode_image(pixmap_to_image(pix), settings, byte_budget)
+        encoded.page_num = page_num
+        encoded.phash = pixmap_hash(pix)
+        return encoded, metrics.state()
+
+
+def extract_page_hybrid(path, page_num, zoom, settings, byte_budget, text_layer):
+    """Worker entry point: returns (PageContent with text and/or images, metrics state)."""
+    with collecting() as metrics:
+        doc = _open_document(path)
+        return extract_page_content(doc, page_num, zoom, settings, byte_budget, text_layer), metrics.state()
+
+
+class ExtractionJob:
+    """
+    Handle for an extraction running in the background.
+
+    Events are posted to ``events`` so the GUI can drain them from its own thread:
+      - ("page", page_num, image)  one EncodedImage (or PageContent) per page, in page order
+      - ("done",)                  all pages delivered
+      - ("cancelled",)             cancel() was called before completion
+      - ("error", message)         a page failed; no further events follow
+    """
+
+    def __init__(self, path, page_numbers, digest=None, budget_pages=None):
+        self.path = path
+        self.page_numbers = list(page_numbers)
+        self.digest = digest
+        self.budget_pages = budget_pages
+        self.completed = 0
+        self.cache_hits = 0
+        self.events = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def total(self):
+        return len(self.page_numbers)
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def is_finished(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+
+class ExtractionEngine:
+    """
+    Renders and encodes pages across a pool of worker processes.
+
+    Pages are encoded with ``settings`` (see encoding.EncodingSettings), and the
+    per-request byte budget is split evenly across the pages of each request
+    (or across ``budget_pages`` pages, when the pages will be sent in windows).
+
+    Each worker opens the PDF itself, so nothing fitz-related crosses process
+    boundaries except the encoded bytes. At most ``max_workers * 2`` pages are
+    in flight at a time, which keeps memory bounded for long chapters while
+    results are still streamed back in page order.
+
+    With a DiskCache, pages already encoded with the same document hash, zoom
+    and settings are served from disk instead of being rendered again.
+
+    With an enabled ``text_layer`` (page_content.TextLayerSettings), pages are
+    classified first and yielded as PageContent: text-only pages skip
+    rendering altogether and pages with figures only render the figures.
+
+    With ``low_priority`` the worker processes run at a lowered scheduling
+    priority, for speculative work that must not slow anything else down.
+    """
+
+    def __init__(self, max_workers=None, zoom=2.0, settings=None, cache=None, text_layer=None, low_priority=False):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.zoom = zoom
+        self.settings = settings or EncodingSettings()
+        self.cache = cache
+        self.text_layer = text_layer
+        self.low_priority = low_priority
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        # Spawn rather than fork: the GUI process already runs helper threads.
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_lower_priority if self.low_priority else None
+                )
+            return self._executor
+
+    @property
+    def hybrid(self):
+        return self.text_layer is not None and self.text_layer.enabled
+
+    def cache_key(self, digest, page_num, byte_budget):
+        if self.hybrid:
+            return ("content", CACHE_FORMAT, digest, page_num, self.zoom, self.settings.to_dict(), byte_budget,
+                    self.text_layer.to_dict())
+        return ("page", CACHE_FORMAT, digest, page_num, self.zoom, self.settings.to_dict(), byte_budget)
+
+    def _submit(self, executor, path, page_num, byte_budget):
+        if self.hybrid:
+            return executor.submit(extract_page_hybrid, path, page_num, self.zoom, self.settings,
+                                   byte_budget, self.text_layer)
+        return executor.submit(render_page_encoded, path, page_num, self.zoom, self.settings, byte_budget)
+
+    def submit_page(self, path, page_num, byte_budget):
+        """Future for one page, resolving to (EncodedImage or PageContent, worker metrics state)."""
+        return self._submit(self._get_executor(), path, page_num, byte_budget)
+
+    def iter_pages(self, path, page_numbers, cancel_event=None, digest=None, on_cache_hit=None,
+                   budget_pages=None):
+        """
+        Yield (page_num, EncodedImage or PageContent) in page order as pages finish rendering.
+
+        Args:
+            path (str): Path of the PDF; each worker opens it independently.
+            page_numbers (list): 0-based page indices to extract.
+            cancel_event (threading.Event): Stops submitting work when set.
+            digest (str): Content hash of the PDF; enables the disk cache.
+            on_cache_hit (callable): Called with page_num for pages served from the cache.
+            budget_pages (int): Pages per request the byte budget is shared by; defaults to all of them.
+        """
+        executor = self._get_executor()
+        window = self.max_workers * 2
+        pending = []
+        next_index = 0
+        page_numbers = list(page_numbers)
+        byte_budget = self.settings.image_budget(budget_pages or len(page_numbers))
+        use_cache = self.cache is not None and digest is not None
+        decode = PageContent.from_bytes if self.hybrid else EncodedImage.from_bytes
+        try:
+            while next_index < len(page_numbers) or pending:
+                while next_index < len(page_numbers) and len(pending) < window:
+                    page_num = page_numbers[next_index]
+                    next_index += 1
+                    cached = self.cache.get(self.cache_key(digest, page_num, byte_budget)) if use_cache else None
+                    if cached is not None:
+                        pending.append((page_num, None, decode(cached)))
+                        inc("pages_extracted", source="cache")
+                        if on_cache_hit:
+                            on_cache_hit(page_num)
+                        continue
+                    pending.append((page_num, self._submit(executor, path, page_num, byte_budget), None))
+
+                page_num, future, image = pending.pop(0)
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                if future is not None:
+                    image, worker_metrics = future.result()
+                    registry().merge(worker_metrics)
+                    inc("pages_extracted", source="render")
+                    if use_cache:
+                        self.cache.put_later(self.cache_key(digest, page_num, byte_budget), image.to_bytes)
+                yield page_num, image
+        finally:
+            for _, future, _ in pending:
+                if future is not None:
+                    future.cancel()
+
+    def extract(self, path, page_numbers, digest=None, budget_pages=None):
+        """
+        Start extracting pages in the background and return an ExtractionJob.
+
+        Args:
+            path (str): Path of the PDF to extract from.
+            page_numbers (list): 0-based page indices to extract.
+            digest (str): Content hash of the PDF; enables the disk cache.
+            budget_pages (int): Pages per request the byte budget is shared by.
+
+        Returns:
+            ExtractionJob: Handle used to follow progress or cancel.
+        """
+        job = ExtractionJob(path, page_numbers, digest, budget_pages)
+        thread = threading.Thread(target=self._run_job, args=(job,), name="extraction", daemon=True)
+        thread.start()
+        return job
+
+    def extract_sync(self, path, page_numbers, digest=None, budget_pages=None):
+        """Extract pages and return a list of EncodedImage (or PageContent), blocking until done."""
+        with span("extraction"):
+            return [image for _, image in self.iter_pages(path, page_numbers, digest=digest,
+                                                          budget_pages=budget_pages)]
+
+    def _run_job(self, job):
+        try:
+            def count_hit(page_num):
+                job.cache_hits += 1
+
+            pages = self.iter_pages(job.path, job.page_numbers, job._cancel_event, job.digest, count_hit,
+                                    job.budget_pages)
+            with span("extraction"):
+                for page_num, image in pages:
+                    job.completed += 1
+                    job.events.put(("page", page_num, image))
+                    logging.info("Processed page %d: %r", page_num + 1, image)
+            if job.is_cancelled():
+                job.events.put(("cancelled",))
+            else:
+                logging.info(f"Extraction done: {job.cache_hits}/{job.total} pages from disk cache")
+                job.events.put(("done",))
+        except CancelledError:
+            job.events.put(("cancelled",))
+        except Exception as e:
+            logging.error(f"Extraction error: {str(e)}")
+            job.events.put(("error", str(e)))
+        finally:
+            job._finished.set()
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
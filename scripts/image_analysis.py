@@ -1,34 +1,63 @@
 import base64
-import io
-from openai import OpenAI
 import logging
+from async_image_analysis import AsyncImageAnalysisService, EventLoopThread, DEFAULT_BASE_URL
+from chunked_analysis import ChunkedAnalyzer
 
 class ImageAnalysisService:
-    def __init__(self, api_key):
-        self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key
+    """
+    Synchronous facade over AsyncImageAnalysisService.
+
+    The async service runs on a private event loop thread, so the GUI keeps
+    calling plain methods while requests share one pooled client with
+    concurrency limiting, rate limiting and retries. Extra keyword arguments
+    (max_concurrency, requests_per_second, max_retries, timeout, ...) are
+    passed through to the async service, including ``blob_store`` for
+    conversations that hold image references. ``chunked_analysis`` holds the
+    ChunkedAnalyzer options used for long chapters.
+    """
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, context_manager=None, response_cache=None,
+                 chunked_analysis=None, **client_options):
+        # base_url can point at a local OpenAI-compatible server (see stub_server.py)
+        self.async_service = AsyncImageAnalysisService(
+            api_key, base_url,
+            context_manager=context_manager,
+            response_cache=response_cache,
+            **client_options
         )
-        self.model = "google/gemini-2.0-flash-thinking-exp:free"
+        self.chunked_analyzer = ChunkedAnalyzer.from_dict(self.async_service, chunked_analysis)
+        self.loop_thread = EventLoopThread()
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+    @property
+    def model(self):
+        return self.async_service.model
+
+    @property
+    def context_manager(self):
+        return self.async_service.context_manager
+
+    @property
+    def response_cache(self):
+        return self.async_service.response_cache
+
     def encode_images_to_base64(self, images):
         """
         Encode a list of images to Base64 format.
 
         Args:
-            images (list): List of file-like objects (BytesIO) containing image data.
+            images (list): EncodedImage objects, or file-like objects (BytesIO) of PNG data.
 
         Returns:
-            list: A list of Base64-encoded strings.
+            list: A list of Base64 data URIs whose MIME type matches each image's format.
         """
         base64_images = []
         for img in images:
             logging.debug("Encoding image to Base64")
             base64_encoded = base64.b64encode(img.getvalue()).decode('utf-8')
-            # Add the prefix for a PNG image
-            base64_images.append(f"data:image/png;base64,{base64_encoded}")
-            logging.debug(f"Image encoded: {base64_images[-1][:50]}...")  # Log first 50 chars
+            mime_type = getattr(img, "mime_type", "image/png")
+            base64_images.append(f"data:{mime_type};base64,{base64_encoded}")
+            logging.debug("Image encoded: %.50s...", base64_images[-1])  # Log first 50 chars
         return base64_images
 
     def analyze_images(self, base64_images):
@@ -45,41 +74,22 @@ class ImageAnalysisService:
         Returns:
             str: Combined response for all images.
         """
-        try:
-            # Choose the prompt based on the number of images provided
-            prompt_text = "What's in this image?" if len(base64_images) == 1 else "What's in these images?"
-            
-            content = [{"type": "text", "text": prompt_text}]
-            
-            # Append all images to the content array
-            for image in base64_images:
-                content.append({
-                    "type": "image_url",
-                    "image_url": {"url": image}
-                })
-            
-            messages = [{"role": "user", "content": content}]
-            
-            logging.debug(f"Sending batch message with {len(base64_images)} images")
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages
-            )
-            logging.debug(f"Completion response object for image analysis: {completion}")
-            
-            # Safely extract response content
-            if not completion.choices:
-                return "Error: Empty response from API"
-
-            first_choice = completion.choices[0]
-            if not first_choice.message or not first_choice.message.content:
-                return "Error: Malformed API response"
-
-            return first_choice.message.content
-        
-        except Exception as e:
-            logging.error(f"Error processing batch: {str(e)}")
-            return f"Error: {str(e)}"
+        return self.loop_thread.run(self.async_service.analyze_images(base64_images))
+
+    def analyze_chapter(self, pages, sizes, title, first_page):
+        """
+        Summarise a long chapter in concurrent page windows and merge the notes.
+
+        Args:
+            pages (list): Content parts of each page (see page_content.content_parts).
+            sizes (list): Encoded size in bytes of each page.
+            title (str): Chapter title.
+            first_page (int): 1-based number of the first page.
+
+        Returns:
+            str: Chapter digest.
+        """
+        return self.loop_thread.run(self.chunked_analyzer.analyze(pages, sizes, title, first_page))
 
     def chat_message(self, conversation_history):
         """
@@ -91,19 +101,25 @@ class ImageAnalysisService:
         Returns:
             str: Assistant's response.
         """
+        return self.loop_thread.run(self.async_service.chat_message(conversation_history))
+
+    def stream_chat_message(self, conversation_history, cancel_event=None):
+        """
+        Send a conversation chain to the API in streaming mode.
+
+        Args:
+            conversation_history (list): List of messages (dict) in the conversation.
+            cancel_event (threading.Event): When set, the stream is closed and iteration stops.
+
+        Yields:
+            str: Pieces of the assistant's response as they arrive.
+        """
+        stream = self.async_service.stream_chat_message(conversation_history, cancel_event)
         try:
-            logging.debug("Sending conversation history to API.")
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=conversation_history
-            )
-            logging.debug(f"Chat completion response: {completion}")
-            if not completion.choices:
-                return "Error: Empty response from API"
-            first_choice = completion.choices[0]
-            if not first_choice.message or not first_choice.message.content:
-                return "Error: Malformed API response"
-            return first_choice.message.content
-        except Exception as e:
-            logging.error(f"Error during chat: {str(e)}")
-            return f"Error: {str(e)}"
+            while True:
+                try:
+                    yield self.loop_thread.run(stream.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.loop_thread.run(stream.aclose())
@@ -0,0 +1,257 @@
+"""
+The set of books the viewer knows about.
+
+``Catalogue`` persists what is needed to browse a library without opening
+its files: content hash, page count, title and table of contents, keyed by
+path and checked against the file's size and modification time.
+``DocumentPool`` keeps the most recently used books open, so switching
+between a textbook and its solutions manual does not reopen or re-index
+either one:
+
+    pool = DocumentPool(4, disk_cache, render_cache, Catalogue())
+    document = pool.open("physics.pdf")
+    pool.open("solutions.epub")
+    pool.open("physics.pdf") is document  # still open, page and zoom kept
+
+Anything PyMuPDF opens can be added; EPUB and the other reflowable formats
+are laid out with its default page size, the same in every process.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from blob_store import default_data_dir
+from disk_cache import document_digest
+from document import Document, open_document
+from metrics import inc
+
+BOOK_EXTENSIONS = (".pdf", ".epub", ".xps", ".fb2", ".cbz", ".mobi")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS books ("
+    " path TEXT PRIMARY KEY, digest TEXT, title TEXT, format TEXT, page_count INTEGER, toc TEXT,"
+    " size INTEGER, mtime_ns INTEGER, added REAL, opened REAL)",
+    "CREATE INDEX IF NOT EXISTS books_digest ON books (digest)",
+)
+
+
+class CatalogueEntry:
+    """Catalogued metadata of one book file; ``toc`` is [level, title, page] as returned by get_toc()."""
+
+    __slots__ = ("path", "digest", "title", "format", "page_count", "toc", "opened")
+
+    def __init__(self, path, digest, title, format, page_count, toc, opened=None):
+        self.path = path
+        self.digest = digest
+        self.title = title
+        self.format = format
+        self.page_count = page_count
+        self.toc = toc
+        self.opened = opened
+
+    def __repr__(self):
+        return f"CatalogueEntry({self.title!r}, {self.format}, {self.page_count} pages)"
+
+
+def book_title(doc, path):
+    """The document's own title, else its file name."""
+    title = (doc.metadata or {}).get("title") or ""
+    return title.strip() or os.path.splitext(os.path.basename(path))[0]
+
+
+def book_format(doc, path):
+    return (doc.metadata or {}).get("format") or os.path.splitext(path)[1].lstrip(".").upper()
+
+
+class Catalogue:
+    """
+    Persistent book metadata (SQLite, ``library.sqlite`` in the data directory).
+
+    Args:
+        path (str): Database file; defaults to <data dir>/library.sqlite.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            directory = default_data_dir()
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, "library.sqlite")
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def _entry(self, row):
+        path, digest, title, fmt, page_count, toc, opened = row
+        return CatalogueEntry(path, digest, title, fmt, page_count, json.loads(toc), opened)
+
+    def get(self, path):
+        """Entry for a file, or None if it is not catalogued or has changed since."""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, digest, title, format, page_count, toc, opened FROM books"
+                " WHERE path = ? AND size = ? AND mtime_ns = ?", (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        return self._entry(row) if row else None
+
+    def books(self):
+        """Every catalogued book, most recently opened first, then by title."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, digest, title, format, page_count, toc, opened FROM books"
+                " ORDER BY opened IS NULL, opened DESC, title COLLATE NOCASE").fetchall()
+        return [self._entry(row) for row in rows]
+
+    def record(self, path, digest, doc, opened=False):
+        """
+        Catalogue an open fitz document.
+
+        Args:
+            path (str): File the document was opened from.
+            digest (str): Its content hash.
+            doc (fitz.Document): The open document.
+            opened (bool): Mark it as opened in the viewer just now.
+
+        Returns:
+            CatalogueEntry: What was stored.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = CatalogueEntry(path, digest, book_title(doc, path), book_format(doc, path), len(doc),
+                               doc.get_toc(), time.time() if opened else None)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO books (path, digest, title, format, page_count, toc, size, mtime_ns, added, opened)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(path) DO UPDATE SET digest = excluded.digest, title = excluded.title,"
+                " format = excluded.format, page_count = excluded.page_count, toc = excluded.toc,"
+                " size = excluded.size, mtime_ns = excluded.mtime_ns,"
+                " opened = COALESCE(excluded.opened, books.opened)",
+                (path, digest, entry.title, entry.format, entry.page_count, json.dumps(entry.toc),
+                 stat.st_size, stat.st_mtime_ns, time.time(), entry.opened))
+        return entry
+
+    def touch(self, path):
+        """Mark a catalogued book as opened now."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE books SET opened = ? WHERE path = ?", (time.time(), os.path.abspath(path)))
+
+    def forget(self, path):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM books WHERE path = ?", (os.path.abspath(path),))
+
+    def scan(self, directory, disk_cache=None, on_progress=None):
+        """
+        Catalogue every book under a directory that is new or changed.
+
+        Each file is opened just long enough to read its page count and
+        table of contents. Meant for a background thread; ``on_progress(done,
+        total)`` is called after each file.
+
+        Returns:
+            int: Number of files catalogued.
+        """
+        paths = []
+        for folder, _, names in os.walk(directory):
+            paths.extend(os.path.join(folder, name) for name in sorted(names)
+                         if name.lower().endswith(BOOK_EXTENSIONS))
+        added = 0
+        for done, path in enumerate(paths, 1):
+            if self.get(path) is None:
+                try:
+                    doc = open_document(path)
+                    try:
+                        self.record(path, document_digest(path, disk_cache), doc)
+                    finally:
+                        doc.close()
+                    added += 1
+                except Exception as e:
+                    logging.warning(f"Could not catalogue {path}: {str(e)}")
+            if on_progress is not None:
+                on_progress(done, len(paths))
+        logging.info(f"Catalogued {added} of {len(paths)} books in {directory}")
+        return added
+
+
+class DocumentPool:
+    """
+    Bounded LRU of open Documents, keyed by content hash.
+
+    Each pooled Document keeps its chapter index and the page and zoom it
+    was left at; its rendered pages stay in the shared render cache under
+    its hash. When the pool is full the least recently used document is
+    closed.
+
+    Args:
+        capacity (int): Documents kept open at once.
+        disk_cache (DiskCache): Passed to each Document.
+        render_cache (RenderCache): Shared in-memory render cache.
+        catalogue (Catalogue): Updated on every open; its stored TOC is reused.
+    """
+
+    def __init__(self, capacity=4, disk_cache=None, render_cache=None, catalogue=None):
+        self.capacity = max(1, capacity)
+        self.disk_cache = disk_cache
+        self.render_cache = render_cache
+        self.catalogue = catalogue
+        self._documents = OrderedDict()  # digest -> Document, least recently used first
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, digest):
+        return digest in self._documents
+
+    def documents(self):
+        """Open documents, most recently used first."""
+        return list(reversed(self._documents.values()))
+
+    def open(self, path):
+        """The Document for a file, reusing the open one when its content is already pooled."""
+        entry = self.catalogue.get(path) if self.catalogue is not None else None
+        digest = entry.digest if entry is not None else document_digest(path, self.disk_cache)
+        document = self._documents.get(digest)
+        if document is not None:
+            inc("library_open", result="pooled")
+            self._documents.move_to_end(digest)
+            if self.catalogue is not None:
+                self.catalogue.touch(path)
+            return document
+
+        inc("library_open", result="opened")
+        document = Document(path, self.disk_cache, self.render_cache, toc=entry.toc if entry is not None else None,
+                            digest=digest)
+        if self.catalogue is not None:
+            try:
+                with document.lock:
+                    self.catalogue.record(path, document.digest, document.doc, opened=True)
+            except Exception as e:
+                logging.warning(f"Could not catalogue {path}: {str(e)}")
+        self._documents[document.digest] = document
+        while len(self._documents) > self.capacity:
+            _, evicted = self._documents.popitem(last=False)
+            logging.info(f"Closing least recently used book {evicted.path}")
+            evicted.close()
+        return document
+
+    def previous(self):
+        """The document used before the most recent one, or None."""
+        if len(self._documents) < 2:
+            return None
+        return self.documents()[1]
+
+    def close(self):
+        for document in self._documents.values():
+            document.close()
+        self._documents.clear()
@@ -2,33 +2,61 @@ import tkinter as tk
 from tkinter import messagebox, scrolledtext
 import os
 from pdf_viewer import PDFViewer
-from image_analysis import ImageAnalysisService
+from image_analysis import ImageAnalysisService, DEFAULT_BASE_URL
+from encoding import EncodingSettings
+from disk_cache import DiskCache
+from context_manager import ContextManager
+from response_cache import ResponseCache
+from chunked_analysis import digest_message, has_digest
+from blob_store import BlobStore
+from session_store import SessionStore
+from retrieval import ContextRetriever
+from page_content import TextLayerSettings, PageDeduplicator, content_parts, is_image_only
+from page_hash import DedupSettings
+from speculation import SpeculationSettings
 import logging
-import json
+import queue
+import threading
+from collections import deque
 
 # Import our prompt definitions.
-from prompts import single_page_prompt, chapter_prompt
-
-def load_config(config_path="scripts/config.json"):
-    try:
-        with open(config_path, 'r') as f:
-            config = json.load(f)
-        return config
-    except FileNotFoundError:
-        logging.error(f"Config file not found at {config_path}")
-        return {}
-    except json.JSONDecodeError:
-        logging.error(f"Error decoding JSON from {config_path}")
-        return {}
+from prompts import single_page_prompt, chapter_prompt, single_page_text_prompt, chapter_text_prompt
+from config import load_config
+
+def format_message(msg):
+    """Render a conversation message as a single display line."""
+    sender = "User" if msg["role"] == "user" else "Assistant"
+    content = msg["content"]
+    if isinstance(content, list):
+        # If content is a list, display text parts and summarise images.
+        texts = []
+        image_count = 0
+        for item in content:
+            if item.get("type") == "text":
+                texts.append(item.get("text", ""))
+            elif item.get("type") == "image_url":
+                image_count += 1
+        if image_count == 1:
+            texts.append("[Image]")
+        elif image_count:
+            texts.append(f"[{image_count} Images]")
+        content = " ".join(texts).strip()
+    return f"{sender}: {content}\n"
 
 class ChatWindow(tk.Toplevel):
-    def __init__(self, parent, image_analysis_service, conversation):
+    # Only the most recent messages are kept in the widget, so each update
+    # costs the same however long the session gets.
+    MAX_DISPLAYED_MESSAGES = 200
+
+    def __init__(self, parent, image_analysis_service, conversation, on_message=None):
         super().__init__(parent)
         self.title("Chat with API")
         self.geometry("600x400")
         self.image_analysis_service = image_analysis_service
         # Use the shared conversation chain from the main app.
         self.conversation = conversation
+        # Called with each message this window appends, so the app can persist it.
+        self.on_message = on_message
         
         # Create a scrolled text widget to display the conversation.
         self.chat_display = scrolledtext.ScrolledText(self, wrap=tk.WORD, state=tk.DISABLED)
@@ -39,50 +67,187 @@ class ChatWindow(tk.Toplevel):
         self.message_entry.pack(fill=tk.X, padx=10, pady=(0, 10))
         self.message_entry.bind("<Return>", self.send_message)
         
-        # Send button.
-        self.send_button = tk.Button(self, text="Send", command=self.send_message)
-        self.send_button.pack(pady=(0, 10))
+        # Send and cancel buttons. Cancel is only enabled while a response is streaming.
+        button_frame = tk.Frame(self)
+        button_frame.pack(pady=(0, 10))
+        self.send_button = tk.Button(button_frame, text="Send", command=self.send_message)
+        self.send_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = tk.Button(button_frame, text="Cancel", command=self.cancel_generation, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+
+        # State of the in-flight generation, if any.
+        self.stream_queue = None
+        self.cancel_event = None
+        self.streamed_text = ""
+        self.poll_after_id = None  # Pending poll_stream, cancelled when the stream ends
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Rendered messages are tracked so updates only append what is new.
+        # "committed_end" separates committed messages from the streaming one.
+        self.rendered_count = 0
+        self.rendered_marks = deque()
+        self.chat_display.mark_set("committed_end", tk.END)
+        self.chat_display.mark_gravity("committed_end", tk.LEFT)
         
         self.refresh_chat_display()
     
     def refresh_chat_display(self):
-        """Clear and re-display the entire conversation."""
+        """Append any conversation messages that have not been displayed yet."""
+        total = len(self.conversation)
+        if total < self.rendered_count:
+            self.reset_chat_display()
+        first = max(self.rendered_count, total - self.MAX_DISPLAYED_MESSAGES)
+        if first >= total:
+            return
+
         self.chat_display.config(state=tk.NORMAL)
-        self.chat_display.delete(1.0, tk.END)
-        for msg in self.conversation:
-            sender = "User" if msg["role"] == "user" else "Assistant"
-            content = msg["content"]
-            if isinstance(content, list):
-                # If content is a list, display text parts and indicate images.
-                display_text = ""
-                for item in content:
-                    if item.get("type") == "text":
-                        display_text += item.get("text", "") + " "
-                    elif item.get("type") == "image_url":
-                        display_text += "[Image] "
-                content_str = display_text.strip()
-            else:
-                content_str = content
-            self.chat_display.insert(tk.END, f"{sender}: {content_str}\n")
+        for index in range(first, total):
+            mark = f"msg_{index}"
+            self.chat_display.mark_set(mark, "committed_end")
+            self.chat_display.mark_gravity(mark, tk.LEFT)
+            # Streaming text sits after committed_end, so advance the mark explicitly.
+            self.chat_display.mark_set("insert_point", "committed_end")
+            self.chat_display.mark_gravity("insert_point", tk.RIGHT)
+            self.chat_display.insert("insert_point", format_message(self.conversation[index]))
+            self.chat_display.mark_set("committed_end", "insert_point")
+            self.rendered_marks.append(mark)
+        self.rendered_count = total
+        self.trim_chat_display()
         self.chat_display.config(state=tk.DISABLED)
         self.chat_display.see(tk.END)
-    
+
+    def trim_chat_display(self):
+        """Drop the oldest rendered messages beyond MAX_DISPLAYED_MESSAGES."""
+        while len(self.rendered_marks) > self.MAX_DISPLAYED_MESSAGES:
+            oldest = self.rendered_marks.popleft()
+            self.chat_display.delete("1.0", self.rendered_marks[0])
+            self.chat_display.mark_unset(oldest)
+
+    def reset_chat_display(self):
+        """Clear the display; used when the conversation was shortened or replaced."""
+        self.chat_display.config(state=tk.NORMAL)
+        self.chat_display.delete("1.0", tk.END)
+        for mark in self.rendered_marks:
+            self.chat_display.mark_unset(mark)
+        self.rendered_marks.clear()
+        self.rendered_count = 0
+        self.chat_display.mark_set("committed_end", tk.END)
+        self.chat_display.config(state=tk.DISABLED)
+
     def send_message(self, event=None):
+        if self.cancel_event is not None:
+            return  # A response is still streaming
         user_text = self.message_entry.get().strip()
         if not user_text:
             return
         # Append user's message as a simple text message.
         user_message = {"role": "user", "content": user_text}
         self.conversation.append(user_message)
+        if self.on_message is not None:
+            self.on_message(user_message)
         self.refresh_chat_display()
         self.message_entry.delete(0, tk.END)
         
-        # Get assistant response using the full conversation history.
-        response = self.image_analysis_service.chat_message(self.conversation)
-        assistant_message = {"role": "assistant", "content": response}
-        self.conversation.append(assistant_message)
+        # Stream the assistant response on a worker thread; tokens are handed
+        # back through a queue that the Tk loop polls.
+        self.stream_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.streamed_text = ""
+        self.send_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        worker = threading.Thread(
+            target=self.stream_worker,
+            args=(list(self.conversation), self.stream_queue, self.cancel_event),
+            name="chat-stream",
+            daemon=True
+        )
+        worker.start()
+        self.poll_after_id = self.after(30, self.poll_stream)
+
+    def stream_worker(self, history, stream_queue, cancel_event):
+        """Runs on the worker thread: forwards streamed tokens to the queue."""
+        try:
+            for token in self.image_analysis_service.stream_chat_message(history, cancel_event):
+                stream_queue.put(("token", token))
+            stream_queue.put(("done",))
+        except Exception as e:
+            logging.error(f"Error during chat: {str(e)}")
+            stream_queue.put(("error", f"Error: {str(e)}"))
+
+    def poll_stream(self):
+        """Append any tokens that have arrived, then reschedule until the stream ends."""
+        self.poll_after_id = None
+        if self.stream_queue is None or not self.winfo_exists():
+            return
+        tokens = []
+        finished = None
+        while True:
+            try:
+                event = self.stream_queue.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == "token":
+                tokens.append(event[1])
+            else:
+                finished = event
+                break
+
+        if tokens:
+            self.append_stream_text("".join(tokens))
+        if finished is None:
+            self.poll_after_id = self.after(30, self.poll_stream)
+            return
+
+        if finished[0] == "error" and not self.streamed_text:
+            self.append_stream_text(finished[1])
+        self.finish_stream()
+
+    def append_stream_text(self, text):
+        """Append text to the assistant message currently being streamed."""
+        self.chat_display.config(state=tk.NORMAL)
+        if not self.streamed_text:
+            self.chat_display.insert(tk.END, "Assistant: ")
+        self.chat_display.insert(tk.END, text)
+        self.chat_display.config(state=tk.DISABLED)
+        self.chat_display.see(tk.END)
+        self.streamed_text += text
+
+    def finish_stream(self):
+        """Commit the streamed response to the conversation and re-enable sending."""
+        if self.poll_after_id is not None:
+            # Otherwise a cancelled stream's poll would go on to read the next stream's queue
+            self.after_cancel(self.poll_after_id)
+            self.poll_after_id = None
+        # The in-progress text is replaced by the committed message below.
+        self.chat_display.config(state=tk.NORMAL)
+        self.chat_display.delete("committed_end", tk.END)
+        self.chat_display.config(state=tk.DISABLED)
+        if self.streamed_text:
+            reply = {"role": "assistant", "content": self.streamed_text}
+            self.conversation.append(reply)
+            if self.on_message is not None:
+                self.on_message(reply)
+        self.stream_queue = None
+        self.cancel_event = None
+        self.streamed_text = ""
+        self.send_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
         self.refresh_chat_display()
 
+    def cancel_generation(self):
+        """Abort the in-flight generation; any text received so far is kept."""
+        if self.cancel_event is not None:
+            # The worker closes the HTTP stream in the background; the UI does not wait for it.
+            self.cancel_event.set()
+            self.finish_stream()
+
+    def on_close(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        if self.poll_after_id is not None:
+            self.after_cancel(self.poll_after_id)
+        self.destroy()
+
 class ImageAnalysisApp:
     def __init__(self, root):
         self.root = root
@@ -91,17 +256,51 @@ class ImageAnalysisApp:
         # Load configuration.
         self.config = load_config()
         self.api_key = self.config.get("OPENROUTER_API_KEY")
+        response_cache = ResponseCache.from_dict(self.config.get("RESPONSE_CACHE"))
+        if not self.api_key and response_cache.mode == "replay":
+            self.api_key = "replay"  # Replay never reaches the network
         if not self.api_key:
             logging.error("API key not found in config.json. Please set OPENROUTER_API_KEY.")
             exit()
         
         # Initialize services.
-        self.image_analysis_service = ImageAnalysisService(self.api_key)
-        self.pdf_viewer = PDFViewer(root)
+        base_url = self.config.get("OPENROUTER_BASE_URL", DEFAULT_BASE_URL)
+        context_manager = ContextManager.from_dict(self.config.get("CONTEXT_BUDGET"))
+        # Optional "RETRIEVAL" section: long conversations send recent turns plus the relevant earlier ones.
+        context_manager.retriever = ContextRetriever.from_dict(self.config.get("RETRIEVAL"))
+        # Page images are stored once; the conversation only holds references to them.
+        self.blob_store = BlobStore(self.config.get("BLOB_DIR"))
+        self.image_analysis_service = ImageAnalysisService(self.api_key, base_url, context_manager, response_cache,
+                                                           self.config.get("CHUNKED_ANALYSIS"),
+                                                           blob_store=self.blob_store,
+                                                           **self.config.get("CLIENT", {}))
+        disk_cache = DiskCache(self.config.get("CACHE_DIR"),
+                               self.config.get("DISK_CACHE_BYTES", 2 * 1024 * 1024 * 1024))
+        self.pdf_viewer = PDFViewer(root, disk_cache)
+        self.pdf_viewer.on_document_opened = self.resume_session
+        # Chapters up to this long are sent whole; longer ones are summarised in windows.
+        self.pdf_viewer.MAX_CHAPTER_PAGES = self.image_analysis_service.chunked_analyzer.single_request_pages
+        # Optional "ENCODING" section overrides the page encoding defaults.
+        if self.config.get("ENCODING"):
+            self.pdf_viewer.extraction_engine.settings = EncodingSettings.from_dict(self.config["ENCODING"])
+        # Optional "TEXT_LAYER" section: send text instead of images for pages without figures.
+        self.pdf_viewer.extraction_engine.text_layer = TextLayerSettings.from_dict(self.config.get("TEXT_LAYER"))
+        # Optional "DEDUP" section: blank pages are dropped and images already sent become a short note.
+        self.page_dedup = PageDeduplicator(DedupSettings.from_dict(self.config.get("DEDUP")))
+        # Optional "SPECULATION" section: limits for pre-extracting the chapter being read.
+        self.pdf_viewer.speculator.settings = SpeculationSettings.from_dict(self.config.get("SPECULATION"))
+        analyzer = self.image_analysis_service.chunked_analyzer
+        self.pdf_viewer.speculation_budget_pages = (
+            lambda page_count: analyzer.window_images if analyzer.needs_chunking(page_count) else None)
         
-        # Conversation chain to store analysis and chat messages.
+        # Conversation chain to store analysis and chat messages. It is saved
+        # per book in the session store and resumed when the book is reopened.
         self.conversation = []
+        self.session_store = SessionStore.from_dict(self.config.get("SESSIONS"))
+        self.session_id = None
+        self.book = None
         self.chat_window = None
+        self.digest_running = False
         
         self.create_widgets()
         self.pdf_viewer.chapter_mode.trace("w", self.update_analyze_button_text)
@@ -119,6 +318,13 @@ class ImageAnalysisApp:
                                   text="Chat with API",
                                   command=self.open_chat_window)
         self.chat_btn.pack(pady=10)
+
+        # New session button – starts an empty conversation for the open book.
+        self.new_session_btn = tk.Button(self.root,
+                                         text="New Session",
+                                         command=self.new_session,
+                                         state=tk.DISABLED)
+        self.new_session_btn.pack(pady=10)
     
     def update_analyze_button_text(self, *args):
         if self.pdf_viewer.chapter_mode.get():
@@ -130,32 +336,152 @@ class ImageAnalysisApp:
         """
         Instead of requesting a description from the LLM (since the user already sees the image),
         add a context-only message to the conversation chain using the appropriate prompt.
+        Extraction runs in the background; the context is added once it completes.
+        Chapters longer than MAX_CHAPTER_PAGES are summarised instead (see analyze_long_chapter).
+        """
+        analyzer = self.image_analysis_service.chunked_analyzer
+        if self.pdf_viewer.chapter_mode.get() and self.pdf_viewer.document:
+            chapter = self.pdf_viewer.current_chapter()
+            if chapter and analyzer.needs_chunking(chapter['end'] - chapter['start'] + 1):
+                self.analyze_long_chapter(chapter)
+                return
+        self.pdf_viewer.extract_content(on_complete=self.add_extraction_context)
+
+    def analyze_long_chapter(self, chapter):
+        """
+        Extract a long chapter, summarise it window by window in the background,
+        and add the merged digest to the conversation in place of the page images.
         """
-        images = self.pdf_viewer.extract_content()
+        first_page, last_page = chapter['start'] + 1, chapter['end'] + 1
+        if has_digest(self.conversation, chapter['title'], first_page, last_page):
+            messagebox.showinfo("Context Unchanged", "This chapter's digest is already in the conversation chain.")
+            return
+        if self.digest_running:
+            messagebox.showinfo("Info", "A chapter is already being summarised")
+            return
+        analyzer = self.image_analysis_service.chunked_analyzer
+        self.pdf_viewer.extract_current_chapter(
+            on_complete=lambda images: self.start_digest(chapter, images),
+            max_pages=analyzer.max_chapter_pages,
+            budget_pages=analyzer.window_images
+        )
+
+    def start_digest(self, chapter, images):
         if not images:
             messagebox.showinfo("Info", "No images to analyze.")
             return
+        # Digest requests do not carry the conversation, so only repeats within the chapter are marked
+        images, skipped = PageDeduplicator(self.page_dedup.settings).filter(images)
+        if skipped['blank'] or skipped['repeated']:
+            logging.info(f"Digest of {chapter['title']}: {skipped['blank']} blank pages skipped "
+                         f"({skipped['bytes_skipped'] / 1024:.0f} KB), {skipped['repeated']} repeated images "
+                         f"({skipped['repeated_bytes'] / 1024:.0f} KB)")
+        if not images:
+            messagebox.showinfo("Info", f"Every page of {chapter['title']} is blank; nothing to analyze.")
+            return
+        pages = [content_parts(item, self.blob_store) for item in images]
+        sizes = [item.size for item in images]
+        result_queue = queue.Queue()
+        threading.Thread(target=self.digest_worker, args=(chapter, pages, sizes, result_queue),
+                         daemon=True).start()
+        self.digest_running = True
+        self.digest_session = (self.session_id, self.book)
+        self.analyze_btn.config(state=tk.DISABLED, text="Summarising Chapter...")
+        self.root.after(200, self.poll_digest, chapter, result_queue)
+
+    def digest_worker(self, chapter, pages, sizes, result_queue):
+        """Runs in a background thread; the result is posted back for the Tk loop."""
         try:
-            base64_images = self.image_analysis_service.encode_images_to_base64(images)
-            
-            # Select the appropriate prompt based on extraction mode.
-            prompt_text = chapter_prompt if self.pdf_viewer.chapter_mode.get() else single_page_prompt
+            digest = self.image_analysis_service.analyze_chapter(
+                pages, sizes, chapter['title'], chapter['start'] + 1)
+            result_queue.put(("done", digest))
+        except Exception as e:
+            logging.error(f"Chapter digest error: {str(e)}")
+            result_queue.put(("error", str(e)))
+
+    def poll_digest(self, chapter, result_queue):
+        try:
+            kind, value = result_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(200, self.poll_digest, chapter, result_queue)
+            return
+
+        self.digest_running = False
+        self.analyze_btn.config(state=tk.NORMAL)
+        self.update_analyze_button_text()
+        if kind == "error" or value.startswith("Error:"):
+            messagebox.showerror("Error", f"Chapter analysis failed:\n{value}")
+            return
+
+        message = digest_message(chapter['title'], chapter['start'] + 1, chapter['end'] + 1, value)
+        session_id, book = self.digest_session
+        if book != self.book:
+            # Another book was opened meanwhile; the digest goes to the session it was made for
+            self.session_store.append_message(session_id, book, message, "digest", chapter)
+            self.session_store.record_progress(book, chapter, "summarised", contexts=1)
+            logging.info(f"Digest of {chapter['title']} saved to its book's session")
+            return
+
+        self.conversation.append(message)
+        self.record_message(message, "digest", chapter)
+        self.session_store.record_progress(self.book, chapter, "summarised", contexts=1)
+        messagebox.showinfo("Context Updated",
+                            f"A digest of {chapter['title']} ({len(value)} characters) "
+                            f"has been added to the conversation chain.")
+        if self.chat_window is not None:
+            self.chat_window.refresh_chat_display()
+
+    def add_extraction_context(self, images):
+        """Encode extracted pages and append them to the conversation as a context message."""
+        if not images:
+            messagebox.showinfo("Info", "No images to analyze.")
+            return
+        try:
+            # Select the appropriate prompt based on extraction mode and on
+            # whether pages were sent as images or as their text layer.
+            if is_image_only(images):
+                prompt_text = chapter_prompt if self.pdf_viewer.chapter_mode.get() else single_page_prompt
+            else:
+                prompt_text = chapter_text_prompt if self.pdf_viewer.chapter_mode.get() else single_page_text_prompt
             
             # Build a conversation message for the context.
-            analysis_context_message = {
-                "role": "user",
-                "content": [{"type": "text", "text": prompt_text}]
-            }
-            for img_str in base64_images:
-                analysis_context_message["content"].append({
-                    "type": "image_url",
-                    "image_url": {"url": img_str}
-                })
-            
+            def context_message(items):
+                content = [{"type": "text", "text": prompt_text}]
+                for item in items:
+                    content.extend(content_parts(item, self.blob_store))
+                return {"role": "user", "content": content}
+
+            # Analysing the same pages twice would only resend the same images.
+            if self.image_analysis_service.context_manager.has_context(self.conversation, context_message(images)):
+                messagebox.showinfo("Context Unchanged", "These pages are already in the conversation chain.")
+                return
+
+            # Blank pages are dropped; images sent earlier in this session are marked as repeats.
+            images, skipped = self.page_dedup.filter(images)
+            if not images:
+                messagebox.showinfo("Context Unchanged", "All selected pages are blank.")
+                return
+            analysis_context_message = context_message(images)
+
             # Append the context message to the conversation chain.
             self.conversation.append(analysis_context_message)
+            chapter = self.pdf_viewer.current_chapter()
+            self.record_message(analysis_context_message, "context", chapter)
+            if chapter:
+                self.session_store.record_progress(self.book, chapter, "studied", contexts=1)
             
-            messagebox.showinfo("Context Updated", "Analysis context has been added to the conversation chain.")
+            summary = "Analysis context has been added to the conversation chain."
+            if skipped['blank']:
+                logging.info(f"Context: {skipped['blank']} blank pages skipped ({skipped['bytes_skipped'] / 1024:.0f} KB)")
+                summary += (f"\n\nSkipped {skipped['blank']} blank pages "
+                            f"({skipped['bytes_skipped'] / 1024:.0f} KB not sent).")
+            if skipped['repeated']:
+                logging.info(f"Context: {skipped['repeated']} repeated images marked "
+                             f"({skipped['repeated_bytes'] / 1024:.0f} KB)")
+                summary += (f"\n\n{skipped['repeated']} images were shown earlier and are sent as a note "
+                            f"while the earlier page is still in the conversation "
+                            f"({skipped['repeated_bytes'] / 1024:.0f} KB).")
+            messagebox.showinfo("Context Updated", summary)
             
             # Refresh the chat window (if open) to reflect the new context.
             if self.chat_window is not None:
@@ -165,10 +491,54 @@ class ImageAnalysisApp:
             messagebox.showerror("Error", f"Analysis failed:\n{str(e)}")
             logging.error(f"Analysis error: {str(e)}")
     
+    def resume_session(self, document):
+        """Load the latest session for a newly opened book (or start one) into the conversation."""
+        self.session_store.open_book(document.digest, document.path)
+        previous_book, self.book = self.book, document.digest
+        self.session_id, messages = self.session_store.resume(self.book)
+        self.page_dedup.reset()
+        if messages:
+            self.conversation[:] = messages
+            logging.info(f"Resumed session with {len(messages)} messages")
+        elif previous_book is None:
+            # Anything said before a book was opened becomes the start of its session.
+            for message in self.conversation:
+                self.session_store.append_message(self.session_id, self.book, message)
+        else:
+            # Switched from another book in the library
+            self.conversation.clear()
+        self.new_session_btn.config(state=tk.NORMAL)
+        self.reset_chat_window()
+
+    def new_session(self):
+        if self.book is None:
+            return
+        self.session_id = self.session_store.start_session(self.book)
+        self.conversation.clear()
+        self.page_dedup.reset()
+        self.reset_chat_window()
+
+    def reset_chat_window(self):
+        if self.chat_window is not None and tk.Toplevel.winfo_exists(self.chat_window):
+            self.chat_window.reset_chat_display()
+            self.chat_window.refresh_chat_display()
+
+    def record_message(self, message, kind="chat", chapter=None):
+        """Queue a message appended to the conversation for the session store."""
+        if self.session_id is not None:
+            self.session_store.append_message(self.session_id, self.book, message, kind, chapter)
+
+    def on_chat_message(self, message):
+        chapter = self.pdf_viewer.current_chapter() if self.pdf_viewer.document else None
+        self.record_message(message, "chat", chapter)
+        if chapter and message["role"] == "user" and self.book is not None:
+            self.session_store.record_progress(self.book, chapter, questions=1)
+
     def open_chat_window(self):
         """Open (or raise) the chat window that shares the conversation chain."""
         if self.chat_window is None or not tk.Toplevel.winfo_exists(self.chat_window):
-            self.chat_window = ChatWindow(self.root, self.image_analysis_service, self.conversation)
+            self.chat_window = ChatWindow(self.root, self.image_analysis_service, self.conversation,
+                                          self.on_chat_message)
         else:
             self.chat_window.lift()
 
@@ -177,3 +547,7 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = ImageAnalysisApp(root)
     root.mainloop()
+    app.pdf_viewer.profiler.stop()
+    app.pdf_viewer.speculator.shutdown()
+    app.pdf_viewer.library.close()
+    app.session_store.close()
@@ -0,0 +1,71 @@
+"""
+Measure cold import time and import-time memory of the entry points.
+
+Each module is imported in a fresh interpreter, so results are not skewed by
+modules already loaded:
+
+    python scripts/measure_startup.py
+    python scripts/measure_startup.py --json startup.json --repeat 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODULES = ["mainbappe", "pdf_viewer", "batch_cli", "document", "image_analysis"]
+HEAVY_MODULES = ["tkinter", "fitz", "PIL", "openai", "httpx", "numpy"]
+
+PROBE = """
+import json, sys, time, tracemalloc
+tracemalloc.start()
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+current, peak = tracemalloc.get_traced_memory()
+print(json.dumps({{
+    "seconds": elapsed,
+    "peak_bytes": peak,
+    "modules": len(sys.modules),
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(module, repeat):
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=SCRIPTS_DIR, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            return {"module": module, "error": result.stderr.strip().splitlines()[-1]}
+        runs.append(json.loads(result.stdout))
+    best = min(runs, key=lambda r: r["seconds"])
+    best["module"] = module
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import-time cost of the entry points")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module; the fastest is reported")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = [measure(m, args.repeat) for m in args.modules]
+    for r in results:
+        if "error" in r:
+            print(f"{r['module']:<16} failed: {r['error']}")
+        else:
+            print(f"{r['module']:<16} {r['seconds'] * 1000:7.1f} ms  {r['peak_bytes'] / 2**20:6.2f} MB  "
+                  f"{r['modules']:4d} modules  heavy: {', '.join(r['heavy']) or '-'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Lightweight in-process metrics: timing spans, histograms and counters.
+
+Hot paths record into the module-level registry:
+
+    with span("page_render"):
+        ...
+    inc("llm_completion_tokens", usage.completion_tokens)
+
+A snapshot can be exported on request as JSON or in the Prometheus text
+format. Worker processes record into a private registry (see ``collecting``)
+and ship its state back to be merged into the parent's.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds; the last bucket is +Inf.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())) if labels else ())
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum, min and max."""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (an estimate)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class Metrics:
+    """Thread-safe registry of counters and histograms, keyed by name and labels."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Time the block into the ``<name>_seconds`` histogram; failures also count ``<name>_errors``."""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(f"{name}_errors", **labels)
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - started, **labels)
+
+    def state(self):
+        """Picklable copy of the raw data, for merging into another registry."""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {k: (h.counts[:], h.count, h.sum, h.min, h.max) for k, h in self.histograms.items()},
+            }
+
+    def merge(self, state):
+        with self._lock:
+            for key, value in state['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, (counts, count, total, low, high) in state['histograms'].items():
+                other = Histogram()
+                other.counts, other.count, other.sum, other.min, other.max = counts, count, total, low, high
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.merge(other)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        """JSON-ready view of every metric."""
+        with self._lock:
+            def entry(key, value):
+                return {'name': key[0], 'labels': dict(key[1]), **value}
+            return {
+                'started': self.started,
+                'taken': time.time(),
+                'counters': [entry(k, {'value': v}) for k, v in sorted(self.counters.items())],
+                'histograms': [entry(k, h.to_dict()) for k, h in sorted(self.histograms.items())],
+            }
+
+    def to_prometheus(self, prefix="edu_"):
+        """Metrics in the Prometheus text exposition format."""
+        def labels(pairs, extra=()):
+            items = list(pairs) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted({k[0] for k in self.counters}):
+                lines.append(f"# TYPE {prefix}{name}_total counter")
+                for key, value in sorted(self.counters.items()):
+                    if key[0] == name:
+                        lines.append(f"{prefix}{name}_total{labels(key[1])} {value}")
+            for name in sorted({k[0] for k in self.histograms}):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for key, h in sorted(self.histograms.items()):
+                    if key[0] != name:
+                        continue
+                    cumulative = 0
+                    for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                        cumulative += n
+                        lines.append(f"{prefix}{name}_bucket{labels(key[1], [('le', bound)])} {cumulative}")
+                    lines.append(f"{prefix}{name}_sum{labels(key[1])} {h.sum}")
+                    lines.append(f"{prefix}{name}_count{labels(key[1])} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write a snapshot to path: Prometheus text for .prom/.txt, JSON otherwise."""
+        if path.endswith((".prom", ".txt")):
+            data = self.to_prometheus()
+        else:
+            data = json.dumps(self.snapshot(), indent=2)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
+        logging.info("Metrics written to %s", path)
+
+
+_registry = Metrics()
+
+
+def registry():
+    return _registry
+
+
+def inc(name, value=1, **labels):
+    _registry.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    _registry.observe(name, value, **labels)
+
+
+def span(name, **labels):
+    return _registry.span(name, **labels)
+
+
+@contextmanager
+def collecting():
+    """
+    Record into a fresh registry for the duration of the block and yield it.
+
+    Meant for single-threaded worker processes, whose metrics would otherwise
+    never reach the parent: return ``registry.state()`` with the result and
+    merge it on the other side.
+    """
+    global _registry
+    previous, _registry = _registry, Metrics()
+    try:
+        yield _registry
+    finally:
+        _registry = previous
+
+
+class SessionProfiler:
+    """
+    Optional cProfile and tracemalloc recording for one session.
+
+    Enabled from the GUI's View menu, with ``--profile`` in batch_cli, or at
+    startup by setting EDU_PROFILE=1. ``stop`` writes ``profile.pstats`` and
+    ``memory.txt`` (top allocation sites) to the output directory.
+    """
+
+    def __init__(self, directory="profile", memory=True):
+        self.directory = directory
+        self.memory = memory
+        self._profile = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self):
+        import cProfile
+        import tracemalloc
+        if self.running:
+            return
+        if self.memory:
+            tracemalloc.start(10)
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        logging.info("Profiling started")
+
+    def stop(self, top=30):
+        """Stop recording and write the results; returns the output directory."""
+        import tracemalloc
+        if not self.running:
+            return None
+        self._profile.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        self._profile.dump_stats(os.path.join(self.directory, "profile.pstats"))
+        self._profile = None
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(os.path.join(self.directory, "memory.txt"), "w", encoding="utf-8") as f:
+                f.write(f"Current: {current / 2**20:.1f} MB  Peak: {peak / 2**20:.1f} MB\n\n")
+                for stat in snapshot.statistics("lineno")[:top]:
+                    f.write(f"{stat}\n")
+        logging.info("Profile written to %s", self.directory)
+        return self.directory
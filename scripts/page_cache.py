@@ -0,0 +1,140 @@
+import logging
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+    """
+    Thread-safe LRU cache of rendered pages, bounded by a memory budget in bytes.
+
+    Keys are (document, page, zoom) tuples, optionally followed by a tile
+    column and row. Each entry records its size so the
+    total stays under ``max_bytes``; the least recently used pages are evicted first.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key (marking it recently used), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def contains(self, key):
+        """Check for key without touching the hit/miss counters or the LRU order."""
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, value, size):
+        """Store value under key and evict old entries until the budget is met."""
+        if size > self.max_bytes:
+            logging.debug(f"Not caching {key}: {size} bytes exceeds the whole budget")
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Return the counters used to tune the memory budget."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class PagePrefetcher:
+    """
+    Background worker that renders keys ahead of need into a cache.
+
+    ``cache`` is anything with ``contains(key)`` and ``put(key, value, size)``:
+    the viewer's RenderCache for pages and tiles, or a thumbnails.ThumbnailStore.
+    It may be set later, before the first ``schedule``. ``render_fn(key)`` must
+    return a ``(value, size)`` tuple, or None if the key is no longer relevant
+    (e.g. the document was closed). Calling ``schedule`` replaces any pending
+    work, so pages the user has already moved away from are never rendered.
+    ``on_rendered(key)``, if given, is called from the worker thread after
+    each new entry is cached.
+
+    Args:
+        name (str): Name of the worker thread, to tell prefetchers apart.
+    """
+
+    def __init__(self, cache, render_fn, on_rendered=None, name="page-prefetch"):
+        self.cache = cache
+        self.render_fn = render_fn
+        self.on_rendered = on_rendered
+        self.name = name
+        self._pending = []
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, keys):
+        with self._condition:
+            self._pending = [k for k in keys if not self.cache.contains(k)]
+            self._condition.notify()
+
+    def cancel(self):
+        with self._condition:
+            self._pending = []
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._pending = []
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                key = self._pending.pop(0)
+
+            if self.cache.contains(key):
+                continue
+            try:
+                result = self.render_fn(key)
+            except Exception as e:
+                logging.warning(f"Prefetch of {key} failed: {str(e)}")
+                continue
+            if result is not None:
+                value, size = result
+                self.cache.put(key, value, size)
+                logging.debug(f"{self.name}: prefetched {key[1:]}")
+                if self.on_rendered is not None:
+                    self.on_rendered(key)
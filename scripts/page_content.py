@@ -0,0 +1,288 @@
+import base64
+import hashlib
+import json
+import logging
+import struct
+
+from encoding import EncodedImage, encode_image
+from metrics import inc
+from page_hash import DedupSettings, pixmap_hash
+from rendering import render_pixmap, pixmap_to_image
+
+
+class TextLayerSettings:
+    """
+    Thresholds deciding whether a page is sent as text, as an image, or as
+    text plus cropped figures.
+
+    Args:
+        enabled (bool): When False every page is sent as an image.
+        min_text_chars (int): Pages with less extractable text are sent as images (scans, full-page figures).
+        max_image_coverage (float): Pages whose embedded images cover more than this fraction are sent as images.
+        max_drawings (int): Pages with more vector paths than this are sent as images (dense diagrams, drawn maths).
+        min_figure_area (float): Smallest figure, as a fraction of the page area, that is cropped and sent.
+        figure_margin (float): Points added around figures; drawings closer than this are merged into one figure.
+    """
+
+    def __init__(self, enabled=True, min_text_chars=200, max_image_coverage=0.6, max_drawings=400,
+                 min_figure_area=0.01, figure_margin=6.0):
+        self.enabled = enabled
+        self.min_text_chars = min_text_chars
+        self.max_image_coverage = max_image_coverage
+        self.max_drawings = max_drawings
+        self.min_figure_area = min_figure_area
+        self.figure_margin = figure_margin
+
+    @classmethod
+    def from_dict(cls, values):
+        """Build from the optional "TEXT_LAYER" config section."""
+        return cls(**(values or {}))
+
+    def to_dict(self):
+        return {
+            'enabled': self.enabled,
+            'min_text_chars': self.min_text_chars,
+            'max_image_coverage': self.max_image_coverage,
+            'max_drawings': self.max_drawings,
+            'min_figure_area': self.min_figure_area,
+            'figure_margin': self.figure_margin,
+        }
+
+
+class PageContent:
+    """
+    What is sent for one page: its text layer and/or images.
+
+    ``kind`` is "text" (text only), "image" (one rendered page, no text) or
+    "mixed" (text plus cropped figure regions).
+
+    ``repeats`` maps the index of an image that was already sent to
+    (sha256 of the original, note to send instead); see PageDeduplicator.
+    It belongs to one conversation and is not cached.
+    """
+
+    def __init__(self, page_num, kind, text="", images=(), repeats=None):
+        self.page_num = page_num
+        self.kind = kind
+        self.text = text
+        self.images = list(images)
+        self.repeats = repeats or {}
+
+    @property
+    def size(self):
+        return len(self.text.encode("utf-8")) + sum(img.size for img in self.images)
+
+    def to_bytes(self):
+        """Serialise for the disk cache."""
+        blobs = [img.to_bytes() for img in self.images]
+        header = json.dumps({
+            'page': self.page_num, 'kind': self.kind, 'text': self.text, 'sizes': [len(b) for b in blobs],
+        }).encode("utf-8")
+        return struct.pack("!I", len(header)) + header + b"".join(blobs)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        (header_length,) = struct.unpack_from("!I", blob)
+        offset = struct.calcsize("!I")
+        header = json.loads(blob[offset:offset + header_length].decode("utf-8"))
+        offset += header_length
+        images = []
+        for size in header['sizes']:
+            images.append(EncodedImage.from_bytes(blob[offset:offset + size]))
+            offset += size
+        return cls(header['page'], header['kind'], header['text'], images)
+
+    def __repr__(self):
+        return (f"PageContent(page {self.page_num + 1}, {self.kind}, {len(self.text)} chars, "
+                f"{len(self.images)} images, {self.size} bytes)")
+
+
+def _merge_rects(rects, margin):
+    """Union rectangles that overlap once grown by margin, until none do."""
+    clusters = []
+    for rect in rects:
+        grown = rect + (-margin, -margin, margin, margin)
+        merged = True
+        while merged:
+            merged = False
+            for i, cluster in enumerate(clusters):
+                if grown.intersects(cluster):
+                    grown |= clusters.pop(i)
+                    merged = True
+                    break
+        clusters.append(grown)
+    return clusters
+
+
+def classify_page(page, settings):
+    """
+    Decide how to send a page, from its text blocks, image blocks and drawings.
+
+    Args:
+        page (fitz.Page): The page to inspect.
+        settings (TextLayerSettings): Classification thresholds.
+
+    Returns:
+        tuple: (kind, text, figure rectangles in page units).
+    """
+    import fitz
+    page_rect = page.rect
+    page_area = max(1.0, page_rect.width * page_rect.height)
+
+    # (x0, y0, x1, y1, text, block_no, block_type); type 0 is a text block
+    blocks = page.get_text("blocks", sort=True)
+    text = "\n".join(b[4].strip() for b in blocks if b[6] == 0 and b[4].strip())
+    # Image placements only; the image data itself is not decoded
+    image_rects = [fitz.Rect(info["bbox"]) & page_rect for info in page.get_image_info()]
+    image_coverage = sum(r.width * r.height for r in image_rects) / page_area
+
+    if len(text) < settings.min_text_chars or image_coverage > settings.max_image_coverage:
+        return "image", "", []
+    drawings = page.get_drawings()
+    if len(drawings) > settings.max_drawings:
+        return "image", "", []
+
+    margin = settings.figure_margin
+    figures = [r & page_rect for r in _merge_rects(image_rects + [d["rect"] for d in drawings], margin)]
+    figures = [r for r in figures if r.width * r.height >= settings.min_figure_area * page_area]
+    return ("mixed" if figures else "text"), text, figures
+
+
+def _render_encoded(doc, page_num, zoom, encoding_settings, byte_budget, clip=None):
+    pix = render_pixmap(doc, page_num, zoom, clip)
+    encoded = encode_image(pixmap_to_image(pix), encoding_settings, byte_budget)
+    encoded.page_num = page_num
+    encoded.phash = pixmap_hash(pix)
+    return encoded
+
+
+def extract_page_content(doc, page_num, zoom, encoding_settings, byte_budget, text_settings):
+    """Classify a page and render only what its kind needs: the full page, its figures, or nothing."""
+    page = doc.load_page(page_num)
+    kind, text, figures = classify_page(page, text_settings)
+    if kind == "image":
+        return PageContent(page_num, kind, images=[_render_encoded(doc, page_num, zoom, encoding_settings, byte_budget)])
+
+    crop_budget = byte_budget // len(figures) if byte_budget and figures else byte_budget
+    crops = [_render_encoded(doc, page_num, zoom, encoding_settings, crop_budget, rect) for rect in figures]
+    logging.debug(f"Page {page_num + 1}: {kind}, {len(text)} chars, {len(crops)} figures")
+    return PageContent(page_num, kind, text, crops)
+
+
+def data_uri(image):
+    return f"data:{image.mime_type};base64,{base64.b64encode(image.getvalue()).decode('utf-8')}"
+
+
+def image_part(image, store=None):
+    """Image content part: a blob reference when a BlobStore is given, else an inline data URI."""
+    if store is not None:
+        return store.put_image(image)
+    return {"type": "image_url", "image_url": {"url": data_uri(image)}}
+
+
+def content_parts(item, store=None):
+    """Chat message content parts for one extracted page (EncodedImage or PageContent)."""
+    if not isinstance(item, PageContent):
+        return [image_part(item, store)]
+    parts = []
+    if item.text:
+        parts.append({"type": "text", "text": f"[Page {item.page_num + 1}]\n{item.text}"})
+    for index, img in enumerate(item.images):
+        part = image_part(img, store)
+        if index in item.repeats:
+            digest, note = item.repeats[index]
+            # Resolved when the request is sent, see context_manager.resolve_repeats
+            part = dict(part, repeat_of={"sha256": digest, "text": note})
+        parts.append(part)
+    return parts
+
+
+def image_digest(image):
+    """sha256 of an encoded image, the name BlobStore gives it."""
+    return hashlib.sha256(image.getvalue()).hexdigest()
+
+
+def is_image_only(items):
+    """True if every extracted page is a plain page image."""
+    return all(not isinstance(item, PageContent) or item.kind == "image" for item in items)
+
+
+class PageDeduplicator:
+    """
+    Drops blank pages and marks images already sent as repeats.
+
+    Blank pages are found from the ink fraction the extraction workers
+    attach to each image (see page_hash.py), so that costs no decoding.
+    Repeats must be byte-identical encodings: perceptual hashes of text
+    pages set in the same layout are often only a few bits apart, and
+    sending a note for a page that merely looks alike would lose its text.
+    Images that pass are remembered until ``reset`` (a new conversation),
+    so a figure reproduced in a later chapter can be sent only once.
+
+    A repeat keeps its image: whether the note goes out instead is decided
+    per request by context_manager.resolve_repeats, which only trusts the
+    note while the original image is part of the same request. Once the
+    original has been trimmed away, or sits in another window of a chunked
+    digest, the image itself is sent again. A mixed page therefore stays
+    mixed even when all its figures repeat.
+
+    Args:
+        settings (DedupSettings): Blank threshold.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or DedupSettings()
+        self._seen = {}  # sha256 of each image sent -> its page number
+
+    def reset(self):
+        self._seen = {}
+
+    def filter(self, items):
+        """
+        Items to send, without blank pages and with repeated images marked.
+
+        Args:
+            items (list): EncodedImage or PageContent per page, in page order.
+
+        Returns:
+            tuple: (items to send, report dict with 'blank' and 'bytes_skipped'
+            for the blank pages dropped, 'repeated' and 'repeated_bytes' for
+            the images marked).
+        """
+        report = {'blank': 0, 'bytes_skipped': 0, 'repeated': 0, 'repeated_bytes': 0}
+        if not self.settings.enabled:
+            return list(items), report
+        kept = []
+        for item in items:
+            page_num = item.page_num
+            whole_page = not isinstance(item, PageContent) or item.kind == "image"
+            if whole_page:
+                image = item if not isinstance(item, PageContent) else item.images[0]
+                # Only whole pages are checked for blankness; a thin line drawing can be mostly paper
+                if image.phash is not None and image.phash.ink < self.settings.blank_ink:
+                    report['blank'] += 1
+                    report['bytes_skipped'] += item.size
+                    inc("pages_skipped", reason="blank")
+                    inc("bytes_skipped", item.size)
+                    continue
+
+            images = item.images if isinstance(item, PageContent) else [item]
+            repeats = {}
+            for index, image in enumerate(images):
+                digest = image_digest(image)
+                if digest not in self._seen:
+                    self._seen[digest] = page_num
+                    continue
+                what = "same as" if whole_page else "figure repeated from"
+                repeats[index] = (digest, f"[Page {page_num + 1}: {what} {self._page_name(self._seen[digest])}, "
+                                          f"shown earlier]")
+                report['repeated'] += 1
+                report['repeated_bytes'] += image.size
+            if repeats:
+                item = PageContent(page_num, getattr(item, "kind", "image"), getattr(item, "text", ""), images, repeats)
+            kept.append(item)
+        return kept, report
+
+    @staticmethod
+    def _page_name(page_num):
+        return "an earlier page" if page_num is None else f"page {page_num + 1}"
@@ -0,0 +1,107 @@
+"""
+Perceptual hashes of rendered pages, for skipping blank pages.
+
+The dHash/aHash are too coarse to prove two pages equal (text pages set in
+the same layout differ by only a few bits), so repeats are detected from
+the encoded bytes instead (see page_content.PageDeduplicator).
+
+Hashes are computed in the extraction workers straight from the pixmap
+samples (NumPy, no extra decode) and travel with the encoded image, so
+the GUI process never decodes a page to check it.
+"""
+import logging
+import struct
+
+HASH_FORMAT = struct.Struct("!QQf")  # dhash, ahash, ink fraction
+SAMPLE_WIDTH = 256  # Pages are subsampled to about this width before hashing
+
+
+class PageHash:
+    """dHash and aHash (64 bits each) of a page image, plus the fraction of its pixels that carry ink."""
+
+    __slots__ = ("dhash", "ahash", "ink")
+
+    def __init__(self, dhash, ahash, ink):
+        self.dhash = dhash
+        self.ahash = ahash
+        self.ink = ink
+
+    def to_bytes(self):
+        return HASH_FORMAT.pack(self.dhash, self.ahash, self.ink)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(*HASH_FORMAT.unpack(data))
+
+    def distance(self, other):
+        """Larger of the two Hamming distances."""
+        return max(bin(self.dhash ^ other.dhash).count("1"), bin(self.ahash ^ other.ahash).count("1"))
+
+    def __repr__(self):
+        return f"PageHash({self.dhash:016x}, {self.ahash:016x}, ink {self.ink:.4f})"
+
+
+def _block_means(gray, rows, columns):
+    """Mean of each cell of a rows x columns grid over a 2-D array."""
+    import numpy as np
+    height, width = gray.shape
+    row_edges = np.linspace(0, height, rows + 1).astype(int)[:-1]
+    column_edges = np.linspace(0, width, columns + 1).astype(int)[:-1]
+    sums = np.add.reduceat(np.add.reduceat(gray, row_edges, axis=0), column_edges, axis=1)
+    counts = np.outer(np.diff(np.append(row_edges, height)), np.diff(np.append(column_edges, width)))
+    return sums / counts
+
+
+def _bits(mask):
+    import numpy as np
+    return int.from_bytes(np.packbits(mask.ravel()).tobytes(), "big")
+
+
+def pixmap_hash(pix, ink_threshold=40):
+    """
+    PageHash of a fitz Pixmap, or None when NumPy is not installed.
+
+    Args:
+        pix (fitz.Pixmap): Rendered page or figure.
+        ink_threshold (int): Grey levels a pixel must differ from the page background to count as ink.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        logging.debug("NumPy not installed; pages are not hashed")
+        return None
+    if pix.width < 9 or pix.height < 8:
+        return None
+    samples = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+    samples = samples[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+    step = max(1, pix.width // SAMPLE_WIDTH)
+    small = samples[::step, ::step, :min(3, pix.n)].astype(np.float32)
+    gray = small.mean(axis=2) if small.shape[2] > 1 else small[:, :, 0]
+
+    background = float(np.median(gray))
+    ink = float(np.count_nonzero(np.abs(gray - background) > ink_threshold)) / gray.size
+
+    wide = _block_means(gray, 8, 9)
+    square = _block_means(gray, 8, 8)
+    return PageHash(_bits(wide[:, 1:] > wide[:, :-1]), _bits(square > square.mean()), ink)
+
+
+class DedupSettings:
+    """
+    Thresholds for dropping pages before they are sent.
+
+    Args:
+        enabled (bool): When False every page is sent and nothing is marked as a repeat.
+        blank_ink (float): Pages with a smaller fraction of ink pixels count as blank
+            (separator pages, or ones with only a page number; a lone
+            heading is about 0.0002).
+    """
+
+    def __init__(self, enabled=True, blank_ink=0.00015):
+        self.enabled = enabled
+        self.blank_ink = blank_ink
+
+    @classmethod
+    def from_dict(cls, values):
+        """Build from the optional "DEDUP" config section."""
+        return cls(**(values or {}))
@@ -1,53 +1,164 @@
+import io
 import os
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
-import fitz  # PyMuPDF
-from PIL import Image, ImageTk
 import logging
-import io
+import math
+import queue
+import threading
+from bisect import bisect_left
+from page_cache import RenderCache, PagePrefetcher
+from extraction import ExtractionEngine
+from encoding import EncodingSettings
+from page_content import TextLayerSettings
+from disk_cache import DiskCache, document_digest
+from library import BOOK_EXTENSIONS, Catalogue, DocumentPool
+from rendering import image_nbytes
+from thumbnails import ThumbnailStore, render_thumbnail, thumbnail_dir
+from search_index import SearchIndex, SearchIndexer, search_dir
+from speculation import SpeculativeExtractor
+from metrics import registry, SessionProfiler
 
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+# PyMuPDF and Pillow are only imported once a document is opened, which keeps
+# the window's cold start fast. All document logic lives in document.py.
 
 class PDFViewer:
-    def __init__(self, root):
+    def __init__(self, root, disk_cache=None):
         self.root = root
         self.root.title("Learnicius Jr")
-        self.doc = None
+        self.document = None
         self.current_page = 0
         self.total_pages = 0
-        self.photo_image = None
+        self.tile_items = {}  # Tile key -> (canvas item, PhotoImage) for tiles on the canvas
+        self.preview_item = None
+        self.preview_photo = None
+        self.view_key = None
+        self.render_after_id = None
+        self.tile_polling = False
         self.chapters = []
+        self.on_document_opened = None  # Called with the Document after a file is opened
         self.MAX_CHAPTER_PAGES = 100  # Safety limit
+        self.OPEN_DOCUMENTS = 4  # Books kept open for instant switching
+        self.RENDER_CACHE_BYTES = 256 * 1024 * 1024  # Memory budget for rendered pages
+        self.PREFETCH_RADIUS = 2  # Pages pre-rendered on each side of the current one
+        self.EXTRACTION_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+        self.EXTRACTION_ZOOM = 2
+        self.MIN_ZOOM = 0.25
+        self.MAX_ZOOM = 8.0
+        self.TILE_SIZE = 512  # Pixels; only tiles intersecting the viewport are rasterised
+        self.PREVIEW_ZOOM = 0.5  # Low-resolution whole page shown while tiles render
+        self.RENDER_DEBOUNCE_MS = 60
+        self.TILE_POLL_MS = 30
+        self.THUMB_WIDTH = 120
+        self.THUMB_PADDING = 8
+        self.THUMB_LABEL_HEIGHT = 16
+        self.THUMB_MARGIN_PAGES = 8  # Thumbnails queued beyond each end of the visible range
 
         # Set a default zoom factor (for higher quality rendering)
         self.zoom_factor = 2.0
 
+        # Tiles are cached by (document hash, page, zoom, column, row) and
+        # previews by (document hash, page, zoom). Both are rendered in the
+        # background; finished tile keys come back through tile_queue.
+        self.disk_cache = disk_cache or DiskCache()
+        self.render_cache = RenderCache(self.RENDER_CACHE_BYTES)
+        self.tile_queue = queue.Queue()
+        self.prefetcher = PagePrefetcher(self.render_cache, self.prefetch_render, self.tile_queue.put)
+
+        # Recently used books stay open with their page, zoom and chapter index;
+        # the catalogue lists every book seen, without opening it (see library.py).
+        self.catalogue = Catalogue()
+        self.library = DocumentPool(self.OPEN_DOCUMENTS, self.disk_cache, self.render_cache, self.catalogue)
+        self.library_window = None
+        self.scan_progress = queue.Queue()
+        # Books not yet catalogued are hashed off the Tk thread before they open
+        self.open_request = None
+        self.open_results = queue.Queue()
+
+        # Thumbnails come from a per-document pack on disk (see thumbnails.py);
+        # missing ones are rendered by their own prefetcher, visible range first.
+        self.thumb_store = None
+        self.thumb_items = {}  # Page -> (image or placeholder item, label item, PhotoImage or None)
+        self.thumb_slot = 1
+        self.thumb_after_id = None
+        self.thumb_polling = False
+        self.thumb_queue = queue.Queue()
+        self.thumb_prefetcher = PagePrefetcher(None, self.thumbnail_render, self.thumb_queue.put,
+                                               name="thumb-prefetch")
+
+        # Full-text search; the index is built in the background on first open
+        # and reports progress through search_progress.
+        self.search_index = None
+        self.search_indexer = None
+        self.search_result = None
+        self.search_query = None
+        self.search_position = 0  # Index into search_result.pages
+        self.search_progress = queue.Queue()
+
+        # Extraction runs in a process pool; progress is polled from the Tk loop.
+        self.extraction_engine = ExtractionEngine(self.EXTRACTION_WORKERS, self.EXTRACTION_ZOOM,
+                                                  EncodingSettings(), self.disk_cache, TextLayerSettings())
+        self.extraction_job = None
+
+        # The chapter being read is pre-extracted at low priority, so Analyze
+        # finds its pages in the disk cache (see speculation.py).
+        self.speculator = SpeculativeExtractor(self.extraction_engine)
+        self.speculation_after_id = None
+        self.speculation_budget_pages = None  # Optional fn(page_count) -> budget_pages, for chapters sent in windows
+
         # Create menu
         menubar = tk.Menu(root)
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Open", command=self.open_pdf)
+        file_menu.add_command(label="Library...", command=self.show_library)
+        file_menu.add_command(label="Add Folder to Library...", command=self.add_library_folder)
+        file_menu.add_command(label="Previous Book", command=self.switch_to_previous, accelerator="Ctrl+B")
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=root.quit)
         menubar.add_cascade(label="File", menu=file_menu)
+        view_menu = tk.Menu(menubar, tearoff=0)
+        view_menu.add_command(label="Cache Stats", command=self.show_cache_stats)
+        view_menu.add_command(label="Export Metrics...", command=self.export_metrics)
+        # cProfile + tracemalloc for this session; EDU_PROFILE=1 starts it at launch
+        self.profiler = SessionProfiler()
+        self.profile_var = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(label="Profile Session", variable=self.profile_var, command=self.toggle_profiling)
+        if os.environ.get("EDU_PROFILE"):
+            self.profile_var.set(True)
+            self.profiler.start()
+        menubar.add_cascade(label="View", menu=view_menu)
         root.config(menu=menubar)
 
         # Main frame with scrollbars
         self.main_frame = ttk.Frame(root)
         self.main_frame.pack(fill=tk.BOTH, expand=1)
 
+        # Thumbnail strip on the left; click a page to go to it
+        self.thumb_canvas = tk.Canvas(self.main_frame, width=self.THUMB_WIDTH + 2 * self.THUMB_PADDING,
+                                      highlightthickness=0)
+        self.thumb_canvas.grid(row=0, column=0, rowspan=2, sticky="ns")
+        self.thumb_scroll = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.thumb_canvas.yview)
+        self.thumb_scroll.grid(row=0, column=1, rowspan=2, sticky="ns")
+        self.thumb_canvas.configure(yscrollcommand=self.on_thumb_yview)
+        self.thumb_canvas.bind("<Configure>", self.schedule_thumbnails)
+        self.thumb_canvas.bind("<Button-1>", self.on_thumbnail_click)
+        self.thumb_canvas.bind("<MouseWheel>", lambda e: self.thumb_canvas.yview_scroll(-e.delta // 120, "units"))
+        self.thumb_canvas.bind("<Button-4>", lambda e: self.thumb_canvas.yview_scroll(-1, "units"))
+        self.thumb_canvas.bind("<Button-5>", lambda e: self.thumb_canvas.yview_scroll(1, "units"))
+
         self.canvas = tk.Canvas(self.main_frame)
-        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.canvas.grid(row=0, column=2, sticky="nsew")
 
         # Scrollbars
-        v_scroll = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.canvas.yview)
-        v_scroll.grid(row=0, column=1, sticky="ns")
-        h_scroll = ttk.Scrollbar(self.main_frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
-        h_scroll.grid(row=1, column=0, sticky="ew")
+        self.v_scroll = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.v_scroll.grid(row=0, column=3, sticky="ns")
+        self.h_scroll = ttk.Scrollbar(self.main_frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        self.h_scroll.grid(row=1, column=2, sticky="ew")
 
-        self.canvas.configure(yscrollcommand=v_scroll.set, xscrollcommand=h_scroll.set)
+        # Scrolling brings new tiles into view, so it triggers a (debounced) render
+        self.canvas.configure(yscrollcommand=self.on_yview, xscrollcommand=self.on_xview)
         self.main_frame.grid_rowconfigure(0, weight=1)
-        self.main_frame.grid_columnconfigure(0, weight=1)
+        self.main_frame.grid_columnconfigure(2, weight=1)
 
         # Navigation controls
         nav_frame = ttk.Frame(root)
@@ -62,6 +173,10 @@ class PDFViewer:
         self.page_label = ttk.Label(nav_frame, text="Page: 0/0")
         self.page_label.pack(side=tk.LEFT, padx=10)
 
+        # Current section, looked up in the TOC index on every page turn
+        self.section_label = ttk.Label(root, text="", anchor=tk.W)
+        self.section_label.pack(fill=tk.X, padx=5, before=self.main_frame)
+
         self.page_entry = ttk.Entry(nav_frame, width=5, state=tk.DISABLED)
         self.page_entry.pack(side=tk.LEFT, padx=5)
         self.go_btn = ttk.Button(nav_frame, text="Go", command=self.go_to_page, state=tk.DISABLED)
@@ -82,21 +197,92 @@ class PDFViewer:
         self.zoom_in_btn = ttk.Button(nav_frame, text="Zoom In", command=self.zoom_in, state=tk.DISABLED)
         self.zoom_in_btn.pack(side=tk.LEFT, padx=5, pady=2)
 
-        self.canvas.bind("<Configure>", self.render_page)
+        # Search: words, "phrases" and prefix* terms; Enter or Find jumps to the next matching page
+        self.search_entry = ttk.Entry(nav_frame, width=18, state=tk.DISABLED)
+        self.search_entry.pack(side=tk.LEFT, padx=(15, 2))
+        self.search_entry.bind("<Return>", lambda e: self.run_search())
+        self.find_btn = ttk.Button(nav_frame, text="Find", command=self.run_search, state=tk.DISABLED)
+        self.find_btn.pack(side=tk.LEFT, padx=2)
+        self.prev_hit_btn = ttk.Button(nav_frame, text="◀", width=2, command=lambda: self.step_search(-1),
+                                       state=tk.DISABLED)
+        self.prev_hit_btn.pack(side=tk.LEFT)
+        self.next_hit_btn = ttk.Button(nav_frame, text="▶", width=2, command=lambda: self.step_search(1),
+                                       state=tk.DISABLED)
+        self.next_hit_btn.pack(side=tk.LEFT)
+        self.search_label = ttk.Label(nav_frame, text="")
+        self.search_label.pack(side=tk.LEFT, padx=5)
+        root.bind("<Control-f>", lambda e: self.search_entry.focus_set())
+        root.bind("<Control-b>", lambda e: self.switch_to_previous())
+
+        # Extraction progress – only shown while an extraction is running
+        self.extract_progress = ttk.Progressbar(nav_frame, length=120, mode="determinate")
+        self.cancel_extract_btn = ttk.Button(nav_frame, text="Cancel", command=self.cancel_extraction)
+
+        self.canvas.bind("<Configure>", self.schedule_render)
 
     def open_pdf(self):
-        try:
-            file_path = filedialog.askopenfilename(filetypes=[("PDF Files", "*.pdf")])
-            if not file_path: 
-                return
+        file_path = filedialog.askopenfilename(filetypes=[
+            ("Books", " ".join("*" + ext for ext in BOOK_EXTENSIONS)),
+            ("PDF Files", "*.pdf"),
+            ("EPUB Files", "*.epub"),
+        ])
+        if file_path:
+            self.open_path(file_path)
 
-            if self.doc:
-                self.doc.close()
+    def open_path(self, file_path, page_num=None):
+        """
+        Show a book. A file the catalogue does not know yet is hashed on a
+        background thread first (the hash is memoised in the disk cache, so
+        the pool then finds it), keeping the window responsive on large books.
+        """
+        request = self.open_request = (file_path, page_num)
+        if self.catalogue.get(file_path) is not None:
+            self.show_path(file_path, page_num)
+            return
+
+        def hash_file():
+            try:
+                document_digest(file_path, self.disk_cache)
+                self.open_results.put((request, None))
+            except Exception as e:
+                self.open_results.put((request, e))
 
-            self.doc = fitz.open(file_path)
-            self.total_pages = len(self.doc)
-            self.current_page = 0
+        self.root.config(cursor="watch")
+        threading.Thread(target=hash_file, name="document-digest", daemon=True).start()
+        self.root.after(50, self.poll_open)
+
+    def poll_open(self):
+        try:
+            request, error = self.open_results.get_nowait()
+        except queue.Empty:
+            self.root.after(50, self.poll_open)
+            return
+        if request is not self.open_request:
+            return  # Superseded by a later open
+        self.root.config(cursor="")
+        if error is not None:
+            messagebox.showerror("Error", f"Failed to load PDF:\n{str(error)}")
+            return
+        self.show_path(*request)
+
+    def show_path(self, file_path, page_num=None):
+        """Show a book, reusing it if it is still open in the library pool."""
+        try:
+            self.prefetcher.cancel()
+            if self.document:
+                # Remember where this book was left for when it is shown again
+                self.document.current_page = self.current_page
+                self.document.zoom = self.zoom_factor
+            document = self.library.open(file_path)
+            if document is not self.document and self.extraction_job and not self.extraction_job.is_finished():
+                self.extraction_job.cancel()
+            self.document = document
+            self.total_pages = document.page_count
+            self.current_page = document.current_page if page_num is None else min(page_num, document.page_count - 1)
+            self.zoom_factor = document.zoom or self.zoom_factor
             self.chapters = self.get_chapter_info()
+            self.open_thumbnails(document)
+            self.open_search_index(document)
             
             # Enable controls
             self.prev_btn['state'] = tk.NORMAL
@@ -106,10 +292,17 @@ class PDFViewer:
             self.page_entry['state'] = tk.NORMAL
             self.zoom_in_btn['state'] = tk.NORMAL
             self.zoom_out_btn['state'] = tk.NORMAL
+            self.search_entry['state'] = tk.NORMAL
+            self.find_btn['state'] = tk.NORMAL
             
+            self.root.title(f"Learnicius Jr – {os.path.basename(document.path)}")
             self.update_page_label()
             self.render_page()
-            logging.info(f"Loaded PDF with {self.total_pages} pages")
+            if self.library_window is not None:
+                self.refresh_library()
+            logging.info(f"Loaded {os.path.basename(document.path)} with {self.total_pages} pages")
+            if self.on_document_opened is not None:
+                self.on_document_opened(document)
 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load PDF:\n{str(e)}")
@@ -121,105 +314,600 @@ class PDFViewer:
             self.page_entry['state'] = tk.DISABLED
             self.zoom_in_btn['state'] = tk.DISABLED
             self.zoom_out_btn['state'] = tk.DISABLED
+            self.search_entry['state'] = tk.DISABLED
+            self.find_btn['state'] = tk.DISABLED
 
     def get_chapter_info(self):
         """Extract hierarchical chapter information with deepest subdivisions"""
-        chapters = []
-        try:
-            toc = self.doc.get_toc()
-            
-            # Handle case with no TOC entries
-            if not toc:
-                return [{
-                    'title': 'Full Document',
-                    'start': 0,
-                    'end': self.total_pages - 1
-                }]
-
-            # Identify deepest hierarchical subdivisions
-            leaf_entries = []
-            for i, entry in enumerate(toc):
-                level, title, page = entry
-                is_leaf = True
-                
-                # Check if any subsequent entries are children of this entry
-                for j in range(i+1, len(toc)):
-                    next_level = toc[j][0]
-                    if next_level > level:  # Found a deeper subdivision
-                        is_leaf = False
-                        break
-                    if next_level <= level:  # Sibling or parent level reached
-                        break
-                        
-                if is_leaf:
-                    leaf_entries.append(entry)
-
-            # Fallback to top-level chapters if no subdivisions found
-            if not leaf_entries:
-                leaf_entries = [e for e in toc if e[0] == 1]
-                if not leaf_entries:  # If no chapters, treat whole document as one
-                    return [{
-                        'title': 'Full Document',
-                        'start': 0,
-                        'end': self.total_pages - 1
-                    }]
-
-            # Create chapter ranges with boundary checks
-            for i, (level, title, page) in enumerate(leaf_entries):
-                start = max(0, page - 1)  # Convert to 0-based index
-                end = self.total_pages - 1
-                
-                # Calculate end page using next subdivision's start
-                if i < len(leaf_entries) - 1:
-                    next_start = max(0, leaf_entries[i+1][2] - 1)
-                    end = min(next_start - 1, self.total_pages - 1)
-                    
-                # Ensure valid page range
-                start = min(start, self.total_pages - 1)
-                end = max(start, min(end, self.total_pages - 1))
-
-                chapters.append({
-                    'title': self.clean_title(title),
-                    'start': start,
-                    'end': end
-                })
-                logging.info(f"Subdivision: {title} (pages {start+1}-{end+1})")
-
-            return chapters
+        return self.document.chapters
 
-        except Exception as e:
-            logging.warning(f"Chapter detection failed: {str(e)}")
-            return [{
-                'title': 'Full Document',
-                'start': 0,
-                'end': self.total_pages - 1
-            }]
+    def switch_to_previous(self):
+        """Go back to the book shown before this one (e.g. textbook <-> solutions manual)."""
+        previous = self.library.previous()
+        if previous is not None:
+            self.open_path(previous.path)
+
+    def show_library(self):
+        """
+        Window listing every catalogued book; expanding one shows its chapters
+        from the catalogue, without opening the file. Double-click a book or a
+        chapter to open it there.
+        """
+        if self.library_window is not None:
+            self.library_window.lift()
+            self.refresh_library()
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Library")
+        window.geometry("640x420")
+        tree = ttk.Treeview(window, columns=("pages", "format", "state"), selectmode="browse")
+        tree.heading("#0", text="Title")
+        tree.heading("pages", text="Pages")
+        tree.heading("format", text="Format")
+        tree.heading("state", text="")
+        tree.column("pages", width=60, anchor=tk.E, stretch=False)
+        tree.column("format", width=80, stretch=False)
+        tree.column("state", width=60, stretch=False)
+        scroll = ttk.Scrollbar(window, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scroll.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=1)
+        scroll.pack(side=tk.LEFT, fill=tk.Y)
+        tree.bind("<<TreeviewOpen>>", self.on_library_expand)
+        tree.bind("<Double-1>", self.on_library_activate)
+        window.protocol("WM_DELETE_WINDOW", self.close_library)
+        self.library_window = window
+        self.library_tree = tree
+        self.library_entries = {}
+        self.refresh_library()
+
+    def close_library(self):
+        self.library_window.destroy()
+        self.library_window = None
+
+    def refresh_library(self):
+        tree = self.library_tree
+        tree.delete(*tree.get_children())
+        self.library_entries.clear()
+        for entry in self.catalogue.books():
+            state = "open" if entry.digest in self.library else ""
+            item = tree.insert("", tk.END, text=entry.title, values=(entry.page_count, entry.format, state))
+            self.library_entries[item] = entry
+            if entry.toc:
+                tree.insert(item, tk.END, text="…")  # Placeholder; chapters are added when expanded
+
+    def on_library_expand(self, event):
+        """Fill in a book's top-level chapters from its catalogued TOC."""
+        item = self.library_tree.focus()
+        entry = self.library_entries.get(item)
+        children = self.library_tree.get_children(item)
+        if entry is None or not children or self.library_tree.item(children[0], "text") != "…":
+            return
+        self.library_tree.delete(*children)
+        for level, title, page, *_ in entry.toc:
+            if level == 1:
+                self.library_tree.insert(item, tk.END, text=title, values=(page, "", ""))
+
+    def on_library_activate(self, event):
+        item = self.library_tree.focus()
+        parent = self.library_tree.parent(item)
+        entry = self.library_entries.get(parent or item)
+        if entry is None:
+            return
+        if not os.path.exists(entry.path):
+            if messagebox.askyesno("Library", f"{entry.path} no longer exists. Remove it from the library?"):
+                self.catalogue.forget(entry.path)
+                self.refresh_library()
+            return
+        page_num = None
+        if parent:
+            page = self.library_tree.item(item, "values")[0]
+            page_num = max(0, int(page) - 1) if str(page).isdigit() else None
+        self.open_path(entry.path, page_num)
+
+    def add_library_folder(self):
+        """Catalogue every book in a folder, in the background."""
+        directory = filedialog.askdirectory()
+        if not directory:
+            return
+
+        def scan():
+            try:
+                self.catalogue.scan(directory, self.disk_cache, lambda done, total: self.scan_progress.put((done, total)))
+            finally:
+                self.scan_progress.put(None)  # Finished
+
+        threading.Thread(target=scan, name="library-scan", daemon=True).start()
+        self.root.after(500, self.poll_library_scan)
+
+    def poll_library_scan(self):
+        finished = False
+        latest = None
+        while True:
+            try:
+                event = self.scan_progress.get_nowait()
+            except queue.Empty:
+                break
+            if event is None:
+                finished = True
+            else:
+                latest = event
+        if not finished:
+            if latest is not None and self.library_window is not None:
+                self.library_window.title(f"Library (scanning {latest[0]}/{latest[1]})")
+            self.root.after(500, self.poll_library_scan)
+            return
+        if self.library_window is None:
+            self.show_library()
+        else:
+            self.library_window.title("Library")
+            self.refresh_library()
+
+    def prefetch_render(self, key):
+        """Render callback for the prefetcher; skips keys for a document that is no longer open."""
+        document = self.document
+        if document is None or key[0] != document.digest:
+            return None
+        if len(key) == 5:
+            image = document.render_tile(key[1], key[2], key[3], key[4], self.TILE_SIZE)
+        else:
+            image = document.load_page_image(key[1], key[2])
+        return image, image_nbytes(image)
 
-    def clean_title(self, title):
-        return "".join(c if c.isalnum() else "_" for c in title.strip())
+    def preview_keys(self):
+        """Previews of the pages around the current one, nearest first."""
+        keys = []
+        for offset in range(1, self.PREFETCH_RADIUS + 1):
+            for page_num in (self.current_page + offset, self.current_page - offset):
+                if 0 <= page_num < self.total_pages:
+                    keys.append(self.document.cache_key(page_num, self.PREVIEW_ZOOM))
+        return keys
+
+    def neighbour_tile_keys(self, zoom):
+        """Tiles the current viewport covers on the next and previous pages (next first), at this zoom."""
+        keys = []
+        for page_num in (self.current_page + 1, self.current_page - 1):
+            if 0 <= page_num < self.total_pages:
+                width, height = self.document.page_size(page_num)
+                _, tiles = self.visible_tiles(math.ceil(width * zoom), math.ceil(height * zoom))
+                keys.extend(self.document.tile_key(page_num, zoom, c, r) for c, r in tiles)
+        return keys
+
+    def on_yview(self, first, last):
+        self.v_scroll.set(first, last)
+        self.schedule_render()
+
+    def on_xview(self, first, last):
+        self.h_scroll.set(first, last)
+        self.schedule_render()
+
+    def schedule_render(self, event=None):
+        """Coalesce bursts of resize, scroll and zoom events into one render."""
+        if self.render_after_id is not None:
+            self.root.after_cancel(self.render_after_id)
+        self.render_after_id = self.root.after(self.RENDER_DEBOUNCE_MS, self.render_page)
+
+    def visible_tiles(self, page_width, page_height):
+        """Viewport in canvas coordinates and the (column, row) tiles it intersects."""
+        x0, y0 = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        x1 = min(page_width, x0 + self.canvas.winfo_width())
+        y1 = min(page_height, y0 + self.canvas.winfo_height())
+        size = self.TILE_SIZE
+        tiles = [(column, row)
+                 for row in range(int(y0 // size), math.ceil(y1 / size))
+                 for column in range(int(x0 // size), math.ceil(x1 / size))]
+        return (x0, y0, x1, y1), tiles
 
     def render_page(self, event=None):
-        if not self.doc:
+        """
+        Draw the visible part of the current page.
+
+        Cached tiles are drawn at once. If any are missing, a low-resolution
+        preview cropped to the viewport is drawn underneath and the missing
+        tiles are rendered in the background, replacing it as they arrive.
+        Canvas images never exceed the viewport plus one tile, whatever the zoom.
+        The same viewport on the next and previous pages is rendered ahead at
+        this zoom, so paging (which keeps the scroll position) draws at once.
+        """
+        self.render_after_id = None
+        if not self.document:
             return
-        
+
         try:
-            page = self.doc.load_page(self.current_page)
-            # Use the fixed zoom factor for rendering.
-            matrix = fitz.Matrix(self.zoom_factor, self.zoom_factor)
-            pix = page.get_pixmap(matrix=matrix)
-            self.photo_image = ImageTk.PhotoImage(
-                Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            )
-            
-            self.canvas.delete("all")
-            self.canvas.create_image(0, 0, image=self.photo_image, anchor=tk.NW)
-            self.canvas.configure(scrollregion=(0, 0, pix.width, pix.height))
-            
+            from PIL import ImageTk
+            zoom = self.zoom_factor
+            width, height = self.document.page_size(self.current_page)
+            page_width, page_height = math.ceil(width * zoom), math.ceil(height * zoom)
+
+            view_key = (self.document.digest, self.current_page, zoom)
+            if view_key != self.view_key:
+                # New page or zoom: nothing on the canvas is reusable
+                self.view_key = view_key
+                self.canvas.delete("all")
+                self.tile_items.clear()
+                self.preview_item = self.preview_photo = None
+                self.canvas.configure(scrollregion=(0, 0, page_width, page_height))
+
+            viewport, tiles = self.visible_tiles(page_width, page_height)
+            keys = [self.document.tile_key(self.current_page, zoom, c, r) for c, r in tiles]
+
+            # Release tiles that scrolled out of view
+            wanted = set(keys)
+            for key in [k for k in self.tile_items if k not in wanted]:
+                self.canvas.delete(self.tile_items.pop(key)[0])
+
+            missing = []
+            for key in keys:
+                if key in self.tile_items:
+                    continue
+                image = self.render_cache.get(key)
+                if image is None:
+                    missing.append(key)
+                    continue
+                photo = ImageTk.PhotoImage(image)
+                item = self.canvas.create_image(key[3] * self.TILE_SIZE, key[4] * self.TILE_SIZE,
+                                                image=photo, anchor=tk.NW)
+                self.tile_items[key] = (item, photo)
+
+            if missing:
+                self.draw_preview(viewport, zoom)
+            elif self.preview_item is not None:
+                self.canvas.delete(self.preview_item)
+                self.preview_item = self.preview_photo = None
+
+            self.prefetcher.schedule(missing + self.neighbour_tile_keys(zoom) + self.preview_keys())
+            if missing and not self.tile_polling:
+                self.tile_polling = True
+                self.root.after(self.TILE_POLL_MS, self.poll_tiles)
+            self.draw_search_hits(zoom)
+
         except Exception as e:
             logging.error(f"Render error: {str(e)}")
 
+    def draw_preview(self, viewport, zoom):
+        """Scale the visible part of the low-resolution page up to the viewport, below the tiles."""
+        from PIL import Image, ImageTk
+        x0, y0, x1, y1 = viewport
+        if x1 <= x0 or y1 <= y0:
+            return
+        preview = self.document.page_image(self.current_page, self.PREVIEW_ZOOM)
+        scale = zoom / self.PREVIEW_ZOOM
+        crop = preview.crop((int(x0 / scale), int(y0 / scale),
+                             math.ceil(x1 / scale), math.ceil(y1 / scale)))
+        left, top = int(x0 / scale) * scale, int(y0 / scale) * scale
+        size = (max(1, round(crop.width * scale)), max(1, round(crop.height * scale)))
+        self.preview_photo = ImageTk.PhotoImage(crop.resize(size, Image.BILINEAR))
+        if self.preview_item is not None:
+            self.canvas.delete(self.preview_item)
+        self.preview_item = self.canvas.create_image(left, top, image=self.preview_photo, anchor=tk.NW)
+        self.canvas.tag_lower(self.preview_item)
+
+    def poll_tiles(self):
+        """Redraw when tiles of the current view finish rendering in the background."""
+        arrived = False
+        while True:
+            try:
+                key = self.tile_queue.get_nowait()
+            except queue.Empty:
+                break
+            if len(key) == 5 and key[:3] == self.view_key:
+                arrived = True
+        self.tile_polling = False
+        if arrived:
+            self.render_page()
+        elif self.preview_item is not None:
+            # Still waiting for tiles of the current view
+            self.tile_polling = True
+            self.root.after(self.TILE_POLL_MS, self.poll_tiles)
+
+    def open_thumbnails(self, document):
+        """Load the document's thumbnail pack and lay out one slot per page."""
+        self.thumb_prefetcher.cancel()
+        self.thumb_canvas.delete("all")
+        self.thumb_items.clear()
+        self.thumb_store = ThumbnailStore(document.digest, self.THUMB_WIDTH, thumbnail_dir(self.disk_cache.directory))
+        self.thumb_prefetcher.cache = self.thumb_store
+        width, height = document.page_size(0)
+        self.thumb_slot = round(self.THUMB_WIDTH * height / width) + self.THUMB_LABEL_HEIGHT + self.THUMB_PADDING
+        self.thumb_canvas.configure(scrollregion=(0, 0, self.THUMB_WIDTH + 2 * self.THUMB_PADDING,
+                                                  self.thumb_slot * document.page_count))
+        self.thumb_canvas.yview_moveto(0)
+        self.schedule_thumbnails()
+
+    def thumbnail_render(self, key):
+        """Render callback for the thumbnail prefetcher; returns JPEG bytes."""
+        document = self.document
+        if document is None or key[0] != document.digest:
+            return None
+        data = render_thumbnail(document, key[1], key[2])
+        return data, len(data)
+
+    def on_thumb_yview(self, first, last):
+        self.thumb_scroll.set(first, last)
+        self.schedule_thumbnails()
+
+    def schedule_thumbnails(self, event=None):
+        if self.thumb_after_id is not None:
+            self.root.after_cancel(self.thumb_after_id)
+        self.thumb_after_id = self.root.after(self.RENDER_DEBOUNCE_MS, self.update_thumbnails)
+
+    def visible_thumbnails(self):
+        """First and last page whose thumbnail slot is in view."""
+        top = self.thumb_canvas.canvasy(0)
+        bottom = top + self.thumb_canvas.winfo_height()
+        first = max(0, int(top // self.thumb_slot))
+        last = min(self.total_pages - 1, int(bottom // self.thumb_slot))
+        return first, last
+
+    def update_thumbnails(self):
+        """
+        Show the thumbnails in view, drop the ones that scrolled away and queue
+        the missing ones. Rescheduling replaces the prefetcher's queue, so pages
+        no longer in view are never rendered.
+        """
+        self.thumb_after_id = None
+        if not self.document or self.thumb_store is None:
+            return
+        from PIL import Image, ImageTk
+        first, last = self.visible_thumbnails()
+        for page_num in [p for p in self.thumb_items if not first <= p <= last]:
+            item, label, _ = self.thumb_items.pop(page_num)
+            self.thumb_canvas.delete(item, label)
+
+        missing = []
+        x = self.THUMB_PADDING
+        for page_num in range(first, last + 1):
+            shown = self.thumb_items.get(page_num)
+            if shown is not None and shown[2] is not None:
+                continue
+            data = self.thumb_store.get(page_num)
+            if data is None:
+                missing.append(page_num)
+                if shown is None:
+                    y = page_num * self.thumb_slot + self.THUMB_PADDING // 2
+                    bottom = y + self.thumb_slot - self.THUMB_LABEL_HEIGHT - self.THUMB_PADDING
+                    item = self.thumb_canvas.create_rectangle(x, y, x + self.THUMB_WIDTH, bottom, outline="#bbb")
+                    label = self.thumb_canvas.create_text(x + self.THUMB_WIDTH // 2, bottom + 2,
+                                                          text=str(page_num + 1), anchor=tk.N)
+                    self.thumb_items[page_num] = (item, label, None)
+                continue
+            if shown is not None:
+                self.thumb_canvas.delete(shown[0], shown[1])
+            photo = ImageTk.PhotoImage(Image.open(io.BytesIO(data)))
+            y = page_num * self.thumb_slot + self.THUMB_PADDING // 2
+            item = self.thumb_canvas.create_image(x, y, image=photo, anchor=tk.NW)
+            label = self.thumb_canvas.create_text(x + self.THUMB_WIDTH // 2, y + photo.height() + 2,
+                                                  text=str(page_num + 1), anchor=tk.N)
+            self.thumb_items[page_num] = (item, label, photo)
+
+        # Visible pages top down, then the margins, nearest first
+        pages = list(missing)
+        for offset in range(1, self.THUMB_MARGIN_PAGES + 1):
+            for page_num in (last + offset, first - offset):
+                if 0 <= page_num < self.total_pages and self.thumb_store.get(page_num) is None:
+                    pages.append(page_num)
+        self.thumb_prefetcher.schedule([self.thumb_store.key(p) for p in pages])
+        if missing and not self.thumb_polling:
+            self.thumb_polling = True
+            self.root.after(self.TILE_POLL_MS, self.poll_thumbnails)
+        self.highlight_thumbnail()
+
+    def poll_thumbnails(self):
+        """Show thumbnails of the visible range as they finish rendering."""
+        first, last = self.visible_thumbnails()
+        arrived = False
+        while True:
+            try:
+                key = self.thumb_queue.get_nowait()
+            except queue.Empty:
+                break
+            if self.thumb_store is not None and key[0] == self.thumb_store.digest and first <= key[1] <= last:
+                arrived = True
+        self.thumb_polling = False
+        if arrived:
+            self.update_thumbnails()
+        elif any(shown[2] is None for shown in self.thumb_items.values()):
+            self.thumb_polling = True
+            self.root.after(self.TILE_POLL_MS, self.poll_thumbnails)
+
+    def highlight_thumbnail(self):
+        """Frame the current page's thumbnail, scrolling the strip to it if needed."""
+        self.thumb_canvas.delete("current_page")
+        if not self.document:
+            return
+        y = self.current_page * self.thumb_slot
+        self.thumb_canvas.create_rectangle(2, y + 1, self.THUMB_WIDTH + 2 * self.THUMB_PADDING - 2,
+                                           y + self.thumb_slot - 1, outline="#3a7bd5", width=2,
+                                           tags="current_page")
+        first, last = self.visible_thumbnails()
+        if not first <= self.current_page <= last:
+            self.thumb_canvas.yview_moveto(y / (self.thumb_slot * self.total_pages))
+
+    def on_thumbnail_click(self, event):
+        if not self.document:
+            return
+        page_num = int(self.thumb_canvas.canvasy(event.y) // self.thumb_slot)
+        if 0 <= page_num < self.total_pages and page_num != self.current_page:
+            self.current_page = page_num
+            self.update_page_label()
+            self.render_page()
+
+    def open_search_index(self, document):
+        """Open the document's search index and index any pages it is missing, in the background."""
+        if self.search_indexer is not None:
+            self.search_indexer.stop()
+            self.search_indexer = None
+        self.search_result = None
+        self.prev_hit_btn['state'] = tk.DISABLED
+        self.next_hit_btn['state'] = tk.DISABLED
+        self.search_label.config(text="")
+        try:
+            self.search_index = SearchIndex(document.digest, search_dir(self.disk_cache.directory))
+        except Exception as e:
+            logging.error(f"Search index unavailable: {str(e)}")
+            self.search_index = None
+            return
+        if not self.search_index.is_complete():
+            self.search_indexer = SearchIndexer(self.search_index, document.path, document.page_count,
+                                                lambda done, total: self.search_progress.put((document.digest, done, total)))
+            self.search_indexer.start()
+            self.search_label.config(text="Indexing...")
+            self.root.after(500, self.poll_search_progress)
+
+    def poll_search_progress(self):
+        latest = None
+        while True:
+            try:
+                latest = self.search_progress.get_nowait()
+            except queue.Empty:
+                break
+        if self.search_indexer is None or not self.document:
+            return
+        if latest is not None and latest[0] == self.document.digest:
+            _, done, total = latest
+            if done >= total:
+                self.search_indexer = None
+                self.search_label.config(text="" if self.search_result is None else self.search_status())
+                return
+            if self.search_result is None:
+                self.search_label.config(text=f"Indexing {done * 100 // total}%")
+        self.root.after(500, self.poll_search_progress)
+
+    def search_status(self):
+        count = len(self.search_result)
+        if not count:
+            return "No matches"
+        status = f"{self.search_position + 1}/{count} pages"
+        return status + " (indexing)" if self.search_indexer is not None else status
+
+    def run_search(self):
+        """Search the document and jump to the first matching page at or after the current one."""
+        if self.search_index is None or not self.document:
+            return
+        query = self.search_entry.get().strip()
+        if not query:
+            self.search_result = None
+            self.search_label.config(text="")
+            self.canvas.delete("search_hit")
+            return
+        if self.search_result is not None and query == self.search_query:
+            self.step_search(1)
+            return
+        self.search_query = query
+        self.search_result = self.search_index.search(query)
+        pages = self.search_result.pages
+        state = tk.NORMAL if len(pages) > 1 else tk.DISABLED
+        self.prev_hit_btn['state'] = state
+        self.next_hit_btn['state'] = state
+        if not pages:
+            self.search_label.config(text=self.search_status())
+            self.canvas.delete("search_hit")
+            return
+        self.search_position = bisect_left(pages, self.current_page) % len(pages)
+        self.show_search_hit()
+
+    def step_search(self, step):
+        if self.search_result is None or not self.search_result.pages:
+            return
+        self.search_position = (self.search_position + step) % len(self.search_result.pages)
+        self.show_search_hit()
+
+    def show_search_hit(self):
+        """Go to the current matching page and scroll its first hit into view."""
+        page_num = self.search_result.pages[self.search_position]
+        self.search_label.config(text=self.search_status())
+        if page_num != self.current_page:
+            self.current_page = page_num
+            self.update_page_label()
+        self.render_page()
+        rects = self.search_result.rects(page_num)
+        if rects:
+            _, height = self.document.page_size(page_num)
+            self.canvas.yview_moveto(max(0.0, rects[0][1] / height - 0.1))
+
+    def draw_search_hits(self, zoom):
+        """Outline the search matches on the current page, above the tiles."""
+        self.canvas.delete("search_hit")
+        result = self.search_result
+        if result is None:
+            return
+        i = bisect_left(result.pages, self.current_page)
+        if i == len(result.pages) or result.pages[i] != self.current_page:
+            return
+        for x0, y0, x1, y1 in result.rects(self.current_page):
+            self.canvas.create_rectangle(x0 * zoom - 1, y0 * zoom - 1, x1 * zoom + 1, y1 * zoom + 1,
+                                         outline="#f0a000", width=2, tags="search_hit")
+        self.canvas.tag_raise("search_hit")
+
+    def show_cache_stats(self):
+        stats = self.render_cache.stats()
+        disk = self.disk_cache.stats()
+        speculation = self.speculator.stats()
+        messagebox.showinfo("Cache Stats",
+            f"Render cache (memory)\n"
+            f"Hits: {stats['hits']}  Misses: {stats['misses']}  "
+            f"Hit rate: {stats['hit_rate']:.0%}\n"
+            f"Entries: {stats['entries']}  Evictions: {stats['evictions']}\n"
+            f"Memory: {stats['bytes'] / 2**20:.1f} / {stats['max_bytes'] / 2**20:.0f} MB\n\n"
+            f"Disk cache ({disk['directory']})\n"
+            f"Hits: {disk['hits']}  Misses: {disk['misses']}  "
+            f"Hit rate: {disk['hit_rate']:.0%}\n"
+            f"Bytes saved: {disk['bytes_saved'] / 2**20:.1f} MB\n\n"
+            f"Speculative extraction\n"
+            f"Hits: {speculation['hit']}  Misses: {speculation['miss']}  "
+            f"Hit rate: {speculation['hit_rate']:.0%}\n"
+            f"Already cached: {speculation['cached']}  Unused: {speculation['unused']}")
+
+    def export_metrics(self):
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON snapshot", "*.json"), ("Prometheus text", "*.prom")]
+        )
+        if not path:
+            return
+        try:
+            registry().export(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not write metrics:\n{str(e)}")
+
+    def toggle_profiling(self):
+        if self.profile_var.get():
+            self.profiler.start()
+        else:
+            directory = self.profiler.stop()
+            if directory:
+                messagebox.showinfo("Profile", f"Profile written to {os.path.abspath(directory)}")
+
     def update_page_label(self):
         self.page_label.config(text=f"Page: {self.current_page+1}/{self.total_pages}")
+        if self.document:
+            self.section_label.config(text=" › ".join(self.document.section_path(self.current_page)))
+            self.highlight_thumbnail()
+            self.schedule_speculation()
+
+    def schedule_speculation(self):
+        """Pre-extract the current chapter once the reader has stayed in it for a moment."""
+        if self.speculation_after_id is not None:
+            self.root.after_cancel(self.speculation_after_id)
+            self.speculation_after_id = None
+        if not self.speculator.settings.enabled:
+            return
+        if not self.document or not self.chapter_mode.get():
+            self.speculator.cancel()
+            return
+        self.speculation_after_id = self.root.after(self.speculator.settings.delay_ms, self.start_speculation)
+
+    def start_speculation(self):
+        self.speculation_after_id = None
+        chapter = self.current_chapter() if self.document else None
+        if chapter is None:
+            self.speculator.cancel()
+            return
+        if self.extraction_job and not self.extraction_job.is_finished():
+            return  # Foreground extraction first
+        page_count = chapter['end'] - chapter['start'] + 1
+        budget_pages = self.speculation_budget_pages(page_count) if self.speculation_budget_pages else None
+        self.speculator.start(self.document.path, self.document.digest,
+                              range(chapter['start'], chapter['end'] + 1), budget_pages)
 
     def prev_page(self):
         if self.current_page > 0:
@@ -234,7 +922,7 @@ class PDFViewer:
             self.render_page()
 
     def go_to_page(self):
-        if not self.doc:
+        if not self.document:
             messagebox.showinfo("Info", "No PDF loaded")
             return
         try:
@@ -248,100 +936,150 @@ class PDFViewer:
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid number")
 
+    def set_zoom(self, zoom):
+        # Rounded so repeated zooming lands on the same tile keys
+        zoom = round(min(self.MAX_ZOOM, max(self.MIN_ZOOM, zoom)), 4)
+        if zoom != self.zoom_factor:
+            self.zoom_factor = zoom
+            self.schedule_render()
+
     def zoom_in(self):
-        self.zoom_factor *= 1.25
-        self.render_page()
+        self.set_zoom(self.zoom_factor * 1.25)
 
     def zoom_out(self):
-        self.zoom_factor /= 1.25
-        self.render_page()
+        self.set_zoom(self.zoom_factor / 1.25)
+
+    def current_chapter(self):
+        return self.document.chapter_for_page(self.current_page)
+
+    def extract_current_chapter(self, on_complete=None, max_pages=None, budget_pages=None):
+        """
+        Starts extracting the current chapter in the background; on_complete receives the images.
 
-    def extract_current_chapter(self):
+        max_pages raises the MAX_CHAPTER_PAGES limit for callers that send long
+        chapters in windows of budget_pages pages.
+        """
         try:
-            if not self.doc:
+            if not self.document:
                 messagebox.showinfo("Info", "No PDF loaded")
-                return []
+                return None
 
-            current_chapter = next(
-                (ch for ch in self.chapters 
-                 if ch['start'] <= self.current_page <= ch['end']), None
-            )
+            current_chapter = self.current_chapter()
 
             if not current_chapter:
                 messagebox.showinfo("Info", "Current page not in any chapter")
-                return []
+                return None
 
             # Validate chapter boundaries
             if not (0 <= current_chapter['start'] <= current_chapter['end'] < self.total_pages):
                 messagebox.showerror("Error", "Invalid chapter boundaries")
-                return []
+                return None
 
             # Check page count safety limit
             page_count = current_chapter['end'] - current_chapter['start'] + 1
-            if page_count > self.MAX_CHAPTER_PAGES:
+            max_pages = max_pages or self.MAX_CHAPTER_PAGES
+            if page_count > max_pages:
                 messagebox.showerror("Limit Exceeded", 
-                    f"Chapter too large ({page_count} pages). Max allowed: {self.MAX_CHAPTER_PAGES}")
-                return []
+                    f"Chapter too large ({page_count} pages). Max allowed: {max_pages}")
+                return None
 
-            # Extract pages
-            images = []
-            for page_num in range(current_chapter['start'], current_chapter['end'] + 1):
-                if page_num >= self.total_pages:
-                    break
-
-                page = self.doc.load_page(page_num)
-                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-                img_data = io.BytesIO(pix.tobytes("png"))
-                images.append(img_data)
-                logging.info(f"Processed page {page_num+1}")
-
-            messagebox.showinfo("Success", 
-                f"Extracted chapter: {current_chapter['title']}\n"
-                f"Pages: {current_chapter['start']+1}-{current_chapter['end']+1}\n"
-                f"Images saved in memory: {len(images)}")
-
-            return images
+            page_numbers = range(current_chapter['start'], current_chapter['end'] + 1)
+            success_text = (f"Extracted chapter: {current_chapter['title']}\n"
+                            f"Pages: {current_chapter['start']+1}-{current_chapter['end']+1}\n")
+            return self.start_extraction(page_numbers, success_text, on_complete, budget_pages, speculated=True)
 
         except Exception as e:
             messagebox.showerror("Error", f"Extraction failed:\n{str(e)}")
             logging.error(f"Extraction error: {str(e)}")
-            return []
+            return None
         
-    def extract_current_page(self):
-        """Extracts the current page as an image."""
-        try:
-            if not self.doc:
-                messagebox.showinfo("Info", "No PDF loaded")
-                return []
-
-            page = self.doc.load_page(self.current_page)
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_data = io.BytesIO(pix.tobytes("png"))
-
-            messagebox.showinfo("Success", f"Extracted page {self.current_page + 1}")
-            logging.info(f"Extracted page {self.current_page + 1}")
-            return [img_data]
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Page extraction failed:\n{str(e)}")
-            logging.error(f"Page extraction error: {str(e)}")
-            return []
+    def extract_current_page(self, on_complete=None):
+        """Starts extracting the current page as an image; on_complete receives a one-item list."""
+        if not self.document:
+            messagebox.showinfo("Info", "No PDF loaded")
+            return None
+        return self.start_extraction([self.current_page],
+                                     f"Extracted page {self.current_page + 1}\n", on_complete)
 
-    def extract_content(self):
+    def extract_content(self, on_complete=None):
         """Extracts content based on the current extraction mode."""
         if self.chapter_mode.get():
-            return self.extract_current_chapter()
+            return self.extract_current_chapter(on_complete)
         else:
-            return self.extract_current_page()
+            return self.extract_current_page(on_complete)
+
+    def start_extraction(self, page_numbers, success_text, on_complete=None, budget_pages=None, speculated=False):
+        """
+        Submit pages to the extraction engine and follow its progress from the Tk loop.
+
+        With speculated, the pages are a chapter the speculator may have pre-extracted; its hits and misses are counted.
+        """
+        if self.extraction_job and not self.extraction_job.is_finished():
+            messagebox.showinfo("Info", "An extraction is already running")
+            return None
+        if speculated:
+            self.speculator.record_request(self.document.digest, page_numbers, budget_pages)
+
+        job = self.extraction_engine.extract(self.document.path, page_numbers, self.document.digest,
+                                             budget_pages)
+        self.extraction_job = job
+        self.extract_btn['state'] = tk.DISABLED
+        self.extract_progress.configure(maximum=job.total, value=0)
+        self.extract_progress.pack(side=tk.LEFT, padx=5, pady=2)
+        self.cancel_extract_btn.pack(side=tk.LEFT, padx=5, pady=2)
+        self.root.after(50, self.poll_extraction, job, [], success_text, on_complete)
+        return job
+
+    def poll_extraction(self, job, images, success_text, on_complete):
+        """Drain extraction events without blocking; reschedules itself until the job ends."""
+        while True:
+            try:
+                event = job.events.get_nowait()
+            except queue.Empty:
+                self.root.after(50, self.poll_extraction, job, images, success_text, on_complete)
+                return
+
+            kind = event[0]
+            if kind == "page":
+                images.append(event[2])
+                self.extract_progress.configure(value=len(images))
+                continue
+
+            self.finish_extraction()
+            if kind == "done":
+                total_kb = sum(img.size for img in images) / 1024
+                messagebox.showinfo("Success", success_text +
+                    f"Images saved in memory: {len(images)} ({total_kb:.0f} KB)")
+                if on_complete:
+                    on_complete(images)
+            elif kind == "error":
+                messagebox.showerror("Error", f"Extraction failed:\n{event[1]}")
+            else:
+                logging.info("Extraction cancelled")
+            return
+
+    def cancel_extraction(self):
+        if self.extraction_job:
+            self.extraction_job.cancel()
+
+    def finish_extraction(self):
+        self.extract_progress.pack_forget()
+        self.cancel_extract_btn.pack_forget()
+        self.extract_btn['state'] = tk.NORMAL if self.document else tk.DISABLED
 
     def update_extract_button_text(self):
         if self.chapter_mode.get():
             self.extract_btn.config(text="Extract Chapter")
         else:
             self.extract_btn.config(text="Extract Page")
+        self.schedule_speculation()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
     root = tk.Tk()
     root.geometry("800x600")
     app = PDFViewer(root)
     root.mainloop()
+    app.profiler.stop()
+    app.speculator.shutdown()
+    app.library.close()
@@ -10,3 +10,42 @@ chapter_prompt = (
     "Assist him with any questions. Do not describe or summarize its content, as the user already sees it. "
     "Keep this context in mind for subsequent conversation."
 )
+
+# Used when pages were sent as their text layer (plus cropped figures) instead of images.
+single_page_text_prompt = (
+    "This is the text (and any figures) of the exact page of the book the user is currently on. "
+    "Assist him with any questions. Do not describe or summarize its content, as the user already sees it. "
+    "Keep this context in mind for subsequent conversation."
+)
+
+chapter_text_prompt = (
+    "This is the text (and figures) of an entire chapter from the book the user is reading. "
+    "Assist him with any questions. Do not describe or summarize its content, as the user already sees it. "
+    "Keep this context in mind for subsequent conversation."
+)
+
+chapter_summary_prompt = (
+    "These are the pages of one chapter of a textbook, as page images or as extracted text with cropped figures. "
+    "Write study notes for a self-taught learner: the key concepts, definitions and results, "
+    "worked-example outlines, and the questions a student is most likely to struggle with."
+)
+
+window_notes_prompt = (
+    "These are pages {first}-{last} of the chapter \"{title}\" of a textbook, "
+    "as page images or as extracted text with cropped figures. "
+    "Write compact notes on them for a self-taught learner: key concepts, definitions, "
+    "formulas and results, and outlines of worked examples. Do not add an introduction."
+)
+
+chapter_digest_prompt = (
+    "Below are notes on consecutive parts of the chapter \"{title}\" of a textbook. "
+    "Merge them into one digest of at most {words} words that keeps every definition, "
+    "formula and result, in the chapter's order, without repeating yourself."
+)
+
+chapter_digest_context_prompt = (
+    "This is a digest of the chapter \"{title}\" (pages {first}-{last}) of the book the user is reading, "
+    "made because the chapter is too long to include as images. "
+    "Assist him with any questions. Do not summarize it back, as the user already sees the chapter. "
+    "Keep this context in mind for subsequent conversation."
+)
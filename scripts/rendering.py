@@ -0,0 +1,19 @@
+from metrics import span
+
+
+def render_pixmap(doc, page_num, zoom, clip=None):
+    """Rasterise a page (optionally only the clip rectangle, in page units) at the given zoom."""
+    import fitz
+    with span("page_render", kind="tile" if clip is not None else "page"):
+        page = doc.load_page(page_num)
+        return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)
+
+
+def pixmap_to_image(pix):
+    from PIL import Image
+    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+
+def image_nbytes(image):
+    """Memory held by a PIL image's pixel data."""
+    return image.width * image.height * len(image.getbands())
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from disk_cache import default_cache_dir
+
+MODES = ("off", "cache", "record", "replay")
+
+
+class ReplayMiss(Exception):
+    """Raised in replay mode when no recorded response exists for a request."""
+
+
+def request_key(model, messages):
+    """
+    Stable hash of a request.
+
+    Image payloads are replaced by their own SHA-256 before hashing, so keys
+    stay cheap to compare and no image data ever ends up in the store.
+    """
+    def canonical(item):
+        if isinstance(item, dict):
+            if item.get("type") == "image_url":
+                url = item["image_url"]["url"]
+                return {"type": "image_url", "sha256": hashlib.sha256(url.encode("utf-8")).hexdigest()}
+            return {k: canonical(v) for k, v in item.items()}
+        if isinstance(item, list):
+            return [canonical(v) for v in item]
+        return item
+
+    payload = json.dumps({"model": model, "messages": canonical(messages)},
+                         sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Local memo of model responses, stored in SQLite.
+
+    Modes:
+      - "off":    never read or write.
+      - "cache":  serve fresh hits, call the API on a miss and store the result.
+      - "record": always call the API and store (overwrite) the result.
+      - "replay": serve only stored responses, ignoring TTL; a miss raises ReplayMiss.
+
+    Args:
+        path (str): SQLite file; defaults to responses.sqlite in the cache directory.
+        mode (str): One of MODES.
+        ttl_seconds (float): Entries older than this are not served in "cache" mode.
+        max_bytes (int): Least recently used entries are evicted beyond this size.
+    """
+
+    def __init__(self, path=None, mode="cache", ttl_seconds=7 * 24 * 3600, max_bytes=100 * 1024 * 1024):
+        if mode not in MODES:
+            raise ValueError(f"Unknown response cache mode: {mode}")
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if mode != "off":
+            self.path = path or os.path.join(default_cache_dir(), "responses.sqlite")
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, response TEXT,"
+                " created REAL, accessed REAL, size INTEGER)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            self._conn.commit()
+
+    @classmethod
+    def from_dict(cls, values):
+        values = dict(values or {})
+        # EDU_LLM_MODE lets benchmarks and offline runs switch mode without editing config.json
+        values["mode"] = os.environ.get("EDU_LLM_MODE", values.get("mode", "cache"))
+        return cls(**values)
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def get(self, model, messages):
+        """
+        Return the stored response for a request, or None when the API should be called.
+
+        Raises:
+            ReplayMiss: In replay mode, when nothing was recorded for this request.
+        """
+        if self.mode in ("off", "record"):
+            return None
+        key = request_key(model, messages)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            fresh = row is not None and (self.mode == "replay" or now - row[1] <= self.ttl_seconds)
+            if fresh:
+                self.hits += 1
+                self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            else:
+                self.misses += 1
+        if fresh:
+            logging.info(f"Response cache hit ({key[:12]})")
+            return row[0]
+        if self.mode == "replay":
+            raise ReplayMiss(f"No recorded response for request {key[:12]}")
+        return None
+
+    def put(self, model, messages, response):
+        if self.mode in ("off", "replay"):
+            return
+        key = request_key(model, messages)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, accessed, size)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, now, now, len(response.encode("utf-8")))
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        if self.mode != "record":
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if excess <= 0:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            excess -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'mode': self.mode,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,222 @@
+import heapq
+import logging
+import math
+import re
+from collections import Counter
+
+from context_manager import image_urls, text_parts
+from metrics import span
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+PAGE_MARKER_RE = re.compile(r"^\[Page (\d+)\]\n")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from had has have how i if in into is it its me my no not of "
+    "on or our so than that the their them then there these they this to was we were what when where which who "
+    "why will with you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Incremental in-memory BM25 index.
+
+    Postings map each term to {doc id: term frequency}, so a query only
+    touches the documents that contain one of its terms.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, doc_id, tokens):
+        for term, count in Counter(tokens).items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        self.lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def clear(self):
+        self.postings.clear()
+        self.lengths.clear()
+        self.total_length = 0
+
+    def search(self, tokens, limit=None):
+        """[(score, doc id)] for documents matching any query term, best first."""
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average = self.total_length / count or 1.0
+        scores = {}
+        for term in set(tokens):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+        ranked = ((score, doc_id) for doc_id, score in scores.items())
+        return heapq.nlargest(limit, ranked) if limit else sorted(ranked, reverse=True)
+
+
+class ContextRetriever:
+    """
+    Picks the past context relevant to the latest user message, so long
+    conversations are not resent in full on every turn.
+
+    Past chat turns and page texts are indexed with BM25 as they are added.
+    For each request the retriever keeps:
+
+    - the last ``recent_window`` messages unchanged,
+    - the most recent page context (the pages currently being studied),
+    - the ``top_k`` best matching earlier exchanges (a question with its
+      answer) and page excerpts, within ``max_tokens``,
+
+    in their original order. Conversations shorter than ``min_messages`` are
+    passed through untouched. The index assumes the conversation only grows
+    by appending; when it is replaced (another session) it is rebuilt.
+
+    Args:
+        recent_window (int): Most recent messages always sent.
+        top_k (int): Most retrieved exchanges and excerpts added per request.
+        max_tokens (int): Estimated token budget for the retrieved items.
+        min_messages (int): Below this length the whole conversation is sent.
+        chars_per_token (int): Rough characters-per-token ratio for the budget.
+    """
+
+    def __init__(self, enabled=True, recent_window=6, top_k=8, max_tokens=6000, min_messages=24,
+                 chars_per_token=4, k1=1.2, b=0.75):
+        self.enabled = enabled
+        self.recent_window = recent_window
+        self.top_k = top_k
+        self.max_tokens = max_tokens
+        self.min_messages = min_messages
+        self.chars_per_token = chars_per_token
+        self.index = BM25Index(k1, b)
+        self._messages = []  # Indexed messages, in conversation order
+        self._docs = {}  # doc id -> (message index, page text or None for the whole message)
+        self._contexts = []  # Indexes of messages holding page images
+
+    @classmethod
+    def from_dict(cls, values):
+        """Build from the optional "RETRIEVAL" config section."""
+        return cls(**(values or {}))
+
+    def _sync(self, conversation):
+        """Index messages appended since the last call; rebuild if the conversation was replaced."""
+        indexed = len(self._messages)
+        if indexed > len(conversation) or (indexed and (conversation[0] is not self._messages[0] or
+                                                        conversation[indexed - 1] is not self._messages[-1])):
+            self.index.clear()
+            self._messages, self._docs, self._contexts = [], {}, []
+            indexed = 0
+        for position in range(indexed, len(conversation)):
+            message = conversation[position]
+            self._messages.append(message)
+            self._add(position, message)
+
+    def _add(self, position, message):
+        if image_urls(message):
+            self._contexts.append(position)
+        content = message.get("content")
+        if isinstance(content, str):
+            self._add_doc(position, None, content)
+            return
+        pages = [t for t in text_parts(message) if PAGE_MARKER_RE.match(t)]
+        if pages:
+            # Page context: each page's text is its own excerpt; the prompt is not indexed
+            for text in pages:
+                self._add_doc(position, text, text)
+        elif not image_urls(message):
+            self._add_doc(position, None, "\n".join(text_parts(message)))
+
+    def _add_doc(self, position, excerpt, text):
+        tokens = tokenize(text)
+        if tokens:
+            doc_id = len(self._docs)
+            self._docs[doc_id] = (position, excerpt)
+            self.index.add(doc_id, tokens)
+
+    def _cost(self, text):
+        return len(text) // self.chars_per_token + 1
+
+    def _message_text(self, message):
+        content = message.get("content")
+        return content if isinstance(content, str) else "\n".join(text_parts(message))
+
+    def select(self, conversation):
+        """
+        Messages to send for the next request.
+
+        Args:
+            conversation (list): The full conversation chain; its last message is the query.
+
+        Returns:
+            list: A subset of the conversation (plus excerpt messages), in order.
+        """
+        if not self.enabled or len(conversation) < self.min_messages:
+            return conversation
+        with span("retrieval"):
+            return self._select(conversation)
+
+    def _select(self, conversation):
+        self._sync(conversation)
+        recent_start = len(conversation) - self.recent_window
+        chosen = set(range(recent_start, len(conversation)))
+        older_contexts = [p for p in self._contexts if p < recent_start]
+        if older_contexts:
+            chosen.add(older_contexts[-1])
+
+        query = next((m["content"] for m in reversed(conversation)
+                      if m["role"] == "user" and isinstance(m.get("content"), str)), "")
+        excerpts = {}  # message index -> page texts
+        budget = self.max_tokens
+        picked = 0
+        # Candidates in the recent window are skipped, so look a little past top_k
+        limit = 4 * self.top_k + 2 * self.recent_window
+        for _score, doc_id in self.index.search(tokenize(query), limit):
+            if picked >= self.top_k:
+                break
+            position, excerpt = self._docs[doc_id]
+            if position in chosen or position >= recent_start:
+                continue
+            if excerpt is not None:
+                cost = self._cost(excerpt)
+                if cost > budget:
+                    continue
+                excerpts.setdefault(position, []).append(excerpt)
+            else:
+                # A question comes with its answer and an answer with its question
+                unit = [position]
+                role = conversation[position]["role"]
+                if role == "user" and position + 1 < recent_start and conversation[position + 1]["role"] == "assistant":
+                    unit.append(position + 1)
+                elif role == "assistant" and position > 0 and conversation[position - 1]["role"] == "user":
+                    unit.insert(0, position - 1)
+                unit = [p for p in unit if p not in chosen]
+                cost = sum(self._cost(self._message_text(conversation[p])) for p in unit)
+                if not unit or cost > budget:
+                    continue
+                chosen.update(unit)
+            budget -= cost
+            picked += 1
+
+        selected = []
+        for position in sorted(chosen | set(excerpts)):
+            if position in chosen:
+                selected.append(conversation[position])
+            else:
+                text = "\n\n".join(excerpts[position])
+                selected.append({"role": "user", "content": f"[Excerpts from earlier page context]\n{text}"})
+        logging.info("Retrieval: %d of %d messages sent (%d retrieved, %d excerpt messages, ~%d tokens)",
+                     len(selected), len(conversation), picked, len(excerpts), self.max_tokens - budget)
+        return selected
@@ -0,0 +1,248 @@
+"""
+Full-text search over a document's text layer.
+
+Each page's words are indexed in SQLite FTS5 together with their
+rectangles, in one database per document hash. The index is built in the
+background the first time a book is opened and resumes where it stopped:
+
+    index = SearchIndex(document.digest)
+    SearchIndexer(index, document.path, document.page_count).start()
+    result = index.search('"conservation of energy" entrop*')
+    result.pages, result.rects(result.pages[0])
+
+Queries accept words (all must occur on the page), "quoted phrases" and
+prefixes ending in ``*``.
+"""
+import logging
+import os
+import re
+import sqlite3
+import struct
+import threading
+
+from disk_cache import default_cache_dir
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+QUERY_RE = re.compile(r'"([^"]*)"(\*?)|(\S+)')
+
+
+def search_dir(cache_dir=None):
+    """Search databases live beside the DiskCache shards, which its eviction leaves alone."""
+    return os.path.join(cache_dir or default_cache_dir(), "search")
+
+
+def page_words(page):
+    """(tokens, rects) for a page: lowercase word pieces, each with its word's rectangle."""
+    tokens, rects = [], []
+    # (x0, y0, x1, y1, word, block_no, line_no, word_no)
+    for x0, y0, x1, y1, word, *_ in page.get_text("words", sort=True):
+        for token in TOKEN_RE.findall(word.lower()):
+            tokens.append(token)
+            rects.append((x0, y0, x1, y1))
+    return tokens, rects
+
+
+def parse_query(query):
+    """
+    Terms of a query, each a list of (token, is_prefix) that must appear consecutively.
+
+    'energy "first law" therm*' -> [[("energy", False)], [("first", False), ("law", False)], [("therm", True)]]
+    """
+    terms = []
+    for phrase, phrase_star, word in QUERY_RE.findall(query):
+        text = phrase if phrase or phrase_star else word
+        tokens = TOKEN_RE.findall(text.lower())
+        if not tokens:
+            continue
+        prefix = bool(phrase_star) or (bool(word) and word.endswith("*"))
+        terms.append([(t, False) for t in tokens[:-1]] + [(tokens[-1], prefix)])
+    return terms
+
+
+def fts_query(terms):
+    """FTS5 MATCH expression for parsed terms; every token is quoted, so no user text is parsed as syntax."""
+    parts = []
+    for term in terms:
+        phrase = '"' + " ".join(token for token, _ in term) + '"'
+        parts.append(phrase + (" *" if term[-1][1] else ""))
+    return " AND ".join(parts)
+
+
+def find_term(tokens, term):
+    """Start positions where term's tokens occur consecutively in tokens."""
+    matches = []
+    for i in range(len(tokens) - len(term) + 1):
+        for offset, (token, prefix) in enumerate(term):
+            candidate = tokens[i + offset]
+            if not (candidate.startswith(token) if prefix else candidate == token):
+                break
+        else:
+            matches.append(i)
+    return matches
+
+
+class SearchResult:
+    """
+    Pages matching a query, in page order.
+
+    Hit rectangles (in page units) are only worked out for the pages asked
+    for, typically the one on screen, so a query touching most of a large
+    book still returns in milliseconds.
+    """
+
+    def __init__(self, index, terms, pages):
+        self.index = index
+        self.terms = terms
+        self.pages = pages
+        self._rects = {}
+
+    def __len__(self):
+        return len(self.pages)
+
+    def rects(self, page_num):
+        """Rectangles of every match on a page, one per matched word."""
+        rects = self._rects.get(page_num)
+        if rects is None:
+            rects = self._rects[page_num] = self.index.hit_rects(page_num, self.terms)
+        return rects
+
+    def __repr__(self):
+        return f"SearchResult({len(self.pages)} pages)"
+
+
+class SearchIndex:
+    """
+    Persistent full-text index of one document (SQLite FTS5, WAL).
+
+    ``text`` holds each page's tokens, with the page number as rowid;
+    ``rects`` holds their rectangles as packed floats, in the same order.
+
+    Args:
+        digest (str): Document content hash; names the database file.
+        directory (str): Defaults to <cache dir>/search.
+    """
+
+    def __init__(self, digest, directory=None):
+        self.digest = digest
+        directory = directory or search_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{digest}.sqlite")
+        self._conn = self.connect()
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """A new connection with the schema in place; the indexer thread uses its own."""
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS text USING fts5(body, tokenize='unicode61 remove_diacritics 0')")
+        conn.execute("CREATE TABLE IF NOT EXISTS rects (page INTEGER PRIMARY KEY, data BLOB)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.commit()
+        return conn
+
+    def indexed_pages(self):
+        with self._lock:
+            return {page for (page,) in self._conn.execute("SELECT page FROM rects")}
+
+    def is_complete(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'complete'").fetchone()
+        return row is not None
+
+    def search(self, query, limit=None):
+        """
+        Pages matching query.
+
+        Args:
+            query (str): Words, "quoted phrases" and prefix* terms; all must match.
+            limit (int): Most pages returned; all by default.
+
+        Returns:
+            SearchResult: Matching pages in order, with rectangles on demand.
+        """
+        terms = parse_query(query)
+        if not terms:
+            return SearchResult(self, terms, [])
+        with self._lock:
+            rows = self._conn.execute("SELECT rowid FROM text WHERE text MATCH ? ORDER BY rowid LIMIT ?",
+                                      (fts_query(terms), -1 if limit is None else limit)).fetchall()
+        return SearchResult(self, terms, [page_num for (page_num,) in rows])
+
+    def hit_rects(self, page_num, terms):
+        """Rectangles of the words matching parsed terms on one page."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text.body, rects.data FROM text JOIN rects ON rects.page = text.rowid WHERE text.rowid = ?",
+                (page_num,)).fetchone()
+        if row is None:
+            return []
+        tokens = row[0].split(" ")
+        boxes = struct.unpack(f"!{len(row[1]) // 4}f", row[1])
+        rects = []
+        for term in terms:
+            for start in find_term(tokens, term):
+                # One rectangle per word; a phrase spanning lines gives several
+                for i in range(start, start + len(term)):
+                    rect = tuple(boxes[4 * i:4 * i + 4])
+                    if rect not in rects:
+                        rects.append(rect)
+        return rects
+
+
+class SearchIndexer:
+    """
+    Background thread indexing the pages a SearchIndex does not have yet.
+
+    It opens its own fitz handle, so it never contends with rendering for the
+    document lock, and commits every ``batch_pages`` pages, so a book closed
+    halfway resumes from there next time. ``on_progress(done, total)`` is
+    called from the indexer thread after each commit.
+    """
+
+    def __init__(self, index, path, page_count, on_progress=None, batch_pages=50):
+        self.index = index
+        self.path = path
+        self.page_count = page_count
+        self.on_progress = on_progress
+        self.batch_pages = batch_pages
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="search-indexer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        from document import open_document
+        try:
+            done = self.index.indexed_pages()
+            todo = [p for p in range(self.page_count) if p not in done]
+            if not todo:
+                return
+            logging.info(f"Indexing {len(todo)} pages for search")
+            doc = open_document(self.path)
+            conn = self.index.connect()
+            try:
+                for start in range(0, len(todo), self.batch_pages):
+                    with conn:
+                        for page_num in todo[start:start + self.batch_pages]:
+                            if self._stopped.is_set():
+                                return
+                            tokens, rects = page_words(doc.load_page(page_num))
+                            conn.execute("INSERT INTO text (rowid, body) VALUES (?, ?)", (page_num, " ".join(tokens)))
+                            flat = [v for rect in rects for v in rect]
+                            conn.execute("INSERT INTO rects (page, data) VALUES (?, ?)",
+                                         (page_num, struct.pack(f"!{len(flat)}f", *flat)))
+                    if self.on_progress is not None:
+                        self.on_progress(len(done) + min(len(todo), start + self.batch_pages), self.page_count)
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('complete', '1')")
+                logging.info(f"Search index complete: {self.page_count} pages")
+            finally:
+                conn.close()
+                doc.close()
+        except Exception as e:
+            logging.error(f"Search indexing failed: {str(e)}")
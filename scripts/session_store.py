@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from blob_store import default_data_dir
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS books ("
+    " digest TEXT PRIMARY KEY, path TEXT, title TEXT, opened REAL)",
+    "CREATE TABLE IF NOT EXISTS sessions ("
+    " id TEXT PRIMARY KEY, book TEXT, learner TEXT, started REAL, updated REAL)",
+    "CREATE INDEX IF NOT EXISTS sessions_book_updated ON sessions(book, learner, updated)",
+    # kind: "chat" for turns typed or streamed, "context" for page contexts, "digest" for chapter digests.
+    # Image parts are stored as blob references (see blob_store.py), never inline.
+    "CREATE TABLE IF NOT EXISTS messages ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT, session TEXT, book TEXT, chapter TEXT,"
+    " first_page INTEGER, last_page INTEGER, role TEXT, kind TEXT, content TEXT, created REAL)",
+    "CREATE INDEX IF NOT EXISTS messages_session ON messages(session, id)",
+    "CREATE INDEX IF NOT EXISTS messages_chapter ON messages(book, chapter, id)",
+    "CREATE TABLE IF NOT EXISTS progress ("
+    " learner TEXT, book TEXT, chapter TEXT, first_page INTEGER, status TEXT,"
+    " contexts INTEGER DEFAULT 0, questions INTEGER DEFAULT 0, first_seen REAL, last_seen REAL, notes TEXT,"
+    " PRIMARY KEY (learner, book, chapter))",
+)
+
+
+class SessionStore:
+    """
+    Persistent sessions, messages and learner progress in SQLite (WAL).
+
+    Reads run on the calling thread and only touch indexed ranges, so loading
+    the latest session of a book with a long history stays fast. Writes are
+    queued to a single writer thread and committed in batches; the UI thread
+    never waits on the disk. Session ids are generated here, so a new session
+    can be used before its row is written.
+
+    Args:
+        path (str): SQLite file; defaults to sessions.sqlite in the data directory.
+        learner (str): Whose sessions and progress are read and written.
+        max_loaded_messages (int): Most recent messages loaded when a session is resumed.
+    """
+
+    def __init__(self, path=None, learner="default", max_loaded_messages=2000):
+        self.path = path or os.path.join(default_data_dir(), "sessions.sqlite")
+        self.learner = learner
+        self.max_loaded_messages = max_loaded_messages
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_dict(cls, values):
+        """Build from the optional "SESSIONS" config section."""
+        return cls(**(values or {}))
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            batch = [self._writes.get()]
+            # Everything queued meanwhile goes into the same transaction
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            try:
+                with conn:
+                    for item in batch:
+                        if item is None:
+                            stop = True
+                        else:
+                            conn.execute(*item)
+            except sqlite3.Error as e:
+                logging.warning(f"Session store write failed: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+            if stop:
+                conn.close()
+                return
+
+    def _write(self, sql, params):
+        self._writes.put((sql, params))
+
+    def flush(self):
+        """Block until every queued write is committed."""
+        self._writes.join()
+
+    def close(self):
+        self._writes.put(None)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # Books and sessions
+
+    def open_book(self, digest, path, title=None):
+        self._write("INSERT INTO books (digest, path, title, opened) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(digest) DO UPDATE SET path = excluded.path, opened = excluded.opened",
+                    (digest, path, title or os.path.basename(path), time.time()))
+
+    def recent_books(self, limit=20):
+        """[(digest, path, title, opened)], most recently opened first."""
+        return self._read("SELECT digest, path, title, opened FROM books ORDER BY opened DESC LIMIT ?", (limit,))
+
+    def start_session(self, book):
+        """Create a session for a book (digest) and return its id."""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        self._write("INSERT INTO sessions (id, book, learner, started, updated) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, book, self.learner, now, now))
+        return session_id
+
+    def latest_session(self, book):
+        """Id of the learner's most recently updated session for a book, or None."""
+        rows = self._read("SELECT id FROM sessions WHERE book = ? AND learner = ? ORDER BY updated DESC LIMIT 1",
+                          (book, self.learner))
+        return rows[0][0] if rows else None
+
+    def load_messages(self, session_id):
+        """The session's most recent messages (at most max_loaded_messages), oldest first."""
+        rows = self._read("SELECT content FROM messages WHERE session = ? ORDER BY id DESC LIMIT ?",
+                          (session_id, self.max_loaded_messages))
+        return [json.loads(content) for (content,) in reversed(rows)]
+
+    def resume(self, book):
+        """(session id, messages) of the latest session for a book, starting a new one if there is none."""
+        # Messages of a book switched away from a moment ago may still be queued
+        self.flush()
+        session_id = self.latest_session(book)
+        if session_id is None:
+            return self.start_session(book), []
+        return session_id, self.load_messages(session_id)
+
+    # Messages
+
+    def append_message(self, session_id, book, message, kind="chat", chapter=None):
+        """
+        Queue one conversation message for writing.
+
+        Args:
+            session_id (str): Session the message belongs to.
+            book (str): Document digest.
+            message (dict): The message as held in the conversation.
+            kind (str): "chat", "context" or "digest".
+            chapter (dict): Chapter the message relates to (title, start, end), if any.
+        """
+        now = time.time()
+        title, first, last = (chapter['title'], chapter['start'], chapter['end']) if chapter else (None, None, None)
+        self._write("INSERT INTO messages (session, book, chapter, first_page, last_page, role, kind, content, created)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (session_id, book, title, first, last, message["role"], kind,
+                     json.dumps(message, separators=(",", ":")), now))
+        self._write("UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id))
+
+    def chapter_history(self, book, chapter_title, limit=200):
+        """[(created, role, kind, message)] about one chapter across all sessions, oldest first."""
+        rows = self._read("SELECT created, role, kind, content FROM messages WHERE book = ? AND chapter = ?"
+                          " ORDER BY id DESC LIMIT ?", (book, chapter_title, limit))
+        return [(created, role, kind, json.loads(content)) for created, role, kind, content in reversed(rows)]
+
+    def book_sessions(self, book, limit=50):
+        """[(id, started, updated)] of the learner's sessions for a book, most recent first."""
+        return self._read("SELECT id, started, updated FROM sessions WHERE book = ? AND learner = ?"
+                          " ORDER BY updated DESC LIMIT ?", (book, self.learner, limit))
+
+    # Progress
+
+    def record_progress(self, book, chapter, status=None, contexts=0, questions=0, notes=None):
+        """
+        Update the learner's record for a chapter.
+
+        Counters are added to; status and notes replace the stored values when given.
+        """
+        now = time.time()
+        self._write(
+            "INSERT INTO progress (learner, book, chapter, first_page, status, contexts, questions,"
+            " first_seen, last_seen, notes) VALUES (?, ?, ?, ?, COALESCE(?, 'started'), ?, ?, ?, ?, ?)"
+            " ON CONFLICT(learner, book, chapter) DO UPDATE SET"
+            " status = COALESCE(?, status), contexts = contexts + excluded.contexts,"
+            " questions = questions + excluded.questions, last_seen = excluded.last_seen,"
+            " notes = COALESCE(excluded.notes, notes)",
+            (self.learner, book, chapter['title'], chapter['start'], status, contexts, questions,
+             now, now, notes, status))
+
+    def progress(self, book):
+        """The learner's chapter records for a book, in page order, as dicts."""
+        rows = self._read("SELECT chapter, first_page, status, contexts, questions, first_seen, last_seen, notes"
+                          " FROM progress WHERE learner = ? AND book = ? ORDER BY first_page",
+                          (self.learner, book))
+        keys = ('chapter', 'first_page', 'status', 'contexts', 'questions', 'first_seen', 'last_seen', 'notes')
+        return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,276 @@
+"""
+Speculative extraction of the chapter being read.
+
+When the reader settles in a chapter, its pages are rendered and encoded
+in the background with the foreground engine's settings and written to the
+disk cache under the same keys, so "Analyze Chapter" only has to read them
+back:
+
+    speculator = SpeculativeExtractor(viewer.extraction_engine)
+    speculator.start(document.path, document.digest, range(40, 62))
+    ...
+    speculator.record_request(document.digest, range(40, 62))  # hit/miss accounting
+"""
+import logging
+import os
+import threading
+
+from disk_cache import make_key
+from extraction import ExtractionEngine
+from metrics import inc, registry, span
+
+
+def available_memory():
+    """Physical memory available to new work, in bytes, or None where the platform does not say."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def cpu_load(own_tasks=0):
+    """One-minute load average per CPU, not counting own_tasks of our own, or None."""
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+    return max(0.0, load - own_tasks) / (os.cpu_count() or 1)
+
+
+class SpeculationSettings:
+    """
+    Limits for pre-extracting the chapter being read.
+
+    Args:
+        enabled (bool): When False nothing is extracted before it is asked for.
+        delay_ms (int): How long the reader must stay in a chapter before it is pre-extracted.
+        workers (int): Low-priority worker processes rendering speculatively.
+        max_load (float): Pause while the load average per CPU (besides our own workers) is above this.
+        min_free_memory (int): Pause while less physical memory than this is available, in bytes.
+        max_pages (int): Longer chapters are not pre-extracted.
+        max_bytes (int): Stop once this many encoded bytes were produced for one chapter.
+    """
+
+    def __init__(self, enabled=True, delay_ms=1500, workers=1, max_load=0.8, min_free_memory=512 * 1024 * 1024,
+                 max_pages=200, max_bytes=64 * 1024 * 1024):
+        self.enabled = enabled
+        self.delay_ms = delay_ms
+        self.workers = workers
+        self.max_load = max_load
+        self.min_free_memory = min_free_memory
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_dict(cls, values):
+        """Build from the optional "SPECULATION" config section."""
+        return cls(**(values or {}))
+
+
+class SpeculativeJob:
+    """One chapter being pre-extracted; ``warmed`` holds the cache entries (make_key names) it produced."""
+
+    def __init__(self, path, digest, page_numbers, budget_pages, byte_budget, keys):
+        self.path = path
+        self.digest = digest
+        self.page_numbers = page_numbers
+        self.budget_pages = budget_pages
+        self.byte_budget = byte_budget
+        self.keys = keys
+        self.warmed = set()
+        self.requested = set()
+        self.produced_bytes = 0
+        self._cancel_event = threading.Event()
+
+    @property
+    def target(self):
+        return (self.digest, tuple(self.page_numbers), self.budget_pages)
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+
+class SpeculativeExtractor:
+    """
+    Pre-extracts one chapter at a time into the disk cache.
+
+    Pages are rendered by a separate pool of ``settings.workers`` processes
+    at lowered priority, one page per worker at a time, and the job pauses
+    while the machine is busy or short of memory. Starting a job for another
+    chapter cancels the current one; asking again for the same chapter is a
+    no-op.
+
+    ``record_request`` is called when extraction is actually requested and
+    counts each page as a hit (pre-extracted), a miss (still to render) or
+    cached (already on disk before), in the ``speculative_pages`` metric.
+    Pre-extracted pages never asked for are counted as unused when the job
+    is replaced.
+
+    Args:
+        engine (ExtractionEngine): Foreground engine whose zoom, settings, text layer and cache are mirrored.
+        settings (SpeculationSettings): CPU and memory limits.
+    """
+
+    def __init__(self, engine, settings=None):
+        self.source = engine
+        self.settings = settings or SpeculationSettings()
+        self.engine = None  # Created on first use
+        self.job = None
+        self.counts = {'hit': 0, 'miss': 0, 'cached': 0, 'unused': 0}
+        self._lock = threading.Lock()
+
+    def _engine(self):
+        """The low-priority engine, with the foreground engine's current settings."""
+        if self.engine is None:
+            self.engine = ExtractionEngine(self.settings.workers, low_priority=True)
+        self.engine.zoom = self.source.zoom
+        self.engine.settings = self.source.settings
+        self.engine.text_layer = self.source.text_layer
+        self.engine.cache = self.source.cache
+        return self.engine
+
+    def byte_budget(self, page_numbers, budget_pages=None):
+        """Per-image byte budget the foreground engine uses for this request."""
+        return self.source.settings.image_budget(budget_pages or len(page_numbers))
+
+    def request_keys(self, digest, page_numbers, budget_pages=None):
+        """Disk cache keys the foreground engine uses for these pages."""
+        page_numbers = list(page_numbers)
+        byte_budget = self.byte_budget(page_numbers, budget_pages)
+        return [self.source.cache_key(digest, page_num, byte_budget) for page_num in page_numbers]
+
+    def start(self, path, digest, page_numbers, budget_pages=None):
+        """
+        Pre-extract pages (a chapter) unless that is already under way.
+
+        Returns:
+            bool: True if a new job was started.
+        """
+        page_numbers = list(page_numbers)
+        if not self.settings.enabled or self.source.cache is None or not page_numbers:
+            return False
+        with self._lock:
+            if self.job is not None and self.job.target == (digest, tuple(page_numbers), budget_pages):
+                return False
+        self.cancel()
+        if len(page_numbers) > self.settings.max_pages:
+            logging.debug(f"Not pre-extracting {len(page_numbers)} pages (limit {self.settings.max_pages})")
+            return False
+        job = SpeculativeJob(path, digest, page_numbers, budget_pages, self.byte_budget(page_numbers, budget_pages),
+                             self.request_keys(digest, page_numbers, budget_pages))
+        with self._lock:
+            self.job = job
+        threading.Thread(target=self._run, args=(job,), name="speculative-extraction", daemon=True).start()
+        return True
+
+    def cancel(self):
+        """Stop the current job and count what it produced but nobody asked for."""
+        with self._lock:
+            job, self.job = self.job, None
+        if job is None:
+            return
+        job.cancel()
+        unused = len(job.warmed - job.requested)
+        if unused:
+            self.counts['unused'] += unused
+            inc("speculative_pages", unused, result="unused")
+
+    def record_request(self, digest, page_numbers, budget_pages=None):
+        """
+        Account for pages about to be extracted in the foreground, and stop
+        speculating on them so the two do not render the same pages.
+        """
+        with self._lock:
+            job = self.job
+        warmed = job.warmed if job is not None and job.digest == digest else set()
+        counts = {'hit': 0, 'miss': 0, 'cached': 0}
+        for key in self.request_keys(digest, page_numbers, budget_pages):
+            name = make_key(*key)
+            if name in warmed:
+                result = 'hit'
+                job.requested.add(name)
+            elif self.source.cache is not None and self.source.cache.contains(key):
+                result = 'cached'
+            else:
+                result = 'miss'
+            counts[result] += 1
+        for result, count in counts.items():
+            if count:
+                self.counts[result] += count
+                inc("speculative_pages", count, result=result)
+        if job is not None:
+            job.cancel()
+        logging.info("Speculation: %d pages pre-extracted, %d already cached, %d to render",
+                     counts['hit'], counts['cached'], counts['miss'])
+        return counts
+
+    def stats(self):
+        counts = dict(self.counts)
+        asked = counts['hit'] + counts['miss']
+        counts['hit_rate'] = counts['hit'] / asked if asked else 0.0
+        return counts
+
+    def _within_budget(self, job, in_flight):
+        """Wait while the machine is busy or short of memory; False if the job was cancelled meanwhile."""
+        while not job.is_cancelled():
+            load = cpu_load(in_flight)
+            free = available_memory()
+            busy = self.settings.max_load is not None and load is not None and load > self.settings.max_load
+            short = free is not None and free < self.settings.min_free_memory
+            if not (busy or short):
+                return True
+            inc("speculation_paused", reason="cpu" if busy else "memory")
+            job._cancel_event.wait(1.0)
+        return False
+
+    def _collect(self, job, key, future):
+        item, worker_metrics = future.result()
+        registry().merge(worker_metrics)
+        # Written synchronously, so the page is on disk before it counts as warmed
+        self.source.cache.put(key, item.to_bytes())
+        job.warmed.add(make_key(*key))
+        job.produced_bytes += item.size
+
+    def _run(self, job):
+        engine = self._engine()
+        cache = engine.cache
+        pending = []  # (key, future), oldest first
+        try:
+            with span("speculation"):
+                for page_num, key in zip(job.page_numbers, job.keys):
+                    if cache.contains(key):
+                        continue
+                    if job.produced_bytes >= self.settings.max_bytes:
+                        logging.info(f"Speculation stopped at the {self.settings.max_bytes / 2**20:.0f} MB budget")
+                        break
+                    if not self._within_budget(job, len(pending)):
+                        break
+                    pending.append((key, engine.submit_page(job.path, page_num, job.byte_budget)))
+                    while len(pending) >= engine.max_workers and not job.is_cancelled():
+                        self._collect(job, *pending.pop(0))
+                    if job.is_cancelled():
+                        break
+                while pending and not job.is_cancelled():
+                    self._collect(job, *pending.pop(0))
+            if not job.is_cancelled():
+                logging.info(f"Pre-extracted {len(job.warmed)} pages ({job.produced_bytes / 1024:.0f} KB)")
+        except Exception as e:
+            logging.warning(f"Speculative extraction failed: {str(e)}")
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        self.cancel()
+        if self.engine is not None:
+            self.engine.shutdown()
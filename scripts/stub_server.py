@@ -0,0 +1,163 @@
+"""
+Minimal OpenAI-compatible chat completions server for offline testing.
+
+Point ImageAnalysisService at it with base_url=StubServer(...).base_url, or run
+it standalone and set OPENROUTER_BASE_URL in config.json:
+
+    python scripts/stub_server.py --port 8001 --delay 0.05
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug("stub: " + format % args)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests.append(request)
+
+        reply = self.server.reply_text
+        model = request.get("model", "stub")
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+            self.stream_reply(reply, model, include_usage)
+        else:
+            time.sleep(self.server.delay * max(1, len(reply.split())))
+            self.send_json({
+                "id": "stub-completion",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(reply.split()), "total_tokens": len(reply.split())}
+            })
+
+    def send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_reply(self, reply, model, include_usage=False):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        words = reply.split(" ")
+        try:
+            for i, word in enumerate(words):
+                time.sleep(self.server.delay)
+                piece = word if i == 0 else " " + word
+                self.send_event({
+                    "id": "stub-completion",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                })
+            self.send_event({
+                "id": "stub-completion",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            })
+            if include_usage:
+                self.send_event({
+                    "id": "stub-completion",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)}
+                })
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the generation.
+            self.server.cancelled += 1
+
+    def send_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+class StubServer:
+    """
+    Runs the stub in a background thread; usable as a context manager.
+
+    Args:
+        reply_text (str): Text returned for every request (streamed word by word).
+        delay (float): Seconds to wait before each streamed word.
+        port (int): Port to bind; 0 picks a free one.
+    """
+
+    def __init__(self, reply_text="This is a stub response.", delay=0.0, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.reply_text = reply_text
+        self.httpd.delay = delay
+        self.httpd.requests = []
+        self.httpd.cancelled = 0
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="stub-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.05, help="Seconds between streamed words")
+    parser.add_argument("--reply", default="This is a stub response from the local test server.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    server = StubServer(args.reply, args.delay, port=args.port)
+    logging.info(f"Stub server listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,129 @@
+"""
+Synthetic textbooks for benchmarks and manual testing.
+
+Generates PDFs with a given page count, table-of-contents depth and figure
+density, deterministically from a seed:
+
+    python scripts/synthetic_pdf.py book.pdf --pages 300 --toc-depth 3 --figure-every 4
+"""
+import argparse
+import io
+import random
+
+WORDS = (
+    "energy matrix theorem proof derivative integral cell protein reaction equilibrium "
+    "vector field entropy function limit series graph node algorithm complexity market "
+    "supply demand model variable constant force mass velocity acceleration wave photon "
+    "electron membrane enzyme gradient probability distribution sample estimate error"
+).split()
+
+
+def _sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _toc(rng, page_count, depth, chapters):
+    """[level, title, page] entries: chapters split into nested sections down to depth."""
+    toc = []
+    step = max(1, page_count // chapters)
+    for c in range(chapters):
+        start = c * step + 1
+        end = page_count if c == chapters - 1 else (c + 1) * step
+        if start > page_count:
+            break
+        toc.append([1, f"Chapter {c + 1} {rng.choice(WORDS).title()}", start])
+        _sections(rng, toc, [c + 1], start, end, 2, depth)
+    return toc
+
+
+def _sections(rng, toc, numbers, start, end, level, depth):
+    if level > depth or end - start < 2:
+        return
+    count = rng.randint(2, 4)
+    step = max(1, (end - start + 1) // count)
+    for s in range(count):
+        first = start + s * step
+        if first > end:
+            break
+        last = end if s == count - 1 else min(end, first + step - 1)
+        label = ".".join(str(n) for n in numbers + [s + 1])
+        toc.append([level, f"{label} {rng.choice(WORDS).title()}", first])
+        _sections(rng, toc, numbers + [s + 1], first, last, level + 1, depth)
+
+
+def _raster_figure(rng, size=(320, 240)):
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - 20, y - 20, x + 20, y + 20), fill=colour)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _vector_figure(rng, page, rect):
+    import fitz
+    page.draw_rect(rect, color=(0, 0, 0), width=0.8)
+    points = [fitz.Point(rect.x0 + i * rect.width / 20, rect.y1 - rng.random() * rect.height) for i in range(21)]
+    page.draw_polyline(points, color=(0.1, 0.3, 0.8), width=1.2)
+    for i in range(1, 5):
+        y = rect.y0 + i * rect.height / 5
+        page.draw_line(fitz.Point(rect.x0, y), fitz.Point(rect.x1, y), color=(0.8, 0.8, 0.8), width=0.4)
+
+
+def make_textbook(path, pages=100, toc_depth=2, figure_every=5, chapters=None, lines_per_page=38, seed=0):
+    """
+    Write a synthetic textbook to path.
+
+    Args:
+        pages (int): Page count.
+        toc_depth (int): Deepest TOC level (1 = chapters only).
+        figure_every (int): Every n-th page gets a figure (alternately vector and raster); 0 for none.
+        chapters (int): Top-level chapters; defaults to one per ~20 pages.
+        lines_per_page (int): Lines of body text on each page.
+        seed (int): Seed for the generated text and figures.
+
+    Returns:
+        list: The table of contents that was written.
+    """
+    import fitz
+    rng = random.Random(seed)
+    doc = fitz.open()
+    raster = _raster_figure(rng)
+    for i in range(pages):
+        page = doc.new_page(width=595, height=842)
+        has_figure = figure_every and i % figure_every == 0
+        lines = lines_per_page // 2 if has_figure else lines_per_page
+        page.insert_text((60, 60), f"Page {i + 1}", fontsize=9)
+        for j in range(lines):
+            page.insert_text((60, 90 + j * 18), _sentence(rng, 11), fontsize=10)
+        if has_figure:
+            rect = fitz.Rect(80, 90 + lines * 18 + 20, 515, 800)
+            if (i // figure_every) % 2:
+                page.insert_image(rect, stream=raster)
+            else:
+                _vector_figure(rng, page, rect)
+    toc = _toc(rng, pages, toc_depth, chapters or max(1, pages // 20))
+    doc.set_toc(toc)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return toc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic textbook PDF")
+    parser.add_argument("output")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--toc-depth", type=int, default=2)
+    parser.add_argument("--figure-every", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    toc = make_textbook(args.output, args.pages, args.toc_depth, args.figure_every, seed=args.seed)
+    print(f"Wrote {args.output}: {args.pages} pages, {len(toc)} TOC entries")
+
+
+if __name__ == "__main__":
+    main()
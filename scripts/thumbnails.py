@@ -0,0 +1,99 @@
+import io
+import logging
+import os
+import struct
+import threading
+
+from disk_cache import default_cache_dir
+
+RECORD = struct.Struct("!II")  # page number, JPEG length
+
+
+def thumbnail_dir(cache_dir=None):
+    """Thumbnail packs live beside the DiskCache shards, which its eviction leaves alone."""
+    return os.path.join(cache_dir or default_cache_dir(), "thumbnails")
+
+
+def render_thumbnail(document, page_num, width, quality=70):
+    """JPEG bytes of a page scaled to width pixels."""
+    page_width, _ = document.page_size(page_num)
+    image = document.render_image(page_num, width / page_width)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+class ThumbnailStore:
+    """
+    Page thumbnails of one document, kept in a single append-only pack file.
+
+    The whole pack is read when the document is opened, so a book that was
+    browsed before shows every thumbnail at once, without rasterising. New
+    thumbnails are appended as they are rendered; a record cut short by a
+    crash is ignored on the next load.
+
+    Implements the ``contains``/``put`` part of RenderCache, so a
+    PagePrefetcher can fill it. Keys are (digest, page, width).
+
+    Args:
+        digest (str): Document content hash.
+        width (int): Thumbnail width in pixels; each width has its own pack.
+        directory (str): Defaults to <cache dir>/thumbnails.
+    """
+
+    def __init__(self, digest, width, directory=None):
+        self.digest = digest
+        self.width = width
+        directory = directory or thumbnail_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{digest}-{width}.thumbs")
+        self._thumbnails = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        offset = 0
+        while offset + RECORD.size <= len(data):
+            page_num, length = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            if offset + length > len(data):
+                break
+            self._thumbnails[page_num] = data[offset:offset + length]
+            offset += length
+        if offset < len(data):
+            # Cut the partial record so later appends stay aligned
+            logging.warning(f"Dropping truncated thumbnail record in {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+        logging.info(f"Loaded {len(self._thumbnails)} thumbnails from {self.path}")
+
+    def __len__(self):
+        return len(self._thumbnails)
+
+    def key(self, page_num):
+        return (self.digest, page_num, self.width)
+
+    def get(self, page_num):
+        """JPEG bytes of a page's thumbnail, or None."""
+        return self._thumbnails.get(page_num)
+
+    def contains(self, key):
+        return key[0] == self.digest and key[1] in self._thumbnails
+
+    def put(self, key, data, size=None):
+        page_num = key[1]
+        with self._lock:
+            # A render that started before another document was opened
+            if key[0] != self.digest or page_num in self._thumbnails:
+                return
+            self._thumbnails[page_num] = data
+            try:
+                with open(self.path, "ab") as f:
+                    f.write(RECORD.pack(page_num, len(data)) + data)
+            except OSError as e:
+                logging.warning(f"Thumbnail write failed: {str(e)}")
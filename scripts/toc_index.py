@@ -0,0 +1,167 @@
+import logging
+from bisect import bisect_right
+from collections import OrderedDict
+
+from metrics import span
+
+
+def clean_title(title):
+    return "".join(c if c.isalnum() else "_" for c in title.strip())
+
+
+class TocNode:
+    """One table-of-contents entry covering the 0-based pages start..end."""
+
+    __slots__ = ("title", "depth", "start", "end", "parent", "children")
+
+    def __init__(self, title, depth, start, parent=None):
+        self.title = title
+        self.depth = depth
+        self.start = start
+        self.end = start
+        self.parent = parent
+        self.children = []
+
+    def __repr__(self):
+        return f"TocNode({self.title!r}, depth={self.depth}, pages {self.start+1}-{self.end+1})"
+
+
+class TocIndex:
+    """
+    Hierarchical index of a document's table of contents.
+
+    Built from ``doc.get_toc()`` output in one pass. Malformed entries are
+    repaired: levels that skip a step are attached to the nearest open parent,
+    missing or out-of-range pages inherit the previous entry's page, and
+    siblings listed out of page order are sorted. Every node's range lies
+    inside its parent's.
+
+    For each depth, node start pages are kept in a sorted array, so looking up
+    which section contains a page takes O(log n) at any depth.
+
+    Args:
+        toc (list): [level, title, page] entries with 1-based pages.
+        page_count (int): Number of pages in the document.
+    """
+
+    def __init__(self, toc, page_count):
+        self.page_count = page_count
+        last_page = max(0, page_count - 1)
+        self.root = TocNode("Full Document", 0, 0)
+        self.root.end = last_page
+        self.max_depth = 0
+
+        # Build the tree with a stack of open ancestors.
+        stack = [self.root]
+        previous_start = 0
+        for entry in toc:
+            level, title, page = entry[0], entry[1], entry[2]
+            level = max(1, min(int(level), len(stack)))
+            if isinstance(page, int) and 1 <= page <= page_count:
+                start = page - 1
+            else:
+                start = previous_start
+            previous_start = start
+            del stack[level:]
+            parent = stack[-1]
+            node = TocNode(title, level, start, parent)
+            parent.children.append(node)
+            stack.append(node)
+            self.max_depth = max(self.max_depth, level)
+
+        # Assign ranges top-down; a node ends where its next sibling starts.
+        self.levels = {}
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            children = node.children
+            for child in children:
+                child.start = min(max(child.start, node.start), node.end)
+            if any(children[i].start > children[i + 1].start for i in range(len(children) - 1)):
+                children.sort(key=lambda c: c.start)
+            for i, child in enumerate(children):
+                end = children[i + 1].start - 1 if i + 1 < len(children) else node.end
+                child.end = max(child.start, min(end, node.end))
+            # Reversed so children are visited in page order (pre-order traversal).
+            pending.extend(reversed(children))
+            if node is not self.root:
+                starts, nodes = self.levels.setdefault(node.depth, ([], []))
+                starts.append(node.start)
+                nodes.append(node)
+
+        self.chapters = self._build_chapters()
+        self._chapter_starts = [ch['start'] for ch in self.chapters]
+
+    def _build_chapters(self):
+        """Deepest subdivisions as chapter dicts, each running up to the next one."""
+        leaves = []
+        pending = list(reversed(self.root.children))
+        while pending:
+            node = pending.pop()
+            if node.children:
+                pending.extend(reversed(node.children))
+            else:
+                leaves.append(node)
+
+        if not leaves:
+            return [{'title': 'Full Document', 'start': 0, 'end': max(0, self.page_count - 1)}]
+
+        chapters = []
+        for i, node in enumerate(leaves):
+            end = leaves[i + 1].start - 1 if i + 1 < len(leaves) else self.page_count - 1
+            chapters.append({
+                'title': clean_title(node.title),
+                'start': node.start,
+                'end': max(node.start, min(end, self.page_count - 1)),
+            })
+        return chapters
+
+    def node_at(self, page_num, depth):
+        """Section at the given depth containing page_num, or None."""
+        starts, nodes = self.levels.get(depth, ((), ()))
+        i = bisect_right(starts, page_num) - 1
+        if i >= 0 and nodes[i].start <= page_num <= nodes[i].end:
+            return nodes[i]
+        return None
+
+    def path_for_page(self, page_num):
+        """Sections containing page_num, from the top level down to the deepest one."""
+        path = []
+        for depth in range(1, self.max_depth + 1):
+            node = self.node_at(page_num, depth)
+            if node is None or (path and node.parent is not path[-1]):
+                break
+            path.append(node)
+        return path
+
+    def chapter_for_page(self, page_num):
+        """Chapter dict containing page_num, or None."""
+        i = bisect_right(self._chapter_starts, page_num) - 1
+        if i >= 0 and self.chapters[i]['start'] <= page_num <= self.chapters[i]['end']:
+            return self.chapters[i]
+        return None
+
+
+# Indexes of recently opened documents, keyed by content hash.
+_index_cache = OrderedDict()
+INDEX_CACHE_SIZE = 16
+
+
+def index_for_document(doc, digest=None, toc=None):
+    """
+    Build (or reuse, when the same content was indexed before) the TocIndex for an open document.
+
+    A toc already read from the document (e.g. from the library catalogue) saves calling get_toc().
+    """
+    if digest is not None and digest in _index_cache:
+        _index_cache.move_to_end(digest)
+        return _index_cache[digest]
+    with span("toc_parse"):
+        index = TocIndex(doc.get_toc() if toc is None else toc, len(doc))
+    logging.info(f"Indexed {sum(len(n) for _, n in index.levels.values())} TOC entries, "
+                 f"{len(index.chapters)} subdivisions")
+    if digest is not None:
+        _index_cache[digest] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
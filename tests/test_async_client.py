@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+
+pytest.importorskip("openai")
+
+from async_image_analysis import AsyncImageAnalysisService, TokenBucket
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = None
+
+
+class Stream:
+    """Two chunks, then waits forever (a stalled server)."""
+
+    def __init__(self):
+        self.sent = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self.sent += 1
+        if self.sent > 2:
+            await asyncio.sleep(3600)
+        delta = types.SimpleNamespace(content=f"t{self.sent}")
+        return types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(delta=delta)])
+
+    async def close(self):
+        self.closed = True
+
+
+def service(create, max_concurrency=4):
+    svc = AsyncImageAnalysisService("key", max_concurrency=max_concurrency, backoff_base=0.001, backoff_max=0.001)
+    svc._client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+    svc._semaphore = asyncio.Semaphore(max_concurrency)
+    svc._bucket = TokenBucket(1000, 1000)
+    return svc
+
+
+def test_token_bucket_limits_the_rate_after_a_burst():
+    async def run():
+        bucket = TokenBucket(rate=50, capacity=2)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - started
+    # Two requests pass at once, the other three wait 1/50 s each
+    assert 0.05 <= asyncio.run(run()) < 0.5
+
+
+def test_retryable_errors_are_retried():
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) < 3:
+            raise StatusError(503)
+        return "completion"
+
+    async def run():
+        return await service(create).create_completion(model="m", messages=[])
+    assert asyncio.run(run()) == "completion"
+    assert len(calls) == 3
+
+
+def test_other_errors_are_raised_at_once():
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        raise StatusError(400)
+
+    async def run():
+        await service(create).create_completion(model="m", messages=[])
+    with pytest.raises(StatusError):
+        asyncio.run(run())
+    assert len(calls) == 1
+
+
+def test_stream_holds_its_slot_and_cancels_a_stalled_read():
+    stream = Stream()
+
+    async def create(**kwargs):
+        return stream
+
+    async def run():
+        svc = service(create, max_concurrency=1)
+        cancel = threading.Event()
+        chunks = svc.stream_chat_message([{"role": "user", "content": "hi"}], cancel)
+        received = [await chunks.__anext__(), await chunks.__anext__()]
+        held = svc._semaphore.locked()
+        threading.Timer(0.1, cancel.set).start()
+        with pytest.raises(StopAsyncIteration):
+            await asyncio.wait_for(chunks.__anext__(), 5)
+        return received, held, svc._semaphore.locked()
+
+    received, held, still_held = asyncio.run(run())
+    assert received == ["t1", "t2"]
+    assert held and not still_held
+    assert stream.closed
@@ -0,0 +1,42 @@
+import base64
+import os
+
+from blob_store import BlobStore, is_blob_url
+
+
+def test_images_round_trip_through_references(tmp_path):
+    store = BlobStore(str(tmp_path))
+    part = store.put(b"\x89PNG data", "image/png")
+    url = part["image_url"]["url"]
+    assert is_blob_url(url)
+    assert part["image_url"]["bytes"] == 9
+
+    messages = [{"role": "user", "content": [{"type": "text", "text": "page"}, part]}]
+    resolved = store.resolve(messages)
+    data_url = resolved[0]["content"][1]["image_url"]["url"]
+    assert data_url == "data:image/png;base64," + base64.b64encode(b"\x89PNG data").decode()
+    # The conversation itself keeps the reference
+    assert messages[0]["content"][1]["image_url"]["url"] == url
+
+
+def test_identical_images_are_stored_once(tmp_path):
+    store = BlobStore(str(tmp_path))
+    first = store.put(b"same", "image/webp")
+    second = store.put(b"same", "image/webp")
+    assert first == second
+    assert sum(len(files) for _, _, files in os.walk(tmp_path)) == 1
+
+
+def test_missing_blob_becomes_a_note(tmp_path):
+    store = BlobStore(str(tmp_path))
+    message = {"role": "user", "content": [{"type": "image_url", "image_url": {"url": "blob:" + "0" * 64}}]}
+    resolved = store.resolve([message])
+    assert resolved[0]["content"] == [{"type": "text", "text": "[Image no longer available]"}]
+
+
+def test_messages_without_references_are_not_copied(tmp_path):
+    store = BlobStore(str(tmp_path))
+    messages = [{"role": "user", "content": "plain"},
+                {"role": "user", "content": [{"type": "image_url", "image_url": {"url": "data:image/png;base64,"}}]}]
+    resolved = store.resolve(messages)
+    assert all(a is b for a, b in zip(resolved, messages))
@@ -0,0 +1,73 @@
+import asyncio
+
+from chunked_analysis import ChunkedAnalyzer, split_windows
+
+
+class FakeService:
+    """Answers every request with a numbered note and records what was sent."""
+
+    def __init__(self, fail=()):
+        self.requests = []
+        self.fail = fail
+        self.context_manager = type("Limits", (), {"tokens_per_image": 1000})()
+
+    async def analyze_content(self, parts, prompt):
+        self.requests.append(parts)
+        if len(self.requests) in self.fail:
+            return "Error: boom"
+        return f"notes {len(self.requests)}"
+
+    async def complete(self, messages):
+        self.requests.append(messages)
+        return "digest"
+
+
+def pages(count):
+    return [[{"type": "text", "text": f"page {n}"}] for n in range(count)]
+
+
+def test_split_windows_respects_page_and_byte_limits():
+    assert split_windows([1] * 5, 100, 2) == [(0, 2), (2, 4), (4, 5)]
+    assert split_windows([60, 60, 10], 100, 10) == [(0, 1), (1, 3)]
+    assert split_windows([500], 100, 10) == [(0, 1)]
+    assert split_windows([], 100, 10) == []
+
+
+def test_no_pages_is_an_error_result():
+    service = FakeService()
+    result = asyncio.run(ChunkedAnalyzer(service).analyze([], [], "Blank", 1))
+    assert result.startswith("Error:")
+    assert service.requests == []
+
+
+def test_windows_are_merged_into_a_digest():
+    service = FakeService()
+    analyzer = ChunkedAnalyzer(service, window_pages=2)
+    assert asyncio.run(analyzer.analyze(pages(5), [1] * 5, "Waves", 10)) == "digest"
+    assert len(service.requests) == 4  # three windows and the merge
+
+
+def test_single_window_is_returned_without_a_merge():
+    service = FakeService()
+    result = asyncio.run(ChunkedAnalyzer(service).analyze(pages(3), [1] * 3, "Waves", 1))
+    assert result == "Pages 1-3:\nnotes 1"
+    assert len(service.requests) == 1
+
+
+def test_failed_window_is_noted_and_the_rest_merged():
+    service = FakeService(fail={1})
+    analyzer = ChunkedAnalyzer(service, window_pages=2)
+    assert asyncio.run(analyzer.analyze(pages(3), [1] * 3, "Waves", 1)) == "digest"
+    assert "[Pages not analysed: Error: boom]" in service.requests[-1][0]["content"][0]["text"]
+
+
+def test_all_windows_failing_returns_the_error():
+    service = FakeService(fail={1, 2})
+    analyzer = ChunkedAnalyzer(service, window_pages=2)
+    assert asyncio.run(analyzer.analyze(pages(3), [1] * 3, "Waves", 1)) == "Error: boom"
+
+
+def test_only_chapters_over_the_single_request_limit_are_chunked():
+    analyzer = ChunkedAnalyzer(FakeService(), single_request_pages=100)
+    assert not analyzer.needs_chunking(100)
+    assert analyzer.needs_chunking(101)
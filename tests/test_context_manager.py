@@ -0,0 +1,44 @@
+from context_manager import ContextManager
+
+
+def image_context(url, text="Explain these pages"):
+    return {"role": "user", "content": [{"type": "text", "text": text},
+                                        {"type": "image_url", "image_url": {"url": url}}]}
+
+
+def turn(role, text):
+    return {"role": role, "content": text}
+
+
+def test_only_the_latest_copy_of_an_image_context_is_sent():
+    manager = ContextManager()
+    conversation = [image_context("data:a"), turn("assistant", "ok"), image_context("data:a"), turn("user", "q")]
+    kept = manager.prepare(conversation)
+    assert kept == conversation[1:]
+    assert manager.has_context(conversation, image_context("data:a", "other prompt"))
+    assert not manager.has_context(conversation, image_context("data:b"))
+
+
+def test_oldest_images_are_stripped_before_turns_are_dropped():
+    manager = ContextManager(max_tokens=10**6, max_bytes=1500, keep_recent=2)
+    conversation = [image_context("data:" + "a" * 1000), image_context("data:" + "b" * 1000),
+                    turn("assistant", "answer"), turn("user", "question")]
+    kept = manager.prepare(conversation)
+    assert len(kept) == 4
+    assert "omitted" in kept[0]["content"][-1]["text"]
+    assert kept[1] is conversation[1]
+
+
+def test_oldest_turns_are_dropped_but_recent_ones_kept():
+    manager = ContextManager(max_tokens=10, chars_per_token=1, keep_recent=2)
+    conversation = [turn("user", "x" * 20), turn("assistant", "y" * 20), turn("user", "hi"), turn("assistant", "yo")]
+    kept = manager.prepare(conversation)
+    assert kept == conversation[2:]
+    assert len(conversation) == 4  # The conversation itself is unchanged
+
+
+def test_estimate_counts_text_and_images():
+    manager = ContextManager(tokens_per_image=1000, chars_per_token=4)
+    tokens, size = manager.estimate(image_context("data:" + "a" * 95, "x" * 40))
+    assert tokens == 10 + 1000
+    assert size == 40 + 100
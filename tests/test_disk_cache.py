@@ -0,0 +1,67 @@
+import os
+
+from disk_cache import DiskCache, document_digest, file_digest
+
+
+def disk_bytes(cache):
+    return sum(size for _, size, _ in cache._entries())
+
+
+def age(cache, key, seconds):
+    path = cache._path(key)
+    mtime = os.stat(path).st_mtime - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_overwritten_entry_is_counted_once(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=3000)
+    cache.put(("a",), b"a" * 1000)
+    age(cache, ("a",), 60)
+    for _ in range(10):
+        cache.put(("b",), b"b" * 1000)
+    assert cache._current_bytes == disk_bytes(cache) == 2000
+    # Rewriting one key must not push older entries out
+    assert cache.get(("a",)) == b"a" * 1000
+
+    cache.put(("b",), b"b" * 10)
+    assert cache._current_bytes == disk_bytes(cache) == 1010
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=2500)
+    for n, name in enumerate("abc"):
+        cache.put((name,), b"x" * 1000)
+        age(cache, (name,), 100 - n)
+    assert not cache.contains(("a",))
+    assert cache.contains(("b",)) and cache.contains(("c",))
+    assert cache._current_bytes == disk_bytes(cache) <= 2500
+
+
+def test_eviction_leaves_other_files_in_the_directory_alone(tmp_path):
+    (tmp_path / "thumbnails").mkdir()
+    pack = tmp_path / "thumbnails" / "book.pack"
+    pack.write_bytes(b"p" * 5000)
+    cache = DiskCache(str(tmp_path), max_bytes=1500)
+    cache.put(("a",), b"a" * 1000)
+    cache.put(("b",), b"b" * 1000)
+    assert pack.exists()
+    assert disk_bytes(cache) <= 1500
+
+
+def test_get_counts_hits_and_misses(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    assert cache.get(("missing",)) is None
+    cache.put(("k", 1, {"zoom": 2}), b"data")
+    assert cache.get(("k", 1, {"zoom": 2})) == b"data"
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['bytes_saved']) == (1, 1, 4)
+
+
+def test_document_digest_is_memoised(tmp_path):
+    book = tmp_path / "book.pdf"
+    book.write_bytes(b"%PDF-1.4 pretend")
+    cache = DiskCache(str(tmp_path / "cache"))
+    digest = document_digest(str(book), cache)
+    assert digest == file_digest(str(book))
+    assert document_digest(str(book), cache) == digest
+    assert cache.stats()['hits'] == 0  # memo lookups are not counted
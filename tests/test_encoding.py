@@ -0,0 +1,56 @@
+import pytest
+
+from encoding import EncodedImage, EncodingSettings, encode_image
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def page(width=400, height=300):
+    image = Image.new("RGB", (width, height), "white")
+    for x in range(0, width, 7):
+        for y in range(0, height, 5):
+            image.putpixel((x, y), ((x * 3) % 256, (y * 5) % 256, 90))
+    return image
+
+
+def test_image_budget_takes_the_tighter_limit():
+    settings = EncodingSettings(max_image_bytes=400_000, max_request_bytes=1_000_000)
+    assert settings.image_budget(1) == 400_000
+    assert settings.image_budget(10) == 100_000
+
+
+def test_image_budget_never_floors_to_unlimited():
+    settings = EncodingSettings(max_image_bytes=None, max_request_bytes=10)
+    assert settings.image_budget(1000) == 1
+
+
+def test_image_budget_is_none_only_without_limits():
+    assert EncodingSettings(max_image_bytes=None, max_request_bytes=None).image_budget(5) is None
+
+
+def test_formats_are_validated():
+    with pytest.raises(ValueError):
+        EncodingSettings.from_dict({"formats": []})
+    with pytest.raises(ValueError):
+        EncodingSettings(formats=("gif",))
+
+
+def test_png_is_used_when_no_configured_format_can_be_written(monkeypatch):
+    from PIL import features
+    monkeypatch.setattr(features, "check", lambda name: False)
+    encoded = encode_image(page(), EncodingSettings(formats=("webp",)))
+    assert encoded.mime_type == "image/png"
+
+
+def test_encoding_downscales_to_fit_the_budget():
+    settings = EncodingSettings(formats=("png",), min_scale=0.05)
+    full = encode_image(page(), settings, byte_budget=10**9)
+    small = encode_image(page(), settings, byte_budget=full.size // 4)
+    assert small.size <= full.size // 4
+    assert small.width < full.width
+
+
+def test_encoded_image_round_trip():
+    encoded = EncodedImage(b"data", "image/png", 3, 4, page_num=7)
+    again = EncodedImage.from_bytes(encoded.to_bytes())
+    assert (again.data, again.mime_type, again.width, again.height, again.page_num) == (b"data", "image/png", 3, 4, 7)
@@ -0,0 +1,56 @@
+import threading
+
+from page_cache import PagePrefetcher, RenderCache
+
+
+class Store:
+    """Minimal cache with the interface PagePrefetcher needs (like ThumbnailStore)."""
+
+    def __init__(self):
+        self.entries = {}
+        self.done = threading.Event()
+
+    def contains(self, key):
+        return key in self.entries
+
+    def put(self, key, value, size):
+        self.entries[key] = value
+
+
+def test_render_cache_evicts_least_recently_used_within_budget():
+    cache = RenderCache(max_bytes=100)
+    cache.put("a", 1, 40)
+    cache.put("b", 2, 40)
+    assert cache.get("a") == 1
+    cache.put("c", 3, 40)
+    assert cache.contains("a") and cache.contains("c")
+    assert not cache.contains("b")
+    assert cache.current_bytes == 80
+
+
+def test_render_cache_skips_entries_larger_than_the_budget():
+    cache = RenderCache(max_bytes=10)
+    cache.put("big", 1, 11)
+    assert not cache.contains("big")
+
+
+def test_prefetcher_fills_any_cache_on_its_own_named_thread():
+    store = Store()
+    threads = []
+    keys = [("doc", page, 120) for page in range(3)]
+
+    def render(key):
+        threads.append(threading.current_thread().name)
+        return f"thumb {key[1]}", 1
+
+    def rendered(key):
+        if len(store.entries) == len(keys):
+            store.done.set()
+
+    prefetcher = PagePrefetcher(None, render, rendered, name="thumb-prefetch")
+    prefetcher.cache = store
+    prefetcher.schedule(keys)
+    assert store.done.wait(5)
+    prefetcher.stop()
+    assert store.entries[("doc", 2, 120)] == "thumb 2"
+    assert set(threads) == {"thumb-prefetch"}
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("numpy")
+
+from blob_store import BlobStore
+from context_manager import resolve_repeats
+from encoding import EncodingSettings
+from page_content import PageDeduplicator, _render_encoded, content_parts
+
+WORDS = "energy matrix theorem proof derivative integral cell protein reaction equilibrium vector".split()
+
+
+def same_layout_book(pages, seed=1):
+    """Pages of different random text, all in one layout."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        for line in range(70):
+            page.insert_text((72, 72 + line * 9.6), " ".join(rng.choice(WORDS) for _ in range(14)), fontsize=8)
+    return doc
+
+
+def render(doc, page_num):
+    return _render_encoded(doc, page_num, 1.0, EncodingSettings(formats=("png",)), None)
+
+
+def message(items, store=None):
+    return {"role": "user", "content": [part for item in items for part in content_parts(item, store)]}
+
+
+def test_distinct_pages_in_one_layout_are_not_repeats():
+    doc = same_layout_book(30)
+    images = [render(doc, n) for n in range(len(doc))]
+    # Some of these pages are within a few bits of each other by perceptual hash
+    assert any(a.phash.distance(b.phash) <= 4 for i, a in enumerate(images) for b in images[:i])
+    kept, report = PageDeduplicator().filter(images)
+    assert report['repeated'] == 0
+    assert not any(getattr(item, "repeats", None) for item in kept)
+    assert len(kept) == 30
+
+
+def test_identical_page_is_a_repeat_only_while_the_original_is_sent():
+    doc = same_layout_book(2)
+    dedup = PageDeduplicator()
+    first, _ = dedup.filter([render(doc, 0)])
+    again, report = dedup.filter([render(doc, 1), render(doc, 0)])
+    assert report['repeated'] == 1
+    assert report['repeated_bytes'] == again[1].size
+    assert again[1].repeats
+
+    both = resolve_repeats([message(first), message(again)])
+    assert [part["type"] for part in both[1]["content"]] == ["image_url", "text"]
+    assert "same as page 1" in both[1]["content"][1]["text"]
+
+    # Original trimmed away: the image itself is sent, without the marker
+    alone = resolve_repeats([message(again)])
+    assert [part["type"] for part in alone[0]["content"]] == ["image_url", "image_url"]
+    assert not any("repeat_of" in part for part in alone[0]["content"])
+
+
+def test_repeats_resolve_against_blob_references(tmp_path):
+    doc = same_layout_book(1)
+    store = BlobStore(str(tmp_path))
+    dedup = PageDeduplicator()
+    first, _ = dedup.filter([render(doc, 0)])
+    again, _ = dedup.filter([render(doc, 0)])
+    resolved = resolve_repeats([message(first, store), message(again, store)])
+    assert resolved[1]["content"][0]["type"] == "text"
+
+
+def test_blank_page_is_dropped():
+    doc = fitz.open()
+    doc.new_page()
+    kept, report = PageDeduplicator().filter([render(doc, 0)])
+    assert kept == []
+    assert report['blank'] == 1 and report['bytes_skipped'] > 0
+
+
+def test_messages_without_repeats_pass_through():
+    messages = [{"role": "user", "content": "hello"}]
+    assert resolve_repeats(messages) is messages
@@ -0,0 +1,49 @@
+from retrieval import BM25Index, ContextRetriever, tokenize
+
+
+def test_tokenize_drops_stopwords_and_single_letters():
+    assert tokenize("What is the Entropy of a gas?") == ["entropy", "gas"]
+
+
+def test_bm25_ranks_the_matching_document_first():
+    index = BM25Index()
+    index.add(0, tokenize("entropy always increases in an isolated system"))
+    index.add(1, tokenize("enzymes lower the activation energy of a reaction"))
+    index.add(2, tokenize("the derivative of a constant is zero"))
+    assert [doc for _, doc in index.search(tokenize("enzyme reaction energy"))][0] == 1
+    assert index.search(tokenize("photon")) == []
+    assert len(index.search(tokenize("entropy derivative"), limit=1)) == 1
+
+
+def conversation_about(topic_turn):
+    conversation = []
+    for n in range(20):
+        conversation.append({"role": "user", "content": f"question {n} about filler topic number {n}"})
+        conversation.append({"role": "assistant", "content": f"answer {n} on the filler topic"})
+    conversation[topic_turn] = {"role": "user", "content": "how do enzymes catalyse reactions"}
+    conversation[topic_turn + 1] = {"role": "assistant", "content": "enzymes lower the activation energy"}
+    conversation.append({"role": "user", "content": "remind me what enzymes do to activation energy"})
+    return conversation
+
+
+def test_short_conversations_pass_through():
+    retriever = ContextRetriever(min_messages=24)
+    conversation = [{"role": "user", "content": "hi"}]
+    assert retriever.select(conversation) is conversation
+
+
+def test_relevant_earlier_exchange_is_sent_with_recent_turns():
+    retriever = ContextRetriever(recent_window=4, top_k=1, min_messages=10)
+    conversation = conversation_about(10)
+    selected = retriever.select(conversation)
+    assert selected[-4:] == conversation[-4:]
+    assert conversation[10] in selected and conversation[11] in selected
+    assert len(selected) == 6
+
+
+def test_index_is_rebuilt_when_the_conversation_is_replaced():
+    retriever = ContextRetriever(recent_window=4, top_k=1, min_messages=10)
+    retriever.select(conversation_about(10))
+    other = conversation_about(20)
+    selected = retriever.select(other)
+    assert other[20] in selected and other[10] not in selected
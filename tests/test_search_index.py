@@ -0,0 +1,58 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from search_index import SearchIndex, SearchIndexer, parse_query
+
+PAGES = [
+    "The first law of thermodynamics states that energy is conserved.",
+    "Entropy never decreases. Thermal equilibrium follows.",
+    "Enzymes are proteins; the law of mass action applies to reactions.",
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    doc = fitz.open()
+    for text in PAGES:
+        doc.new_page().insert_text((72, 72), text, fontsize=11)
+    path = str(tmp_path / "book.pdf")
+    doc.save(path)
+    index = SearchIndex("digest", str(tmp_path / "search"))
+    indexer = SearchIndexer(index, path, len(PAGES), batch_pages=2).start()
+    indexer._thread.join(10)
+    return index
+
+
+def test_parse_query():
+    assert parse_query('energy "first law" therm*') == [
+        [("energy", False)], [("first", False), ("law", False)], [("therm", True)]]
+    assert parse_query("  ") == []
+
+
+def test_words_phrases_and_prefixes(index):
+    assert index.is_complete()
+    assert index.search("law").pages == [0, 2]
+    assert index.search('"first law"').pages == [0]
+    assert index.search("therm*").pages == [0, 1]
+    assert index.search("law enzymes").pages == [2]
+    assert index.search("photon").pages == []
+
+
+def test_query_syntax_is_not_interpreted(index):
+    assert index.search('NOT law OR "').pages == []
+    assert index.search("law -").pages == [0, 2]
+
+
+def test_hit_rectangles_cover_each_matched_word(index):
+    result = index.search('"first law"')
+    rects = result.rects(0)
+    assert len(rects) == 2
+    assert all(x1 > x0 and y1 > y0 for x0, y0, x1, y1 in rects)
+    assert result.rects(1) == []
+
+
+def test_index_is_persistent(index, tmp_path):
+    again = SearchIndex("digest", str(tmp_path / "search"))
+    assert again.indexed_pages() == {0, 1, 2}
+    assert again.search("entropy").pages == [1]